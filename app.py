@@ -1,9 +1,34 @@
 import streamlit as st
-import cv2
-import numpy as np
-from PIL import Image
 import time
-import io
+import os
+import tempfile
+import threading
+
+import metrics
+
+# 本次脚本运行的起点（登录页耗时、冷启动指标均从这里计时）
+SCRIPT_START = time.perf_counter()
+
+# --------------------------
+# 0. 延迟导入：numpy 与依赖 OpenCV 的复原/检测模块只在主界面路径上导入，登录/注册页不承担导入开销
+# --------------------------
+def load_main_modules():
+    """
+    导入主界面使用的重量级模块并绑定为模块级名称（登录后、渲染主界面前调用）
+    模块导入后缓存在 sys.modules 中，之后的 rerun 与其他会话只做名称绑定
+    """
+    global np, core, detection, export, jobs, models, routing, segmentation, temporal, video
+    import numpy as np
+
+    import core
+    import detection
+    import export
+    import jobs
+    import models
+    import routing
+    import segmentation
+    import temporal
+    import video
 
 # --------------------------
 # 1. 全局配置与状态初始化
@@ -72,42 +97,390 @@ def register(username: str, password: str, confirm_pwd: str) -> tuple[bool, str]
 # --------------------------
 # 2. 辅助函数：图片处理
 # --------------------------
-def load_image(uploaded_file):
-    """加载上传的图片，返回OpenCV格式和PIL格式"""
-    if uploaded_file is not None:
-        # 读取文件为字节流
-        bytes_data = uploaded_file.getvalue()
-        # 转换为OpenCV格式
-        cv2_img = cv2.imdecode(np.frombuffer(bytes_data, np.uint8), cv2.IMREAD_COLOR)
-        cv2_img = cv2.cvtColor(cv2_img, cv2.COLOR_BGR2RGB)  # 转换为RGB
-        # 转换为PIL格式（Streamlit展示用）
-        pil_img = Image.open(io.BytesIO(bytes_data))
-        return cv2_img, pil_img
-    return None, None
-
-def convert_img_to_bytes(img: Image.Image):
-    """将PIL图片转换为字节流，用于下载"""
-    buf = io.BytesIO()
-    img.save(buf, format="PNG", quality=95)
-    buf.seek(0)
-    return buf
+def convert_img_to_bytes(img, fmt: str, quality: int, png_level: int) -> bytes:
+    """将RGB数组编码为指定格式的字节串，用于下载"""
+    return export.encode_image(np.asarray(img), fmt, quality, png_level)
 
 # --------------------------
-# 3. 模拟模型处理函数（占位，可替换为真实逻辑）
+# 3. 批量结果画廊（复原/检测流水线见 core 模块）
 # --------------------------
-def run_restoration_model(img, model_name):
-    """模拟图像复原模型处理"""
-    st.info(f"🔧 正在使用【{model_name}】进行图像复原...")
-    time.sleep(1)
-    # 这里仅返回原图作为占位，实际可替换为真实复原逻辑
-    return img
-
-def run_detection_model(img):
-    """模拟目标检测模型处理"""
-    st.info(f"🔍 正在进行目标检测...")
-    time.sleep(1)
-    # 这里仅返回原图作为占位，实际可替换为真实检测逻辑（如画框、标注）
-    return img
+# 批量结果画廊每页显示的图片数量与列数
+GALLERY_PAGE_SIZE = 12
+GALLERY_COLUMNS = 4
+# 各显示位置使用的金字塔级别（最长边像素，见 core.PYRAMID_LEVELS）
+GALLERY_DISPLAY_SIDE = 320
+COLUMN_DISPLAY_SIDE = 960
+WIDE_DISPLAY_SIDE = 1600
+
+def render_gallery(entries, page: int):
+    """
+    渲染批量结果画廊的指定页，返回 {上传序号: 占位容器}
+    已完成的图片从结果缓存读取，未完成的显示处理中（后台任务运行期间由轮询重跑刷新）
+    """
+    start = (page - 1) * GALLERY_PAGE_SIZE
+    page_entries = entries[start:start + GALLERY_PAGE_SIZE]
+    cache = core.get_result_cache()
+    slots = {}
+    for row_start in range(0, len(page_entries), GALLERY_COLUMNS):
+        cols = st.columns(GALLERY_COLUMNS)
+        for col, entry in zip(cols, page_entries[row_start:row_start + GALLERY_COLUMNS]):
+            with col:
+                slots[entry["index"]] = st.empty()
+    for entry in page_entries:
+        arr = cache.get(entry["key"]) if entry["ok"] else None
+        if arr is not None:
+            arr = core.display_level(entry["key"], arr, GALLERY_DISPLAY_SIDE)
+        fill_gallery_slot(slots[entry["index"]], entry, arr)
+    return slots
+
+def route_label(entry, batch_model: str) -> str:
+    """条目实际使用的模型：“自动”模式下附带路由结果与置信度"""
+    if entry.get("confidence") is None:
+        return batch_model
+    return f"{routing.AUTO_MODEL}→{entry['model']} {entry['confidence']:.0%}"
+
+def fill_gallery_slot(slot, entry, arr):
+    """填充画廊中单张图片的占位容器"""
+    caption = f"{entry['index']}. {entry['name']}"
+    if entry.get("confidence") is not None:
+        caption += f" · {entry['model']} {entry['confidence']:.0%}"
+    if arr is not None:
+        slot.image(arr, caption=caption, use_column_width=True)
+    elif not entry["done"]:
+        slot.info(f"⏳ {caption}：处理中...")
+    elif entry["ok"]:
+        slot.warning(f"⚠️ {caption}：结果已被缓存淘汰，请重新运行")
+    elif entry.get("state") == jobs.CANCELLED:
+        slot.warning(f"⏹️ {caption}：已取消")
+    elif entry.get("state") == jobs.FAILED:
+        slot.error(f"❌ {caption}：复原失败")
+    else:
+        slot.error(f"❌ {caption}：图片解码失败")
+
+# --------------------------
+# 3.1 视频流复原（设备拍摄）
+# --------------------------
+# 支持上传的视频格式
+VIDEO_TYPES = ("mp4", "avi", "mov", "mkv")
+
+def resolve_video_model(model_name: str, source):
+    """
+    “自动”模式下按视频首帧判断天气类型，返回 (模型名称, 置信度)；指定模型时置信度为 None
+    整段视频使用同一个模型，避免逐帧切换模型导致画面闪烁
+    """
+    if model_name != routing.AUTO_MODEL:
+        return model_name, None
+    capture = video.open_capture(source)
+    try:
+        frame = next(video.iter_frames(capture, max_frames=1), None)
+    finally:
+        capture.release()
+    if frame is None:
+        raise IOError(f"无法读取视频首帧：{source}")
+    routed_model, confidence, _ = routing.classify(frame)
+    return routed_model, confidence
+
+def make_frame_fn(model_name, overlay_task=None, task_options=None, incremental=None):
+    """
+    构造逐帧处理函数：复原，可选叠加下游任务结果（模型均取自常驻模型池）
+    incremental 为 temporal.IncrementalRestorer 实例时，改用其增量复原（每个视频流单独一个实例）
+    """
+    if incremental is not None:
+        restore = incremental
+    else:
+        restorer = models.get_pool().get(model_name)
+        restore = lambda rgb: restorer(rgb, core.TILE_MEMORY_BUDGET)
+    if overlay_task is None:
+        return restore
+    # 先加载任务模型，权重缺失时在开始读取视频前报错
+    models.get_pool().get(overlay_task)
+    task_options = task_options or {}
+
+    def frame_fn(rgb):
+        restored = restore(rgb)
+        raw = core.run_task_model(overlay_task, restored)
+        # 复原结果是本帧新建的数组时直接在其上绘制，不再复制
+        out = restored if restored.flags.writeable else None
+        return core.render_task(overlay_task, restored, raw, out=out, **task_options)
+    return frame_fn
+
+def save_upload_to_temp(uploaded_file) -> str:
+    """cv2.VideoCapture 只能读取文件路径，将上传的视频写入临时文件"""
+    suffix = os.path.splitext(uploaded_file.name)[1] or ".mp4"
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
+        f.write(uploaded_file.getbuffer())
+        return f.name
+
+def render_download(label: str, result_key: str, get_rgb, file_name: str, key: str, export_cfg: dict):
+    """
+    懒编码下载按钮：结果尚未编码时先显示“准备下载”按钮，点击后才编码
+    编码后的字节按 结果键+导出参数 写入结果缓存，后续rerun直接复用，不再重复编码
+    """
+    fmt = export_cfg["format"]
+    encoded_key = core.make_result_key(result_key, "encode", fmt,
+                                  quality=export_cfg["quality"], png_level=export_cfg["png_level"])
+    cache = core.get_result_cache()
+    encoded = cache.get(encoded_key, record=False)
+    if encoded is None:
+        if not st.button(f"📦 准备下载（{fmt}）", type="secondary", use_container_width=True, key=f"{key}_prepare"):
+            return
+        data = convert_img_to_bytes(get_rgb(), fmt, export_cfg["quality"], export_cfg["png_level"])
+        encoded = cache.put(encoded_key, np.frombuffer(data, np.uint8))
+    st.download_button(
+        label=label,
+        data=encoded.tobytes(),
+        file_name=export.export_file_name(file_name, fmt),
+        mime=export.MIME_TYPES[fmt],
+        use_container_width=True,
+        key=key
+    )
+
+# --------------------------
+# 3.2 后台任务（复原/检测不在脚本线程中执行，见 jobs 模块）
+# --------------------------
+# 存在进行中的任务时，界面自动刷新的间隔（秒）
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 1.0))
+# 质量表中各指标列的名称（与 quality.METRIC_NAMES 顺序一致）
+QUALITY_COLUMNS = ("PSNR(dB)", "SSIM", "清晰度", "雾浓度")
+# 各下游任务结果区标题，按任务的阶段名（core.TASK_HEADS 中的 metric_stage，同时作为后台任务种类）索引
+TASK_TITLES = {"detect": "🎯 目标检测结果", "segment": "🎨 场景分割结果"}
+# 冷启动指标的显示名称（见 metrics.mark_startup）
+STARTUP_LABELS = {"first_login_page_seconds": "首个登录页", "first_result_seconds": "首个结果",
+                  "warm_up_seconds": "预热"}
+
+def task_job_kind(task: str) -> str:
+    """下游任务对应的后台任务种类（检测为 detect，分割为 segment）"""
+    return core.TASK_HEADS[task].metric_stage
+
+def make_restore_job(files, model_name: str):
+    """批量复原任务：结果条目在运行过程中逐张更新，界面轮询时即可显示已完成的部分"""
+    def run(job):
+        entries = job.payload["entries"]
+        core.restore_batch(files, model_name, entries=entries, on_result=lambda entry, arr: job.advance(),
+                           cancel_event=job.cancel_event, pyramid=True)
+        return entries
+    return run
+
+def make_task_job(files, model_name: str, task: str):
+    """
+    下游任务（目标检测/场景分割）：经阶段图复原（命中缓存则直接复用）后推理，
+    场景分割对全部图片分批推理；返回只含缓存键的结果句柄
+    """
+    def run(job):
+        entries = core.task_batch(files, model_name, task, on_result=lambda entry, restored, raw: job.advance(),
+                                  cancel_event=job.cancel_event)
+        items = [{"name": entry["name"], "restored_key": entry["key"], "raw_key": entry["raw_key"]}
+                 for entry in entries if entry.get("raw_key")]
+        if not items and not job.cancelled:
+            raise ValueError("图片解码失败")
+        return {"task": task, "items": items}
+    return run
+
+def task_summary(task: str, raw, options: dict) -> str:
+    """结果标题中的摘要：检测为目标数，分割为占比最高的几个类别"""
+    if task == core.DETECTION_MODEL:
+        dets = detection.filter_detections(raw, options["conf_threshold"], options["iou_threshold"])
+        return f"{len(dets)} 个目标"
+    top = list(segmentation.class_histogram(raw).items())[:3]
+    return "主要类别 " + " · ".join(f"{name} {ratio:.0%}" for name, ratio in top)
+
+def make_evaluate_job(entries, model_name: str, references: dict):
+    """质量评估任务：对批量复原结果并行计算指标，返回质量表的行"""
+    def run(job):
+        scores = core.evaluate_batch(entries, references)
+        rows = []
+        for entry, score in zip(entries, scores):
+            if score is None:
+                continue
+            confidence = entry.get("confidence")
+            row = {"图片": entry["name"], "模型": model_name, "实际模型": entry.get("model"),
+                   "路由置信度": round(confidence, 3) if confidence is not None else None}
+            for name, value in zip(QUALITY_COLUMNS, score):
+                row[name] = None if np.isnan(value) else round(float(value), 4)
+            row["复原耗时(ms)"] = round(entry["seconds"] * 1000, 1) if entry["seconds"] is not None else None
+            rows.append(row)
+        return rows
+    return run
+
+def make_video_job(source, output_path: str, name: str, model_name: str, overlay_task, task_options: dict,
+                   incremental_restore: bool, max_frames: int = None, temp_source: bool = False):
+    """
+    视频流复原任务：每写出一帧调用一次 job.advance()，取消时各阶段在下一帧停止
+    输出视频由 collect_jobs 放入 session_state，之后由下次运行替换时删除；失败或取消时删除写了一半的输出，
+    temp_source 为 True（上传视频的临时副本）时任务结束即删除源文件
+    """
+    def run(job):
+        handed_off = False
+        try:
+            video_model, confidence = resolve_video_model(model_name, source)
+            job.total = max_frames or video.frame_count(source)
+            incremental = temporal.IncrementalRestorer(video_model) if incremental_restore else None
+            frame_fn = make_frame_fn(video_model, overlay_task, task_options, incremental)
+            stats = video.process_stream(source, output_path, frame_fn, max_frames=max_frames,
+                                         on_progress=lambda s: job.advance(), stop_event=job.cancel_event)
+            if job.cancelled:
+                return None
+            handed_off = True
+            return {
+                "path": output_path,
+                "name": name,
+                "stats": stats.as_dict(),
+                "model": video_model,
+                "confidence": confidence,
+                "incremental": incremental.stats() if incremental is not None else None,
+            }
+        finally:
+            if not handed_off and os.path.exists(output_path):
+                os.remove(output_path)
+            if temp_source and os.path.exists(source):
+                os.remove(source)
+    return run
+
+def submit_job(kind: str, fn, label: str, total: int = 0, payload: dict = None):
+    """提交任务并把任务ID记录到 session_state（同类旧任务先取消），达到并发上限时提示并返回None"""
+    manager = jobs.get_job_manager()
+    session_jobs = st.session_state.setdefault("jobs", {})
+    if kind in session_jobs:
+        manager.cancel(session_jobs.pop(kind))
+    try:
+        job = manager.submit(st.session_state["username"], kind, fn, label=label, total=total, payload=payload)
+    except jobs.JobLimitExceeded as e:
+        st.warning(f"⚠️ {e}")
+        return None
+    session_jobs[kind] = job.id
+    return job
+
+def render_job_progress(job):
+    """进行中任务的进度条与取消按钮"""
+    col1, col2 = st.columns([8, 2])
+    with col1:
+        if job.status == jobs.QUEUED:
+            state = "排队中"
+        elif job.cancelled:
+            state = "正在取消"
+        elif job.total:
+            state = f"{job.done}/{job.total}"
+        else:
+            state = "运行中"
+        st.progress(job.progress, text=f"⏳ {job.label}：{state} · {job.elapsed:.1f}s")
+    with col2:
+        if st.button("⏹️ 取消", type="secondary", use_container_width=True, key=f"cancel_{job.id}",
+                     disabled=job.cancelled):
+            jobs.get_job_manager().cancel(job.id)
+            st.rerun()
+
+def collect_jobs() -> bool:
+    """
+    每次rerun调用：显示本会话进行中任务的进度，取回已结束任务的结果，返回是否仍有进行中的任务
+    复原任务的结果条目在提交时已放入 session_state，这里只需处理下游任务结果句柄与结束提示
+    """
+    manager = jobs.get_job_manager()
+    session_jobs = st.session_state.setdefault("jobs", {})
+    pending = False
+    for kind, job_id in list(session_jobs.items()):
+        job = manager.get(job_id)
+        if job is None:
+            del session_jobs[kind]
+            continue
+        if job.active:
+            render_job_progress(job)
+            pending = True
+            continue
+        del session_jobs[kind]
+        if kind == "restore" and job.status in (jobs.FAILED, jobs.CANCELLED):
+            # 未处理到的图片不再显示“处理中”（轮询已停止），而是显示已取消/失败
+            core.mark_unfinished(job.payload["entries"], job.status)
+        if kind == "video" and job.status != jobs.DONE:
+            # 排队中即被取消的任务从未运行，其临时文件在这里删除（运行过的任务已自行删除）
+            for path in job.payload["temp_paths"]:
+                if os.path.exists(path):
+                    os.remove(path)
+        if job.status == jobs.FAILED:
+            st.error(f"❌ {job.label}失败：{job.error}")
+        elif job.status == jobs.CANCELLED:
+            st.warning(f"⏹️ {job.label}已取消" + (f"（已完成 {job.done}/{job.total}）" if job.total else ""))
+        elif kind == "restore":
+            n_ok = sum(entry["ok"] for entry in job.result)
+            st.success(f"✅ {job.label}完成！共复原 {n_ok}/{len(job.result)} 张图片（{job.elapsed:.1f}s）")
+        elif kind in TASK_TITLES:
+            st.session_state.setdefault("task_handles", {})[job.result["task"]] = job.result
+            st.session_state["task_item"] = 0
+            st.success(f"✅ {job.label}完成！共处理 {len(job.result['items'])} 张图片（{job.elapsed:.1f}s）")
+        elif kind == "evaluate":
+            # 同一图片+模型的旧结果被新结果替换，不同模型的结果累积在同一张表中便于比较
+            rows = {(row["图片"], row["模型"]): row for row in st.session_state.get("quality_rows", [])}
+            rows.update({(row["图片"], row["模型"]): row for row in job.result})
+            st.session_state["quality_rows"] = list(rows.values())
+            st.success(f"✅ {job.label}完成！共评估 {len(job.result)} 张图片")
+        elif kind == "video":
+            previous = st.session_state.get("video_result")
+            if previous is not None and os.path.exists(previous["path"]):
+                os.remove(previous["path"])
+            st.session_state["video_result"] = job.result
+            st.success(f"✅ {job.label}完成！共处理 {job.result['stats']['frames']} 帧（{job.elapsed:.1f}s）")
+    return pending
+
+def render_quality_tables(rows):
+    """逐图质量表（点击表头排序）与按模型汇总表（平均指标与平均复原耗时）"""
+    st.dataframe(rows, hide_index=True, use_container_width=True)
+    by_model = {}
+    for row in rows:
+        by_model.setdefault(row["模型"], []).append(row)
+    summary = []
+    for model_name, model_rows in by_model.items():
+        item = {"模型": model_name, "图片数": len(model_rows)}
+        for column in QUALITY_COLUMNS + ("复原耗时(ms)",):
+            values = [row[column] for row in model_rows if row[column] is not None]
+            item[f"平均{column}"] = round(float(np.mean(values)), 4) if values else None
+        summary.append(item)
+    st.caption("按模型汇总（复原耗时为空表示结果来自缓存）")
+    st.dataframe(summary, hide_index=True, use_container_width=True)
+
+# --------------------------
+# 3.3 性能指标（仅管理员可见，指标采集见 metrics 模块）
+# --------------------------
+def render_metrics_panel():
+    """各阶段耗时分布、内存高水位、缓存命中率，以及按次开启的 cProfile 记录"""
+    registry = metrics.get_registry()
+    rows = [
+        {
+            "阶段": item["stage"],
+            "模型": item["model"],
+            "次数": item["count"],
+            "平均(ms)": round(item["mean_seconds"] * 1000, 1),
+            "p50(ms)": round(item["p50_seconds"] * 1000, 1),
+            "p95(ms)": round(item["p95_seconds"] * 1000, 1),
+            "最大(ms)": round(item["max_seconds"] * 1000, 1),
+            "数据量(MB)": round(item["nbytes"] / 1024 / 1024, 1),
+        }
+        for item in registry.stages()
+    ]
+    if rows:
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+    else:
+        st.caption("暂无记录")
+
+    gauges = registry.gauges()
+    memory = gauges["process"]
+    to_mb = lambda value: f"{value / 1024 / 1024:.0f} MB" if value is not None else "未知"
+    st.caption(f"进程 {os.getpid()} · 常驻内存 {to_mb(memory['rss_bytes'])} · 高水位 {to_mb(memory['peak_rss_bytes'])}")
+    if "result_cache" in gauges:
+        st.caption(f"结果缓存命中率 {gauges['result_cache']['hit_rate']:.0%}")
+    if gauges.get("startup"):
+        st.caption("冷启动：" + " · ".join(f"{STARTUP_LABELS.get(key, key)} {value:.2f}s"
+                                         for key, value in gauges["startup"].items()))
+    if INFERENCE_HTTP_PORT:
+        st.caption(f"指标接口：http://{INFERENCE_HTTP_HOST}:{INFERENCE_HTTP_PORT}/metrics")
+
+    st.checkbox(
+        "记录 cProfile（本会话每次运行）", key="profile_runs",
+        help=f"结果保存为 .prof（可用 snakeviz 查看），目录 {metrics.PROFILE_DIR}；"
+             f"采样分析可用 py-spy 附加到进程：py-spy record --pid {os.getpid()}"
+    )
+    last_profile = st.session_state.get("last_profile")
+    if last_profile is not None:
+        st.caption(f"上次运行：{last_profile['path']}")
+        st.code(last_profile["summary"], language="text")
 
 # --------------------------
 # 4. 自定义样式：统一按钮样式+对齐布局
@@ -231,26 +604,27 @@ def render_auth_page():
                 st.error(f"❌ {msg}")
 
 # --------------------------
-# 6. 主应用页面（双画面固定显示前两张上传图）
+# 6. 主应用页面（双画面固定显示前两张上传图，批量画廊显示全部）
 # --------------------------
-def render_main_app():
+def render_main_app() -> bool:
+    """渲染主界面，返回是否仍有进行中的后台任务（由程序入口在记录本次运行耗时后轮询重跑）"""
     st.set_page_config(
         page_title="🌨️ 基于频域感知的恶劣天气图像复原系统",
         layout="wide",
         initial_sidebar_state="expanded"
     )
     
-    # 初始化图片状态（用于查看/下载）
-    if "restored_img" not in st.session_state:
-        st.session_state["restored_img"] = None
+    # 初始化图片状态（用于查看/下载）：只保存结果缓存中的键，图像本身在全部会话共享的结果缓存中
+    if "restored_key" not in st.session_state:
+        st.session_state["restored_key"] = None
         st.session_state["restored_img_name"] = ""
-    if "detected_img" not in st.session_state:
-        st.session_state["detected_img"] = None
+    if "detected_key" not in st.session_state:
+        st.session_state["detected_key"] = None
         st.session_state["detected_img_name"] = ""
     if "show_preview" not in st.session_state:
         st.session_state["show_preview"] = False
-    if "preview_img" not in st.session_state:
-        st.session_state["preview_img"] = None
+    if "preview_key" not in st.session_state:
+        st.session_state["preview_key"] = None
 
     # 应用自定义样式
     set_custom_style()
@@ -269,12 +643,30 @@ def render_main_app():
         st.markdown("---")
         st.subheader("输入配置")
         input_mode = st.selectbox("选择输入", options=["本地文件", "设备拍摄"], index=0)
-        
+
+        # 设备拍摄：上传行车记录仪视频，或直接读取服务器本机摄像头
+        video_file = None
+        camera_index = None
+        video_max_frames = None
+        if input_mode == "设备拍摄":
+            video_source = st.radio("视频来源", ["上传视频", "本机摄像头"], horizontal=True)
+            if video_source == "上传视频":
+                video_file = st.file_uploader("上传视频", type=list(VIDEO_TYPES))
+            else:
+                camera_index = int(st.number_input("摄像头编号", min_value=0, max_value=16, value=0, step=1))
+                video_max_frames = int(st.number_input("录制帧数", min_value=1, max_value=100000, value=300, step=50))
+
         # 支持上传多张图片（重点：至少2张用于双画面）
         uploaded_files = st.file_uploader(
             "上传退化图像",
             type=["jpg", "png", "jpeg"],
-            help="支持 JPG/PNG 格式，单文件最大 200MB，双画面模式下前两张分别显示在左右侧",
+            help="支持 JPG/PNG 格式，单文件最大 200MB，双画面模式下前两张分别显示在左右侧，全部图片在批量画廊中分页显示",
+            accept_multiple_files=True
+        )
+        reference_files = st.file_uploader(
+            "上传清晰参考图（可选）",
+            type=["jpg", "png", "jpeg"],
+            help="与退化图同名（不含扩展名）的清晰图像，用于计算 PSNR/SSIM；未提供时只计算无参考指标",
             accept_multiple_files=True
         )
 
@@ -283,19 +675,79 @@ def render_main_app():
         st.subheader("复原模型选择")
         restoration_model = st.selectbox(
             "选择图像复原算法",
-            options=["去雨模型", "去雾模型", "去雪模型"],
+            options=core.restoration_choices(),
             index=0,
-            help="不同模型适配不同类型的恶劣天气图像复原"
+            help="不同模型适配不同类型的恶劣天气图像复原；“自动”按每张图片的天气类型只运行对应的一个模型"
+        )
+        incremental_restore = st.checkbox(
+            "增量复原（固定机位视频）",
+            value=False,
+            help="仅对视频流生效：只重新复原相邻帧间发生变化的区域，并周期性全量刷新"
         )
 
         st.markdown("---")
         st.subheader("下游任务")
         downstream_task = st.selectbox(
             "选择任务",
-            options=["目标检测", "场景分割"],
+            options=models.model_names(models.DETECTION) + models.model_names(models.SEGMENTATION),
             index=0,
             help="选择图像复原后的下游处理任务"
         )
+        segment_opacity = segmentation.DEFAULT_OPACITY
+        if downstream_task == core.SEGMENTATION_MODEL:
+            segment_opacity = st.slider("分割叠加不透明度", 0.0, 1.0, segmentation.DEFAULT_OPACITY, 0.05,
+                                        help="只重新混合缓存的类别图，不重新推理")
+
+        # 导出格式：仅在点击下载时编码
+        st.markdown("---")
+        st.subheader("导出设置")
+        export_format = st.selectbox("导出格式", options=list(export.FORMATS), index=0)
+        export_quality = export.DEFAULT_QUALITY
+        export_png_level = export.DEFAULT_PNG_LEVEL
+        if export_format in (export.JPEG, export.WEBP):
+            export_quality = st.slider("编码质量", 50, 100, export.DEFAULT_QUALITY, 1)
+        elif export_format == export.PNG:
+            export_png_level = st.slider("PNG压缩级别", 0, 9, export.DEFAULT_PNG_LEVEL, 1,
+                                         help="级别越高文件越小，但编码越慢")
+        export_cfg = {"format": export_format, "quality": export_quality, "png_level": export_png_level}
+
+        # 结果缓存命中情况
+        st.markdown("---")
+        st.subheader("缓存状态")
+        cache_stats = core.get_result_cache().stats()
+        cache_col1, cache_col2 = st.columns(2)
+        cache_col1.metric("命中", cache_stats["hits"] + cache_stats["disk_hits"])
+        cache_col2.metric("未命中", cache_stats["misses"])
+        st.caption(
+            f"命中率 {cache_stats['hit_rate']:.0%} · 磁盘命中 {cache_stats['disk_hits']} · "
+            f"溢出到磁盘 {cache_stats['spills']} · "
+            f"内存 {cache_stats['entries']} 项 / {cache_stats['bytes'] / 1024 / 1024:.1f} MB"
+        )
+
+        # 常驻模型池：每个已加载模型的加载耗时与常驻大小；管理员可卸载模型
+        # （释放内存，或替换磁盘上的 ONNX 权重后使下次使用时重新加载）
+        with st.expander("常驻模型", expanded=False):
+            model_stats = models.get_pool().stats()
+            is_admin = st.session_state.get("user_role") == "admin"
+            if model_stats:
+                for item in model_stats:
+                    caption = (f"{item['name']}：加载 {item['load_seconds'] * 1000:.0f} ms · "
+                               f"常驻 {item['nbytes'] / 1024 / 1024:.1f} MB · 使用 {item['uses']} 次")
+                    if not is_admin:
+                        st.caption(caption)
+                        continue
+                    model_col1, model_col2 = st.columns([7, 3])
+                    model_col1.caption(caption)
+                    if model_col2.button("卸载", type="secondary", key=f"evict_{item['name']}"):
+                        models.get_pool().evict(item["name"])
+                        st.rerun()
+            else:
+                st.caption("尚未加载任何模型")
+
+        # 性能指标：仅管理员可见
+        if st.session_state.get("user_role") == "admin":
+            with st.expander("📊 性能指标", expanded=False):
+                render_metrics_panel()
 
     # --------------------------
     # 主界面核心逻辑
@@ -303,15 +755,43 @@ def render_main_app():
     st.title("🌨️ 基于频域感知的恶劣天气图像复原系统")
     st.markdown("---")
 
+    # 后台任务：显示进行中任务的进度，取回已完成任务的结果
+    jobs_pending = collect_jobs()
+
+    # 已有任务结果时，按当前结果中出现的类别填充目标过滤选项（仅读缓存，不触发推理）
+    task_handles = st.session_state.get("task_handles", {})
+    task_handle = task_handles.get(downstream_task)
+    task_item = None
+    task_raw = None
+    if task_handle is not None and task_handle["items"]:
+        items = task_handle["items"]
+        task_item = items[min(st.session_state.get("task_item", 0), len(items) - 1)]
+        task_raw = core.task_raw_lookup(downstream_task, task_item["raw_key"])
+    target_options = ["全部目标"]
+    if task_raw is not None:
+        if downstream_task == core.DETECTION_MODEL:
+            current_dets = detection.filter_detections(task_raw, conf_threshold, iou_threshold)
+            target_options += detection.detected_classes(current_dets)
+        else:
+            target_options += sorted(segmentation.class_histogram(task_raw))
+
     # 控制面板：调整列宽，确保按钮和下拉框垂直对齐
     col1, col2, col3 = st.columns([1, 1.2, 1.8])
     with col1:
         display_mode = st.radio("显示模式", ["单画面", "双画面"], horizontal=True, index=1)
     with col2:
-        target_filter = st.selectbox("目标过滤", ["全部目标"], index=0)
+        target_filter = st.selectbox("目标过滤", target_options, index=0)
     with col3:
         restore_run_btn = st.button("▶️ 运行复原模型", use_container_width=True)
 
+    # 下游任务的显示参数：只作用于缓存的原始输出，调整时不重新推理
+    if downstream_task == core.DETECTION_MODEL:
+        task_options = {"conf_threshold": conf_threshold, "iou_threshold": iou_threshold,
+                        "class_filter": None if target_filter == "全部目标" else target_filter}
+    else:
+        task_options = {"opacity": segment_opacity,
+                        "class_filter": None if target_filter == "全部目标" else target_filter}
+
     # 复原画面区
     st.markdown("### 复原画面")
     restore_placeholder = st.empty()
@@ -322,193 +802,342 @@ def render_main_app():
         \n📌 下游任务可选择目标检测/场景分割，点击对应按钮执行
         """)
 
-    # 下游任务结果区
-    if downstream_task == "目标检测":
-        # 目标检测标题 + 独立运行按钮
-        det_col1, det_col2 = st.columns([8, 2])
-        with det_col1:
-            st.markdown("### 🎯 目标检测结果")
-        with det_col2:
-            detect_run_btn = st.button("▶️ 运行目标检测", use_container_width=True)
-        detect_placeholder = st.empty()
-    else:
-        st.markdown("### 🎨 场景分割结果")
-        detect_placeholder = st.empty()
-        detect_run_btn = None
-
-    # --------------------------
-    # 核心功能1：运行复原模型（双画面固定显示前两张上传图）
-    # --------------------------
+    # 提交复原任务：结果条目立即放入 session_state，任务运行期间画廊与复原画面逐张显示已完成的图片
     if restore_run_btn:
-        # 检查是否上传了图片
         if not uploaded_files:
             st.error("❌ 请先上传图片！")
         else:
-            restore_placeholder.empty()
-            
-            # 加载所有上传的图片（仅取前2张）
-            img_list = []
-            for idx, file in enumerate(uploaded_files[:2]):  # 仅处理前2张
-                cv2_img, pil_img = load_image(file)
-                if cv2_img is not None:
-                    # 可选：对图片运行复原模型（保留模型功能）
-                    restored_img = run_restoration_model(pil_img, restoration_model)
-                    img_list.append({
-                        "name": file.name,
-                        "original": pil_img,
-                        "restored": restored_img,
-                        "index": idx + 1  # 图片序号（1/2）
-                    })
-            
-            # 单画面模式：显示第一张图片（复原后）
-            if display_mode == "单画面":
-                if img_list:
-                    with restore_placeholder.container():
-                        st.subheader(f"📷 第1张图像（{restoration_model}复原后）")
-                        st.image(img_list[0]["restored"], caption=img_list[0]["name"], use_column_width=True)
-                        # 保存复原后的图片状态
-                        st.session_state["restored_img"] = img_list[0]["restored"]
+            entries = core.make_batch_entries(uploaded_files)
+            job = submit_job(
+                "restore", make_restore_job(list(uploaded_files), restoration_model),
+                label=f"{restoration_model}复原", total=len(entries),
+                payload={"entries": entries, "model": restoration_model},
+            )
+            if job is not None:
+                st.session_state["batch_entries"] = entries
+                st.session_state["batch_model"] = restoration_model
+                jobs_pending = True
+
+    # 批量结果画廊区（全部上传图片，分页显示，任务运行期间每次轮询刷新已完成的图片）
+    batch_entries = st.session_state.get("batch_entries")
+    if batch_entries:
+        st.markdown(f"### 🗂️ 批量复原结果（共 {len(batch_entries)} 张）")
+        routed = [entry["model"] for entry in batch_entries if entry.get("confidence") is not None]
+        if routed:
+            st.caption("自动路由：" + " · ".join(
+                f"{name} {routed.count(name)} 张" for name in models.model_names(models.RESTORATION)
+                if name in routed
+            ))
+        n_pages = (len(batch_entries) + GALLERY_PAGE_SIZE - 1) // GALLERY_PAGE_SIZE
+        if st.session_state.get("gallery_page", 1) > n_pages:
+            st.session_state["gallery_page"] = 1
+        gallery_page = st.number_input("页码", min_value=1, max_value=n_pages, step=1, key="gallery_page")
+        render_gallery(batch_entries, int(gallery_page))
+
+    # 质量评估区：对当前批量结果计算指标，不同模型的结果累积在同一张表中
+    if batch_entries and "batch_model" in st.session_state:
+        quality_col1, quality_col2 = st.columns([8, 2])
+        with quality_col1:
+            st.markdown("### 📏 复原质量评估")
+        with quality_col2:
+            evaluate_run_btn = st.button("▶️ 评估复原质量", use_container_width=True)
+        if evaluate_run_btn:
+            references = {}
+            if reference_files:
+                reference_bytes = {os.path.splitext(f.name)[0]: f.getvalue() for f in reference_files}
+                for entry in batch_entries:
+                    stem = os.path.splitext(entry["name"])[0]
+                    if stem in reference_bytes:
+                        references[entry["name"]] = reference_bytes[stem]
+            job = submit_job(
+                "evaluate", make_evaluate_job(batch_entries, st.session_state["batch_model"], references),
+                label=f"{st.session_state['batch_model']}质量评估",
+            )
+            jobs_pending = jobs_pending or job is not None
+        quality_rows = st.session_state.get("quality_rows")
+        if quality_rows:
+            render_quality_tables(quality_rows)
+            if st.button("🧹 清空评估结果", type="secondary", key="clear_quality"):
+                st.session_state["quality_rows"] = []
+                st.rerun()
+        else:
+            st.caption("上传同名清晰参考图可计算 PSNR/SSIM；清晰度越高、雾浓度越低越好")
+
+    # 视频流复原区（设备拍摄模式）
+    if input_mode == "设备拍摄":
+        video_col1, video_col2 = st.columns([8, 2])
+        with video_col1:
+            st.markdown("### 🎬 视频流复原")
+            video_with_overlay = st.checkbox(f"叠加{downstream_task}结果", value=False)
+        with video_col2:
+            video_run_btn = st.button("▶️ 运行视频复原", use_container_width=True)
+        video_status = st.empty()
+
+        if video_run_btn:
+            if video_file is None and camera_index is None:
+                st.error("❌ 请先上传视频！")
+            else:
+                # 视频复原作为后台任务运行：进度与取消按钮由 collect_jobs 显示，结果在任务结束后放入 session_state
+                source = save_upload_to_temp(video_file) if video_file is not None else camera_index
+                output_path = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False).name
+                temp_paths = [output_path] + ([source] if video_file is not None else [])
+                job = submit_job(
+                    "video",
+                    make_video_job(
+                        source, output_path,
+                        video_file.name if video_file is not None else f"camera_{camera_index}.mp4",
+                        restoration_model, downstream_task if video_with_overlay else None, task_options,
+                        incremental_restore, max_frames=video_max_frames, temp_source=video_file is not None,
+                    ),
+                    label=f"{restoration_model}视频复原", total=video_max_frames or 0,
+                    payload={"temp_paths": temp_paths},
+                )
+                if job is None:
+                    for path in temp_paths:
+                        os.remove(path)
+                jobs_pending = jobs_pending or job is not None
+
+        video_result = st.session_state.get("video_result")
+        if video_result is not None and os.path.exists(video_result["path"]):
+            video_stats = video_result["stats"]
+            video_status.success(
+                f"✅ 共 {video_stats['frames']} 帧 · 持续 {video_stats['fps']:.1f} FPS"
+                f"（解码 {video_stats['decode_seconds']:.1f}s / 处理 {video_stats['process_seconds']:.1f}s / "
+                f"编码 {video_stats['encode_seconds']:.1f}s）"
+            )
+            if video_result["confidence"] is not None:
+                st.caption(f"自动路由（按首帧）：{video_result['model']} · 置信度 {video_result['confidence']:.0%}")
+            if video_result["incremental"] is not None:
+                inc_stats = video_result["incremental"]
+                st.caption(
+                    f"增量复原：重新复原 {inc_stats['restored_ratio']:.0%} 的画面块 · "
+                    f"全量刷新 {inc_stats['full_refreshes']} 次"
+                )
+            st.video(video_result["path"])
+            with open(video_result["path"], "rb") as f:
+                st.download_button(
+                    label="💾 下载复原视频",
+                    data=f,
+                    file_name=f"复原_{os.path.splitext(video_result['name'])[0]}.mp4",
+                    mime="video/mp4",
+                    use_container_width=True,
+                    key="download_video"
+                )
+
+    # 下游任务结果区（目标检测与场景分割由同一阶段图驱动）
+    task_col1, task_col2 = st.columns([8, 2])
+    with task_col1:
+        st.markdown(f"### {TASK_TITLES[task_job_kind(downstream_task)]}")
+    with task_col2:
+        task_run_btn = st.button(f"▶️ 运行{downstream_task}", use_container_width=True)
+    task_placeholder = st.empty()
+
+    # --------------------------
+    # 核心功能1：复原画面（复原任务见上方提交逻辑）
+    # --------------------------
+    # 复原画面：每次rerun从结果缓存读取前两张成功复原的图片（查看/下载按钮跨rerun可用）
+    if batch_entries and "batch_model" in st.session_state:
+        batch_model = st.session_state["batch_model"]
+        img_list = []
+        result_cache = core.get_result_cache()
+        for entry in batch_entries:
+            if len(img_list) >= 2:
+                break
+            arr = result_cache.get(entry["key"]) if entry["ok"] else None
+            if arr is not None:
+                img_list.append({
+                    "name": entry["name"],
+                    "key": entry["key"],
+                    "restored": arr,
+                    "index": entry["index"],
+                    "label": route_label(entry, batch_model)
+                })
+
+        # 单画面模式：显示第一张图片（复原后）
+        if display_mode == "单画面":
+            if img_list:
+                with restore_placeholder.container():
+                    st.subheader(f"📷 第1张图像（{img_list[0]['label']}复原后）")
+                    st.image(core.display_level(img_list[0]["key"], img_list[0]["restored"], WIDE_DISPLAY_SIDE),
+                             caption=img_list[0]["name"], use_column_width=True)
+                    # 保存复原后的图片状态
+                    st.session_state["restored_key"] = img_list[0]["key"]
+                    st.session_state["restored_img_name"] = img_list[0]["name"]
+
+                    # 新增查看/下载按钮
+                    btn_col1, btn_col2 = st.columns(2)
+                    with btn_col1:
+                        if st.button("👁️ 查看原图", type="secondary", use_container_width=True):
+                            st.session_state["preview_key"] = img_list[0]["key"]
+                            st.session_state["show_preview"] = True
+                    with btn_col2:
+                        render_download(
+                            "💾 下载图片", img_list[0]["key"], lambda: img_list[0]["restored"],
+                            f"复原_{img_list[0]['name']}", "download", export_cfg
+                        )
+            else:
+                st.warning("⚠️ 未加载到有效图片！")
+
+        # 双画面模式：左侧=第1张，右侧=第2张（固定顺序）
+        else:
+            with restore_placeholder.container():
+                col_left, col_right = st.columns(2)
+
+                # 左列：固定显示第1张图片
+                if len(img_list) >= 1:
+                    with col_left:
+                        st.subheader(f"📷 第1张图像（{img_list[0]['label']}复原前）")
+                        st.image(core.display_level(img_list[0]["key"], img_list[0]["restored"], COLUMN_DISPLAY_SIDE),
+                                 caption=img_list[0]["name"], use_column_width=True)
+                        # 保存第一张复原图状态
+                        st.session_state["restored_key"] = img_list[0]["key"]
                         st.session_state["restored_img_name"] = img_list[0]["name"]
-                        
-                        # 新增查看/下载按钮
+
+                        # 新增查看/下载按钮（左列）
                         btn_col1, btn_col2 = st.columns(2)
                         with btn_col1:
-                            if st.button("👁️ 查看原图", type="secondary", use_container_width=True):
-                                st.session_state["preview_img"] = img_list[0]["restored"]
+                            if st.button("👁️ 查看原图", type="secondary", use_container_width=True, key="view1"):
+                                st.session_state["preview_key"] = img_list[0]["key"]
                                 st.session_state["show_preview"] = True
                         with btn_col2:
-                            img_bytes = convert_img_to_bytes(img_list[0]["restored"])
-                            st.download_button(
-                                label="💾 下载图片",
-                                data=img_bytes,
-                                file_name=f"复原_{img_list[0]['name']}",
-                                mime="image/png",
-                                use_container_width=True
+                            render_download(
+                                "💾 下载图片", img_list[0]["key"], lambda: img_list[0]["restored"],
+                                f"复原_第1张_{img_list[0]['name']}", "download1", export_cfg
                             )
                 else:
-                    st.warning("⚠️ 未加载到有效图片！")
-            
-            # 双画面模式：左侧=第1张，右侧=第2张（固定顺序）
-            else:
-                with restore_placeholder.container():
-                    col_left, col_right = st.columns(2)
-                    
-                    # 左列：固定显示第1张图片
-                    if len(img_list) >= 1:
-                        with col_left:
-                            st.subheader(f"📷 第1张图像（{restoration_model}复原前）")
-                            st.image(img_list[0]["restored"], caption=img_list[0]["name"], use_column_width=True)
-                            # 保存第一张复原图状态
-                            st.session_state["restored_img"] = img_list[0]["restored"]
-                            st.session_state["restored_img_name"] = img_list[0]["name"]
-                            
-                            # 新增查看/下载按钮（左列）
-                            btn_col1, btn_col2 = st.columns(2)
-                            with btn_col1:
-                                if st.button("👁️ 查看原图", type="secondary", use_container_width=True, key="view1"):
-                                    st.session_state["preview_img"] = img_list[0]["restored"]
-                                    st.session_state["show_preview"] = True
-                            with btn_col2:
-                                img_bytes = convert_img_to_bytes(img_list[0]["restored"])
-                                st.download_button(
-                                    label="💾 下载图片",
-                                    data=img_bytes,
-                                    file_name=f"复原_第1张_{img_list[0]['name']}",
-                                    mime="image/png",
-                                    use_container_width=True,
-                                    key="download1"
-                                )
-                    else:
-                        with col_left:
-                            st.warning("⚠️ 未加载到图片！")
-                    
-                    # 右列：固定显示第2张图片
-                    if len(img_list) >= 2:
-                        with col_right:
-                            st.subheader(f"📷 第2张图像（{restoration_model}复原后）")
-                            st.image(img_list[1]["restored"], caption=img_list[1]["name"], use_column_width=True)
-                            # 保存第二张复原图状态
-                            st.session_state["restored_img"] = img_list[1]["restored"]
-                            st.session_state["restored_img_name"] = img_list[1]["name"]
-                            
-                            # 新增查看/下载按钮（右列）
-                            btn_col1, btn_col2 = st.columns(2)
-                            with btn_col1:
-                                if st.button("👁️ 查看原图", type="secondary", use_container_width=True, key="view2"):
-                                    st.session_state["preview_img"] = img_list[1]["restored"]
-                                    st.session_state["show_preview"] = True
-                            with btn_col2:
-                                img_bytes = convert_img_to_bytes(img_list[1]["restored"])
-                                st.download_button(
-                                    label="💾 下载图片",
-                                    data=img_bytes,
-                                    file_name=f"复原_第2张_{img_list[1]['name']}",
-                                    mime="image/png",
-                                    use_container_width=True,
-                                    key="download2"
-                                )
-                    else:
-                        with col_right:
-                            st.error("❌ 请上传退化图片！")
-            
-            # 运行成功提示
-            st.success(f"✅ {restoration_model} 运行完成！共加载 {len(img_list)} 张图片")
+                    with col_left:
+                        st.warning("⚠️ 未加载到图片！")
+
+                # 右列：固定显示第2张图片
+                if len(img_list) >= 2:
+                    with col_right:
+                        st.subheader(f"📷 第2张图像（{img_list[1]['label']}复原后）")
+                        st.image(core.display_level(img_list[1]["key"], img_list[1]["restored"], COLUMN_DISPLAY_SIDE),
+                                 caption=img_list[1]["name"], use_column_width=True)
+                        # 保存第二张复原图状态
+                        st.session_state["restored_key"] = img_list[1]["key"]
+                        st.session_state["restored_img_name"] = img_list[1]["name"]
+
+                        # 新增查看/下载按钮（右列）
+                        btn_col1, btn_col2 = st.columns(2)
+                        with btn_col1:
+                            if st.button("👁️ 查看原图", type="secondary", use_container_width=True, key="view2"):
+                                st.session_state["preview_key"] = img_list[1]["key"]
+                                st.session_state["show_preview"] = True
+                        with btn_col2:
+                            render_download(
+                                "💾 下载图片", img_list[1]["key"], lambda: img_list[1]["restored"],
+                                f"复原_第2张_{img_list[1]['name']}", "download2", export_cfg
+                            )
+                else:
+                    with col_right:
+                        st.error("❌ 请上传退化图片！")
 
     # --------------------------
-    # 核心功能2：运行目标检测
+    # 核心功能2：运行下游任务（目标检测/场景分割）
     # --------------------------
-    if detect_run_btn and downstream_task == "目标检测":
+    if task_run_btn:
         if not uploaded_files:
             st.error("❌ 请先上传图片并运行复原模型！")
         else:
-            detect_placeholder.empty()
-            # 加载第一张图片运行检测
-            cv2_img, pil_img = load_image(uploaded_files[0])
-            if cv2_img is not None:
-                detected_img = run_detection_model(pil_img)
-                with detect_placeholder.container():
-                    st.subheader("🔍 目标检测结果展示（第1张图）")
-                    st.image(detected_img, caption=uploaded_files[0].name, use_column_width=True)
-                    # 保存检测后的图片状态
-                    st.session_state["detected_img"] = detected_img
-                    st.session_state["detected_img_name"] = uploaded_files[0].name
-                    
-                    # 新增查看/下载按钮（目标检测结果）
-                    btn_col1, btn_col2 = st.columns(2)
-                    with btn_col1:
-                        if st.button("👁️ 查看检测结果", type="secondary", use_container_width=True, key="view_det"):
-                            st.session_state["preview_img"] = detected_img
-                            st.session_state["show_preview"] = True
-                    with btn_col2:
-                        img_bytes = convert_img_to_bytes(detected_img)
-                        st.download_button(
-                            label="💾 下载检测结果",
-                            data=img_bytes,
-                            file_name=f"目标检测_{uploaded_files[0].name}",
-                            mime="image/png",
-                            use_container_width=True,
-                            key="download_det"
-                        )
-                    st.success("✅ 目标检测运行完成！")
+            # 运行阶段图：复原结果直接送入任务推理（复原结果与原始输出均走结果缓存）
+            # 目标检测只处理第一张，场景分割对全部图片批量推理
+            task_files = list(uploaded_files) if downstream_task == core.SEGMENTATION_MODEL else uploaded_files[:1]
+            job = submit_job(
+                task_job_kind(downstream_task),
+                make_task_job(task_files, restoration_model, downstream_task),
+                label=downstream_task, total=len(task_files),
+            )
+            jobs_pending = jobs_pending or job is not None
+
+    # 任务结果展示：每次rerun按当前显示参数重新绘制，不重新推理
+    if task_handle is not None:
+        result_cache = core.get_result_cache()
+        restored_arr = result_cache.get(task_item["restored_key"]) if task_item is not None else None
+        if restored_arr is None or task_raw is None:
+            task_placeholder.info(f"ℹ️ {downstream_task}结果已被缓存淘汰，请重新运行{downstream_task}")
+        else:
+            # 绘制结果只以显示尺寸按 原始输出+显示参数 写入结果缓存，参数不变时rerun直接复用；
+            # 原分辨率的绘制结果不进入缓存（每组显示参数一张，会挤占复原结果），下载时才重新绘制
+            render_full = lambda: core.render_task(downstream_task, restored_arr, task_raw, **task_options)
+            drawn_key = core.make_result_key(task_item["raw_key"], "draw", downstream_task,
+                                             max_side=WIDE_DISPLAY_SIDE, **task_options)
+            rendered = result_cache.get(drawn_key, record=False)
+            if rendered is None:
+                rendered = result_cache.put(drawn_key, core.fit_side(render_full(), WIDE_DISPLAY_SIDE))
+            task_name = task_item["name"]
+            items = task_handle["items"]
+            with task_placeholder.container():
+                if len(items) > 1:
+                    st.selectbox("选择图片", range(len(items)), format_func=lambda i: items[i]["name"],
+                                 key="task_item")
+                st.subheader(f"🔍 {downstream_task}结果展示（{task_name}，"
+                             f"{task_summary(downstream_task, task_raw, task_options)}）")
+                st.image(rendered, caption=task_name, use_column_width=True)
+                # 保存任务结果图的状态
+                st.session_state["detected_key"] = drawn_key
+                st.session_state["detected_img_name"] = task_name
+
+                # 查看/下载按钮（下游任务结果）
+                btn_col1, btn_col2 = st.columns(2)
+                with btn_col1:
+                    if st.button(f"👁️ 查看{downstream_task}结果", type="secondary", use_container_width=True,
+                                 key="view_det"):
+                        st.session_state["preview_key"] = drawn_key
+                        st.session_state["show_preview"] = True
+                with btn_col2:
+                    render_download(
+                        f"💾 下载{downstream_task}结果", drawn_key, render_full,
+                        f"{downstream_task}_{task_name}", "download_det", export_cfg
+                    )
 
     # --------------------------
     # 图片预览弹窗（查看按钮触发）
     # --------------------------
-    if st.session_state["show_preview"] and st.session_state["preview_img"] is not None:
-        st.markdown(f"""
-        <div class="modal" onclick="document.querySelector('.modal').style.display='none'">
-            <img src="data:image/png;base64,{st.image_to_url(st.session_state['preview_img'], width=1000)}" class="modal-content">
-        </div>
-        """, unsafe_allow_html=True)
+    if st.session_state["show_preview"] and st.session_state["preview_key"] is not None:
+        preview_img = core.get_result_cache().get(st.session_state["preview_key"], record=False)
+        if preview_img is None:
+            st.info("ℹ️ 预览图片已被缓存淘汰，请重新运行")
+        else:
+            st.markdown(f"""
+            <div class="modal" onclick="document.querySelector('.modal').style.display='none'">
+                <img src="data:image/png;base64,{st.image_to_url(preview_img, width=1000)}" class="modal-content">
+            </div>
+            """, unsafe_allow_html=True)
         # 关闭预览按钮
         if st.button("❌ 关闭预览", type="secondary", use_container_width=True):
             st.session_state["show_preview"] = False
-            st.session_state["preview_img"] = None
+            st.session_state["preview_key"] = None
             st.rerun()
 
+    return jobs_pending
+
 # --------------------------
 # 7. 程序入口
 # --------------------------
+# 设置后在界面进程内启动 HTTP 推理服务，与界面共享常驻模型与结果缓存
+INFERENCE_HTTP_PORT = os.environ.get("INFERENCE_HTTP_PORT")
+INFERENCE_HTTP_HOST = os.environ.get("INFERENCE_HTTP_HOST", "127.0.0.1")
+
+@st.cache_resource
+def start_inference_server(host: str, port: int):
+    """每个进程只启动一次（Streamlit 重跑脚本时复用已启动的服务线程）"""
+    import server
+    return server.start_background(host, port)
+
+# 设为1时进程内首次运行脚本后在后台预热（加载模型、映射频域掩膜、启动复原进程池，见 core.warm_up）
+WARMUP_ON_START = os.environ.get("WARMUP_ON_START", "0") == "1"
+
+@st.cache_resource
+def start_warm_up():
+    """每个进程只预热一次；模块导入与预热都在后台线程中进行，用户登录时主界面所需模块通常已导入完毕"""
+    def run():
+        import core
+        core.warm_up()
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
 if __name__ == "__main__":
     # 初始化基础session_state
     if "logged_in" not in st.session_state:
@@ -521,8 +1150,38 @@ if __name__ == "__main__":
     # 初始化用户数据库
     init_user_db()
 
-    # 路由控制
-    if not check_login():
-        render_auth_page()
-    else:
-        render_main_app()
+    # 整次脚本运行计时；管理员开启 cProfile 时记录本次运行（st.rerun 以异常方式中断脚本，因此在 finally 中收尾）
+    run_start = time.perf_counter()
+    # 任务轮询触发的重跑只刷新进度，不记录 cProfile（否则任务运行期间每个轮询间隔写出一个 .prof 文件）
+    poll_rerun = st.session_state.pop("poll_rerun", False)
+    profiler = None
+    if st.session_state["user_role"] == "admin" and st.session_state.get("profile_runs") and not poll_rerun:
+        profiler = metrics.start_profile()
+    jobs_pending = False
+    try:
+        # 路由控制
+        if not check_login():
+            render_auth_page()
+            # 登录页从脚本起点到渲染完成的耗时；进程内的第一次即冷启动的“首个登录页”
+            login_seconds = time.perf_counter() - SCRIPT_START
+            metrics.record("login_page", login_seconds)
+            metrics.mark_startup("first_login_page", login_seconds)
+        else:
+            load_main_modules()
+            jobs_pending = render_main_app()
+    finally:
+        metrics.record("script_run", time.perf_counter() - run_start)
+        if profiler is not None:
+            st.session_state["last_profile"] = metrics.stop_profile(profiler, label="script_run")
+        # 进程级后台服务在页面渲染之后启动，不计入首个登录页耗时
+        if INFERENCE_HTTP_PORT:
+            start_inference_server(INFERENCE_HTTP_HOST, int(INFERENCE_HTTP_PORT))
+        if WARMUP_ON_START:
+            start_warm_up()
+
+    # 有进行中的任务时定时重跑脚本以刷新进度、取回结果（任务本身在后台线程中继续运行）；
+    # 在记录本次运行耗时之后等待，轮询间隔不计入 script_run
+    if jobs_pending:
+        time.sleep(JOB_POLL_INTERVAL)
+        st.session_state["poll_rerun"] = True
+        st.rerun()
@@ -0,0 +1,91 @@
+"""
+磁盘产物缓存（不依赖Streamlit）
+按尺寸预计算的频域掩膜等只读数组以 .npy 保存，之后的进程（含进程池子进程）直接内存映射读取：
+- 重启或新建子进程时无需重新生成，同一文件的页面在多个进程间由操作系统页缓存共享
+- 文件名包含生成参数与生成代码版本（ARTIFACT_VERSION）的哈希，任一变化后自动生成新文件，
+  旧文件不再被读取，并在超出容量上限时被清理
+"""
+import hashlib
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+import metrics
+
+# 产物目录（设为空字符串则不落盘，每个进程各自生成）
+ARTIFACT_DIR = os.environ.get("ARTIFACT_DIR", os.path.join(tempfile.gettempdir(), "restore_artifacts"))
+# 产物目录容量上限（字节），超出后删除最久未使用的文件
+ARTIFACT_MAX_BYTES = int(os.environ.get("ARTIFACT_MAX_BYTES", 1024 * 1024 * 1024))
+# 产物生成代码的版本：修改任何生成函数（如 restoration 中的频域掩膜）时必须递增，使旧产物失效
+ARTIFACT_VERSION = 1
+
+_STATS = {"mapped": 0, "built": 0}
+_STATS_LOCK = threading.Lock()
+
+def artifact_path(name: str, params: tuple) -> str:
+    """产物文件路径：名称 + 生成代码版本与生成参数的哈希"""
+    digest = hashlib.blake2b(repr((ARTIFACT_VERSION, params)).encode("utf-8"), digest_size=8).hexdigest()
+    return os.path.join(ARTIFACT_DIR, f"{name}_{digest}.npy")
+
+def _count(stat: str):
+    with _STATS_LOCK:
+        _STATS[stat] += 1
+
+def load_or_build(name: str, params: tuple, build) -> np.ndarray:
+    """
+    返回只读数组：产物文件存在时内存映射读取，否则调用 build() 生成并写入产物目录
+    文件损坏或目录不可写时退回内存中的生成结果，不影响调用方
+    """
+    if not ARTIFACT_DIR:
+        return build()
+    path = artifact_path(name, params)
+    try:
+        arr = np.load(path, mmap_mode="r")
+        _count("mapped")
+    except (OSError, ValueError):
+        pass
+    else:
+        # 命中时更新修改时间，清理按修改时间进行（不依赖 noatime/relatime 挂载下不可靠的访问时间）
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return arr
+    arr = build()
+    _count("built")
+    try:
+        os.makedirs(ARTIFACT_DIR, exist_ok=True)
+        # 先写临时文件再原子替换，并发生成同一产物的进程不会读到写了一半的文件
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, arr)
+        os.replace(tmp_path, path)
+        _trim()
+    except OSError:
+        pass
+    return arr
+
+def _trim():
+    """产物目录超出容量上限时删除最久未使用（修改时间最早）的文件"""
+    files = []
+    for entry in os.scandir(ARTIFACT_DIR):
+        if entry.name.endswith(".npy"):
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= ARTIFACT_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+def stats() -> dict:
+    with _STATS_LOCK:
+        return dict(_STATS)
+
+metrics.register_gauges("artifacts", stats)
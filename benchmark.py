@@ -0,0 +1,320 @@
+"""
+流水线基准测试：解码 -> 复原 -> 检测（含NMS） -> 编码
+合成不同分辨率的雨/雾/雪退化图像，分别统计各阶段耗时的 p50/p95、整体吞吐与峰值内存（RSS），
+并比较串行、线程池、进程池三种执行方式（每种方式在新的子进程中运行，峰值内存互不累加），结果以 JSON 输出
+示例：
+    python benchmark.py --sizes 640x480,1920x1080 --count 4 --output bench.json
+    python benchmark.py --baseline bench.json --tolerance 0.2      # 任一阶段 p95 超出基线 20% 时返回非零
+不经过结果缓存与解码缓存，每次都完整执行各阶段
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+import core
+import detection
+import export
+import models
+import restoration
+
+try:
+    import resource
+except ImportError:  # Windows 无 resource 模块，不统计峰值内存
+    resource = None
+
+RAIN = "rain"
+HAZE = "haze"
+SNOW = "snow"
+DEGRADATIONS = (RAIN, HAZE, SNOW)
+MODES = ("serial", "thread", "process")
+DEFAULT_SIZES = "640x480,1280x720,1920x1080"
+
+# --------------------------
+# 合成退化图像
+# --------------------------
+def synth_clean(width: int, height: int, rng: np.random.Generator) -> np.ndarray:
+    """合成“干净”场景：天空渐变 + 地面 + 若干矩形物体（保证有足够的边缘与纹理）"""
+    y = np.linspace(0.0, 1.0, height, dtype=np.float32)[:, None]
+    x = np.linspace(0.0, 1.0, width, dtype=np.float32)[None, :]
+    sky = np.stack([0.45 + 0.3 * y + 0 * x, 0.6 + 0.2 * y + 0 * x, 0.85 + 0.1 * y + 0 * x], axis=-1)
+    img = (sky * 255).astype(np.uint8)
+    horizon = height * 3 // 5
+    img[horizon:] = (90, 85, 80)
+    for _ in range(12):
+        w = int(rng.integers(width // 20, width // 6))
+        h = int(rng.integers(height // 12, height // 4))
+        x0 = int(rng.integers(0, width - w))
+        y0 = int(rng.integers(horizon - h // 2, height - h))
+        color = tuple(int(c) for c in rng.integers(20, 235, 3))
+        cv2.rectangle(img, (x0, y0), (x0 + w, y0 + h), color, -1)
+    noise = rng.normal(0.0, 4.0, img.shape).astype(np.float32)
+    return np.clip(img.astype(np.float32) + noise, 0, 255).astype(np.uint8)
+
+def add_rain(rgb: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """稀疏亮点经倾斜线核运动模糊形成雨痕"""
+    h, w = rgb.shape[:2]
+    drops = (rng.random((h, w)) < 0.004).astype(np.float32)
+    length = max(9, min(h, w) // 25)
+    kernel = np.zeros((length, length), np.float32)
+    cv2.line(kernel, (length // 3, 0), (2 * length // 3, length - 1), 1.0, 1)
+    streaks = cv2.filter2D(drops, -1, kernel / kernel.sum()) * length * 0.6
+    out = rgb.astype(np.float32) + np.clip(streaks, 0, 1)[..., None] * 180.0
+    return np.clip(out, 0, 255).astype(np.uint8)
+
+def add_haze(rgb: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """大气散射模型 I = J·t + A·(1 - t)，透射率随“深度”（图像上方更远）递减"""
+    h, w = rgb.shape[:2]
+    depth = np.linspace(1.0, 0.2, h, dtype=np.float32)[:, None] * np.ones((1, w), np.float32)
+    t = np.exp(-float(rng.uniform(1.0, 2.0)) * depth)[..., None]
+    atmosphere = float(rng.uniform(200, 240))
+    out = rgb.astype(np.float32) * t + atmosphere * (1.0 - t)
+    return np.clip(out, 0, 255).astype(np.uint8)
+
+def add_snow(rgb: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """不同大小的白色雪花，轻微模糊"""
+    h, w = rgb.shape[:2]
+    layer = np.zeros((h, w), np.float32)
+    n_flakes = h * w // 400
+    xs = rng.integers(0, w, n_flakes)
+    ys = rng.integers(0, h, n_flakes)
+    radii = rng.integers(1, max(2, min(h, w) // 200 + 2), n_flakes)
+    for x, y, r in zip(xs, ys, radii):
+        cv2.circle(layer, (int(x), int(y)), int(r), 1.0, -1)
+    layer = cv2.GaussianBlur(layer, (0, 0), 1.0)
+    out = rgb.astype(np.float32) * (1.0 - layer[..., None] * 0.8) + layer[..., None] * 240.0
+    return np.clip(out, 0, 255).astype(np.uint8)
+
+_DEGRADE = {RAIN: add_rain, HAZE: add_haze, SNOW: add_snow}
+
+def synth_inputs(sizes, count: int, seed: int) -> list:
+    """合成测试输入：[(退化类型, 宽, 高, PNG字节)]，同一 seed 结果完全一致"""
+    rng = np.random.default_rng(seed)
+    inputs = []
+    for width, height in sizes:
+        for kind in DEGRADATIONS:
+            for _ in range(count):
+                degraded = _DEGRADE[kind](synth_clean(width, height, rng), rng)
+                ok, buf = cv2.imencode(".png", cv2.cvtColor(degraded, cv2.COLOR_RGB2BGR),
+                                       [cv2.IMWRITE_PNG_COMPRESSION, 1])
+                inputs.append((kind, width, height, buf.tobytes()))
+    return inputs
+
+# --------------------------
+# 单个任务：解码 -> 复原 -> 检测 -> 编码
+# --------------------------
+def warm_up(model_names, with_detection: bool):
+    """预先加载模型（进程池中作为每个子进程的初始化函数），使模型加载耗时不计入阶段耗时"""
+    pool = models.get_pool()
+    for name in model_names:
+        pool.get(name)
+    if with_detection:
+        pool.get(core.DETECTION_MODEL)
+
+def run_task(png_bytes: bytes, model_name: str, with_detection: bool, fmt: str) -> dict:
+    """执行一次完整流水线，返回 {阶段名: 耗时秒}"""
+    timings = {}
+    start = time.perf_counter()
+    rgb = restoration.decode_rgb(png_bytes)
+    timings["load"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    restored = core.run_restoration_model(rgb, model_name)
+    timings[f"restore:{model_name}"] = time.perf_counter() - start
+
+    if with_detection:
+        start = time.perf_counter()
+        detection.filter_detections(core.run_task_model(core.DETECTION_MODEL, restored), 0.40, 0.40)
+        timings["detect"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    export.encode_image(restored, fmt)
+    timings["encode"] = time.perf_counter() - start
+    return timings
+
+# --------------------------
+# 执行方式与统计
+# --------------------------
+def peak_rss_mb(children: bool = False):
+    """进程（或已结束子进程中的最大者）自启动以来的峰值常驻内存（MB）"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF)
+    # Linux 上 ru_maxrss 单位为 KB，macOS 上为字节
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(usage.ru_maxrss / scale, 1)
+
+def summarize(samples) -> dict:
+    arr = np.asarray(samples, dtype=np.float64) * 1000.0
+    return {
+        "count": int(arr.size),
+        "mean_ms": round(float(arr.mean()), 2),
+        "p50_ms": round(float(np.percentile(arr, 50)), 2),
+        "p95_ms": round(float(np.percentile(arr, 95)), 2),
+        "max_ms": round(float(arr.max()), 2),
+    }
+
+def run_mode(mode: str, tasks, workers: int, model_names, with_detection: bool) -> dict:
+    """按指定方式执行全部任务，返回吞吐、各阶段延迟分布与峰值内存"""
+    if mode == "serial":
+        executor = None
+    elif mode == "thread":
+        executor = ThreadPoolExecutor(max_workers=workers)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                       initializer=warm_up, initargs=(model_names, with_detection))
+        # 预热：先启动子进程并完成模型加载，避免计入首批任务
+        list(executor.map(time.sleep, [0.0] * workers))
+
+    start = time.perf_counter()
+    if executor is None:
+        results = [run_task(*task) for task in tasks]
+    else:
+        with executor:
+            results = list(executor.map(run_task, *zip(*tasks)))
+    wall = time.perf_counter() - start
+
+    stages = {}
+    for timings in results:
+        for stage, seconds in timings.items():
+            stages.setdefault(stage, []).append(seconds)
+    return {
+        "workers": 1 if executor is None else workers,
+        "tasks": len(tasks),
+        "wall_seconds": round(wall, 3),
+        "throughput_per_s": round(len(tasks) / wall, 3) if wall > 0 else 0.0,
+        # 进程池方式统计池中子进程的峰值（进程池关闭后才可读取）；其余方式为当前进程的峰值，
+        # 当前进程只运行这一种方式（见 run_mode_isolated），因此不含其他方式留下的高水位
+        "peak_rss_mb": peak_rss_mb(children=mode == "process"),
+        "stages": {stage: summarize(samples) for stage, samples in sorted(stages.items())},
+    }
+
+def _mode_process(conn, mode: str, tasks, workers: int, model_names, with_detection: bool):
+    warm_up(model_names, with_detection)
+    conn.send(run_mode(mode, tasks, workers, model_names, with_detection))
+    conn.close()
+
+def run_mode_isolated(mode: str, tasks, workers: int, model_names, with_detection: bool) -> dict:
+    """
+    在新的子进程中执行 run_mode：ru_maxrss 是进程自启动以来的峰值，
+    在同一进程中依次运行各方式时，后运行的方式会报告前面方式（如串行处理最大分辨率时）留下的高水位
+    """
+    ctx = multiprocessing.get_context("spawn")
+    receiver, sender = ctx.Pipe(duplex=False)
+    # 不使用进程池：进程池方式需要在子进程中再创建进程池
+    process = ctx.Process(target=_mode_process, args=(sender, mode, tasks, workers, model_names, with_detection))
+    process.start()
+    sender.close()
+    try:
+        return receiver.recv()
+    except EOFError:
+        raise RuntimeError(f"{mode} 子进程异常退出（退出码 {process.exitcode}）") from None
+    finally:
+        process.join()
+
+def compare_with_baseline(report: dict, baseline: dict, tolerance: float) -> list:
+    """返回相对基线变慢超过容差的 (执行方式, 阶段, 基线p95, 当前p95) 列表"""
+    regressions = []
+    for mode, current in report["modes"].items():
+        base_mode = baseline.get("modes", {}).get(mode)
+        if base_mode is None:
+            continue
+        for stage, stats in current["stages"].items():
+            base_stats = base_mode["stages"].get(stage)
+            if base_stats and stats["p95_ms"] > base_stats["p95_ms"] * (1.0 + tolerance):
+                regressions.append((mode, stage, base_stats["p95_ms"], stats["p95_ms"]))
+    return regressions
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="基于频域感知的恶劣天气图像复原系统 - 流水线基准测试")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"分辨率列表（默认 {DEFAULT_SIZES}）")
+    parser.add_argument("--count", type=int, default=2, help="每种分辨率、每种退化合成的图片数")
+    parser.add_argument("--models", nargs="+", default=None, help="参与测试的复原模型（默认全部）")
+    parser.add_argument("--modes", default=",".join(MODES), help="执行方式：serial,thread,process")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="线程池/进程池大小")
+    parser.add_argument("--no-detect", action="store_true", help="跳过目标检测阶段")
+    parser.add_argument("--format", default=export.PNG, choices=export.FORMATS, help="编码阶段的输出格式")
+    parser.add_argument("--seed", type=int, default=0, help="合成图像的随机种子")
+    parser.add_argument("--output", default="", help="JSON 结果写入的文件（默认输出到标准输出）")
+    parser.add_argument("--baseline", default="", help="基线 JSON，用于回归检查")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="回归容差（p95 相对基线的增幅）")
+    return parser
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    model_names = args.models or models.model_names(models.RESTORATION)
+    unknown = [name for name in model_names if name not in models.model_names(models.RESTORATION)]
+    if unknown:
+        print(f"未知的复原模型：{unknown}", file=sys.stderr)
+        return 2
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    if any(mode not in MODES for mode in modes):
+        print(f"未知的执行方式：{modes}（可选 {list(MODES)}）", file=sys.stderr)
+        return 2
+
+    with_detection = not args.no_detect
+    detection_note = ""
+    try:
+        warm_up(model_names, with_detection)
+    except FileNotFoundError as e:
+        with_detection = False
+        detection_note = f"目标检测模型不可用，已跳过检测阶段：{e}"
+        print(detection_note, file=sys.stderr)
+        warm_up(model_names, False)
+
+    sizes = core.parse_sizes(args.sizes)
+    inputs = synth_inputs(sizes, args.count, args.seed)
+    tasks = [(png_bytes, name, with_detection, args.format) for _, _, _, png_bytes in inputs for name in model_names]
+
+    report = {
+        "config": {
+            "sizes": [f"{w}x{h}" for w, h in sizes],
+            "count": args.count,
+            "degradations": list(DEGRADATIONS),
+            "models": model_names,
+            "detection": with_detection,
+            "format": args.format,
+            "seed": args.seed,
+            "workers": args.workers,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "numpy": np.__version__,
+            "opencv": cv2.__version__,
+            "opencv_threads": cv2.getNumThreads(),
+        },
+        "modes": {},
+    }
+    if detection_note:
+        report["config"]["note"] = detection_note
+    for mode in modes:
+        print(f"运行 {mode}（{len(tasks)} 个任务）...", file=sys.stderr, flush=True)
+        report["modes"][mode] = run_mode_isolated(mode, tasks, args.workers, model_names, with_detection)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare_with_baseline(report, json.load(f), args.tolerance)
+        for mode, stage, base_p95, p95 in regressions:
+            print(f"性能回退：{mode} / {stage} p95 {base_p95:.1f} ms -> {p95:.1f} ms", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
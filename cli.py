@@ -0,0 +1,142 @@
+"""
+命令行批处理（无需浏览器会话）
+示例：
+    python cli.py "data/rain/**/*.jpg" --model 去雨模型 --out results/ --workers 8
+    python cli.py "frames/*.png" --model 去雾模型 --detect --conf 0.4 --iou 0.45 --format JPEG
+    python cli.py "mixed/*.jpg" --model 自动 --out results/
+    python cli.py "drive/*.jpg" --model 去雨模型 --segment --opacity 0.6
+复原在进程池中并行执行；与界面共用 core 模块的结果缓存（设置 RESULT_CACHE_DIR 后磁盘层跨进程共享）
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import core
+import detection
+import export
+import models
+import segmentation
+
+# 支持的输入图像扩展名
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff")
+
+class FileItem:
+    """磁盘上的输入图片，提供与上传文件相同的 name/getvalue 接口，字节在提交时才读取"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+
+    def getvalue(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+def expand_inputs(patterns) -> list:
+    """展开 glob 模式（支持 **），去重并按路径排序，仅保留图片文件"""
+    paths = set()
+    for pattern in patterns:
+        for path in glob.glob(pattern, recursive=True):
+            if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS):
+                paths.add(os.path.abspath(path))
+    return sorted(paths)
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="基于频域感知的恶劣天气图像复原系统 - 批处理")
+    parser.add_argument("inputs", nargs="+", help="输入图片路径或 glob 模式（支持 **）")
+    parser.add_argument("--model", required=True, choices=core.restoration_choices(),
+                        help="复原模型（“自动”按每张图片的天气类型路由到对应模型）")
+    parser.add_argument("--out", default="results", help="输出目录（默认 results）")
+    parser.add_argument("--workers", type=int, default=core.RESTORE_POOL_WORKERS,
+                        help="复原进程数（默认等于CPU核数，1为当前进程串行）")
+    parser.add_argument("--detect", action="store_true", help="对复原结果运行目标检测并输出检测图与JSON")
+    parser.add_argument("--conf", type=float, default=0.40, help="置信度阈值")
+    parser.add_argument("--iou", type=float, default=0.40, help="IOU阈值")
+    parser.add_argument("--segment", action="store_true",
+                        help="对复原结果分批运行场景分割并输出叠加图与各类别像素占比JSON")
+    parser.add_argument("--opacity", type=float, default=segmentation.DEFAULT_OPACITY, help="分割叠加不透明度")
+    parser.add_argument("--format", default=export.PNG, choices=export.FORMATS, help="输出格式")
+    parser.add_argument("--quality", type=int, default=export.DEFAULT_QUALITY, help="JPEG/WebP 编码质量")
+    parser.add_argument("--png-level", type=int, default=export.DEFAULT_PNG_LEVEL, help="PNG 压缩级别（0-9）")
+    return parser
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        print("未匹配到任何输入图片", file=sys.stderr)
+        return 2
+    os.makedirs(args.out, exist_ok=True)
+    for enabled, task in ((args.detect, core.DETECTION_MODEL), (args.segment, core.SEGMENTATION_MODEL)):
+        if not enabled:
+            continue
+        try:
+            models.get_pool().get(task)
+        except FileNotFoundError as e:
+            print(f"{task}模型加载失败：{e}", file=sys.stderr)
+            return 2
+
+    items = [FileItem(path) for path in paths]
+    used_names = set()
+    failures = []
+    start = time.perf_counter()
+
+    def output_path(entry, suffix: str, ext: str = None) -> str:
+        stem = os.path.splitext(entry["name"])[0]
+        # 不同目录下的同名文件加上序号区分
+        if (stem, suffix) in used_names:
+            stem = f"{stem}_{entry['index']}"
+        used_names.add((stem, suffix))
+        return os.path.join(args.out, f"{stem}{suffix}{ext or export.EXTENSIONS[args.format]}")
+
+    def write_image(path: str, rgb):
+        with open(path, "wb") as f:
+            f.write(export.encode_image(rgb, args.format, args.quality, args.png_level))
+
+    def on_result(entry, arr):
+        if arr is None:
+            failures.append(entry["name"])
+            print(f"[{entry['index']}/{len(items)}] 解码失败：{entry['name']}", file=sys.stderr)
+            return
+        write_image(output_path(entry, "_restored"), arr)
+        summary = f"[{entry['index']}/{len(items)}] {entry['name']}"
+        if entry["confidence"] is not None:
+            summary += f"（{entry['model']}，置信度 {entry['confidence']:.0%}）"
+        if args.detect:
+            _, raw = core.task_raw_cached(core.DETECTION_MODEL, entry["key"], arr)
+            dets = detection.filter_detections(raw, args.conf, args.iou)
+            write_image(output_path(entry, "_detected"), detection.draw_detections(arr, dets))
+            with open(output_path(entry, "_detections", ".json"), "w", encoding="utf-8") as f:
+                json.dump(detection.detections_to_json(dets), f, ensure_ascii=False)
+            summary += f"：{len(dets)} 个目标"
+        print(summary, flush=True)
+
+    def on_segmented(entry, restored, labels):
+        if labels is None:
+            return
+        write_image(output_path(entry, "_segmented"),
+                    core.render_task(core.SEGMENTATION_MODEL, restored, labels, opacity=args.opacity))
+        with open(output_path(entry, "_segmentation", ".json"), "w", encoding="utf-8") as f:
+            json.dump(segmentation.class_histogram(labels), f, ensure_ascii=False)
+
+    pool = core.new_restore_pool(args.workers) if args.workers > 1 else None
+    try:
+        if args.segment:
+            # 分割在主进程中分批推理，与进程池中后续图片的复原重叠进行
+            core.task_batch(items, args.model, core.SEGMENTATION_MODEL, on_restored=on_result,
+                            on_result=on_segmented, pool=pool, max_in_flight=2 * max(args.workers, 1))
+        else:
+            core.restore_batch(items, args.model, on_result=on_result, pool=pool,
+                               max_in_flight=2 * max(args.workers, 1))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    elapsed = time.perf_counter() - start
+    done = len(items) - len(failures)
+    print(f"完成 {done}/{len(items)} 张，用时 {elapsed:.1f}s（{done / elapsed if elapsed else 0:.2f} 张/秒）")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,787 @@
+"""
+复原/检测流水线核心（不依赖Streamlit）
+Streamlit 界面（app.py）、命令行批处理（cli.py）与 HTTP 推理服务（server.py）共用本模块：
+- 内容寻址的解码缓存与结果缓存（内存LRU + 可选磁盘层，磁盘层可在多个进程间共享）
+- 复原 -> 下游任务（目标检测/场景分割）的阶段图：解码一次，复原结果直接送入任务预处理，结果绘制在同一缓冲区上
+- 进程级单例：结果缓存、解码缓存、复原进程池；模型常驻池见 models.get_pool
+- 冷启动预热：加载常驻模型、生成/映射常见尺寸的频域掩膜，并启动复原进程池的全部子进程
+Streamlit 每次 rerun 只会重新执行 app.py，这里的单例在多次 rerun、多个会话以及同进程内的 HTTP 服务之间共享
+"""
+import atexit
+import hashlib
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import cv2
+import numpy as np
+
+import detection
+import metrics
+import models
+import quality
+import restoration
+import routing
+import segmentation
+
+# 整幅复原的最大像素数（默认 2400 万像素：常见相机原图整幅处理，更大的全景图才分块）
+TILE_MAX_PIXELS = int(os.environ.get("TILE_MAX_PIXELS", 24_000_000))
+# 单张图像复原的工作内存预算（字节），超出时自动切换为分块处理；默认由 TILE_MAX_PIXELS 推出
+TILE_MEMORY_BUDGET = int(os.environ.get("TILE_MEMORY_BUDGET",
+                                        TILE_MAX_PIXELS * restoration.WORKING_BYTES_PER_PIXEL))
+# 进程池大小（默认等于CPU核数），设置为1时在当前进程内串行处理
+RESTORE_POOL_WORKERS = int(os.environ.get("RESTORE_POOL_WORKERS", os.cpu_count() or 1))
+# 内存层容量上限（字节），超出后按LRU淘汰
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# 磁盘层目录（为空则不启用），结果以 .npy 保存，重启后或其他进程中仍可命中
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "")
+# 未设置磁盘层目录时，内存层淘汰的结果溢出到进程私有的临时目录（进程退出时删除），设为0则直接丢弃
+RESULT_CACHE_SPILL = os.environ.get("RESULT_CACHE_SPILL", "1") == "1"
+# 磁盘层容量上限（字节），超出后删除最早写入的文件
+RESULT_CACHE_DISK_MAX_BYTES = int(os.environ.get("RESULT_CACHE_DISK_MAX_BYTES", 4 * 1024 * 1024 * 1024))
+# 下游任务模型名称（模型注册表中的键）
+DETECTION_MODEL = "目标检测"
+SEGMENTATION_MODEL = "场景分割"
+# 批量下游任务中一次送入模型的图像数（模型支持批量推理时生效，如场景分割）
+TASK_BATCH_SIZE = int(os.environ.get("TASK_BATCH_SIZE", segmentation.MAX_BATCH))
+# 解码后的任务原始输出（如游程编码还原的类别图）保留的条目数
+TASK_MEMO_ENTRIES = int(os.environ.get("TASK_MEMO_ENTRIES", 8))
+# 显示金字塔各级的最长边（像素，从大到小）：界面只发送与显示尺寸相当的级别，原图仅用于预览与下载
+PYRAMID_LEVELS = (1600, 960, 320)
+# 预热时预先生成频域掩膜的图像尺寸（“宽x高”，逗号分隔）
+WARMUP_SIZES = os.environ.get("WARMUP_SIZES", "1920x1080,1280x720")
+
+# --------------------------
+# 内容寻址缓存
+# --------------------------
+def content_key(bytes_data: bytes) -> str:
+    """计算上传内容的哈希，作为解码/结果缓存的键"""
+    return hashlib.blake2b(bytes_data, digest_size=16).hexdigest()
+
+def make_result_key(file_key: str, stage: str, model_name: str, **params) -> str:
+    """由上传内容哈希、处理阶段、模型名和参数生成结果缓存键"""
+    param_str = "&".join(f"{k}={params[k]!r}" for k in sorted(params))
+    raw = f"{file_key}|{stage}|{model_name}|{param_str}"
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+class DecodeMemo:
+    """最近解码结果的小型LRU缓存（进程级共享，避免同一文件在多次rerun中重复解码）"""
+
+    def __init__(self, max_entries: int = 4):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+class ResultCache:
+    """
+    模型输出缓存（全部会话共享，按内容哈希去重）：内存层按字节数做LRU淘汰，磁盘层（可选）保存 .npy，读取时内存映射
+    write_through=True 时写入即落盘（可跨进程、跨重启复用）；为 False 时仅在内存层淘汰时溢出到磁盘
+    """
+
+    def __init__(self, max_bytes: int, disk_dir: str = "", disk_max_bytes: int = 0, write_through: bool = True):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.write_through = write_through
+        self.spills = 0
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # 磁盘层字节数的累计值：写入时累加，超出上限时才扫描目录（同时按实际文件校正，其他进程的写入在此时计入）
+        self._disk_bytes = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._trim_disk()
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.npy")
+
+    def get(self, key: str, record: bool = True):
+        """查询缓存；record=False 时不计入命中/未命中统计（用于“是否已编码”之类的探测）"""
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += record
+                return self._items[key]
+        if self.disk_dir and os.path.exists(self._disk_path(key)):
+            try:
+                arr = np.load(self._disk_path(key), mmap_mode="r", allow_pickle=False)
+            except (OSError, ValueError):
+                arr = None
+            if arr is not None:
+                with self._lock:
+                    self.disk_hits += record
+                self._put_memory(key, arr)
+                return arr
+        with self._lock:
+            self.misses += record
+        return None
+
+    def put(self, key: str, arr: np.ndarray):
+        arr = np.ascontiguousarray(arr)
+        arr.flags.writeable = False
+        stored = self._put_memory(key, arr)
+        if self.disk_dir and (self.write_through or not stored):
+            self._put_disk(key, arr)
+        return arr
+
+    def _put_memory(self, key: str, arr: np.ndarray) -> bool:
+        # 单个结果超过整个内存预算时不进入内存层
+        if arr.nbytes > self.max_bytes:
+            return False
+        evicted = []
+        with self._lock:
+            if key in self._items:
+                self._bytes -= self._items.pop(key).nbytes
+            self._items[key] = arr
+            self._bytes += arr.nbytes
+            while self._bytes > self.max_bytes and self._items:
+                evicted.append(self._items.popitem(last=False))
+                self._bytes -= evicted[-1][1].nbytes
+        # 溢出模式：被淘汰的结果写入磁盘（已在磁盘上的内存映射数组无需重复写入）
+        if self.disk_dir and not self.write_through:
+            for old_key, old in evicted:
+                if not isinstance(old, np.memmap) and not os.path.exists(self._disk_path(old_key)):
+                    self._put_disk(old_key, old)
+                    with self._lock:
+                        self.spills += 1
+        return True
+
+    def _put_disk(self, key: str, arr: np.ndarray):
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.save(f, arr, allow_pickle=False)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._lock:
+            self._disk_bytes += size
+            over_budget = self._disk_bytes > self.disk_max_bytes
+        if over_budget:
+            self._trim_disk()
+
+    def _trim_disk(self):
+        """扫描磁盘层：按写入时间从早到晚删除文件直至不超过上限，并以实际大小重置累计字节数"""
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith(".npy"):
+                full = os.path.join(self.disk_dir, name)
+                try:
+                    st_info = os.stat(full)
+                except OSError:
+                    continue
+                entries.append((st_info.st_mtime, st_info.st_size, full))
+        total = sum(size for _, size, _ in entries)
+        for _, size, full in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(full)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "spills": self.spills,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+# --------------------------
+# 进程级单例
+# --------------------------
+_SINGLETON_LOCK = threading.Lock()
+_DECODE_MEMO = None
+_TASK_MEMO = None
+_RESULT_CACHE = None
+_RESTORE_POOL = None
+
+def get_decode_memo() -> DecodeMemo:
+    global _DECODE_MEMO
+    with _SINGLETON_LOCK:
+        if _DECODE_MEMO is None:
+            _DECODE_MEMO = DecodeMemo()
+        return _DECODE_MEMO
+
+def get_task_memo() -> DecodeMemo:
+    """结果缓存中以压缩形式保存的任务输出，解码后按缓存键保留最近若干项，rerun 重新绘制时不重复解码"""
+    global _TASK_MEMO
+    with _SINGLETON_LOCK:
+        if _TASK_MEMO is None:
+            _TASK_MEMO = DecodeMemo(TASK_MEMO_ENTRIES)
+        return _TASK_MEMO
+
+def get_result_cache() -> ResultCache:
+    global _RESULT_CACHE
+    with _SINGLETON_LOCK:
+        if _RESULT_CACHE is None:
+            if RESULT_CACHE_DIR:
+                _RESULT_CACHE = ResultCache(RESULT_CACHE_MAX_BYTES, RESULT_CACHE_DIR, RESULT_CACHE_DISK_MAX_BYTES)
+            elif RESULT_CACHE_SPILL:
+                spill_dir = tempfile.mkdtemp(prefix="result_spill_")
+                atexit.register(shutil.rmtree, spill_dir, ignore_errors=True)
+                _RESULT_CACHE = ResultCache(RESULT_CACHE_MAX_BYTES, spill_dir, RESULT_CACHE_DISK_MAX_BYTES,
+                                            write_through=False)
+            else:
+                _RESULT_CACHE = ResultCache(RESULT_CACHE_MAX_BYTES)
+        return _RESULT_CACHE
+
+def get_restore_pool():
+    """进程级共享的复原进程池（spawn方式启动，避免在多线程进程中fork）；单进程配置时返回None"""
+    global _RESTORE_POOL
+    with _SINGLETON_LOCK:
+        if _RESTORE_POOL is None and RESTORE_POOL_WORKERS > 1:
+            _RESTORE_POOL = new_restore_pool(RESTORE_POOL_WORKERS)
+        return _RESTORE_POOL
+
+def new_restore_pool(workers: int) -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+def reset_restore_pool():
+    """子进程异常退出后进程池不可再用，丢弃单例以便下次重建"""
+    global _RESTORE_POOL
+    with _SINGLETON_LOCK:
+        if _RESTORE_POOL is not None:
+            _RESTORE_POOL.shutdown(wait=False, cancel_futures=True)
+        _RESTORE_POOL = None
+
+metrics.register_gauges("result_cache", lambda: get_result_cache().stats())
+
+# --------------------------
+# 流水线阶段
+# --------------------------
+def load_rgb(bytes_data: bytes, reduce: int = 1, file_key: str = None):
+    """解码为只读RGB数组（仅解码一次，按内容哈希缓存最近的解码结果），解码失败返回None"""
+    memo = get_decode_memo()
+    key = (file_key or content_key(bytes_data), reduce)
+    rgb = memo.get(key)
+    if rgb is None:
+        with metrics.timed("load", nbytes=len(bytes_data)):
+            rgb = restoration.decode_rgb(bytes_data, reduce)
+        if rgb is None:
+            return None
+        # 解码结果会被缓存复用，冻结数组避免调用方原地修改
+        rgb.flags.writeable = False
+        memo.put(key, rgb)
+    return rgb
+
+def run_restoration_model(rgb: np.ndarray, model_name: str) -> np.ndarray:
+    """使用常驻模型池中的复原模型处理RGB数组"""
+    model = models.get_pool().get(model_name)
+    with metrics.timed("restore", nbytes=rgb.nbytes, model=model_name):
+        return model(rgb, TILE_MEMORY_BUDGET)
+
+def restoration_choices() -> list:
+    """复原模型选项：“自动”路由 + 已注册的复原模型"""
+    return [routing.AUTO_MODEL] + models.model_names(models.RESTORATION)
+
+def route_cached(bytes_data: bytes, file_key: str = None):
+    """
+    “自动”模式的天气类型判断（在降采样解码的副本上计算），按内容缓存
+    返回 (模型名称, 置信度)；解码失败返回 (None, 0.0)
+    """
+    file_key = file_key or content_key(bytes_data)
+    key = make_result_key(file_key, "route", routing.AUTO_MODEL)
+    cache = get_result_cache()
+    cached = cache.get(key, record=False)
+    if cached is None:
+        rgb = load_rgb(bytes_data, reduce=routing.ROUTE_DECODE_REDUCE, file_key=file_key)
+        if rgb is None:
+            return None, 0.0
+        with metrics.timed("route", nbytes=len(bytes_data)):
+            model_name, confidence, _ = routing.classify(rgb)
+        cached = cache.put(key, np.array([restoration.MODEL_NAMES.index(model_name), confidence]))
+    return restoration.MODEL_NAMES[int(cached[0])], float(cached[1])
+
+def resolve_model(bytes_data: bytes, model_name: str, file_key: str = None):
+    """将“自动”解析为具体复原模型，返回 (模型名称, 置信度)；指定模型时置信度为 None"""
+    if model_name == routing.AUTO_MODEL:
+        return route_cached(bytes_data, file_key)
+    return model_name, None
+
+def restore_cached(bytes_data: bytes, model_name: str, file_key: str = None):
+    """
+    取单张图片的复原结果（优先读结果缓存，未命中时在当前进程复原并写入缓存），返回 (缓存键, RGB数组)
+    model_name 可为“自动”，此时先路由到具体模型，缓存键与直接选择该模型时相同
+    """
+    file_key = file_key or content_key(bytes_data)
+    model_name, _ = resolve_model(bytes_data, model_name, file_key)
+    if model_name is None:
+        return None, None
+    key = make_result_key(file_key, "restore", model_name)
+    cache = get_result_cache()
+    arr = cache.get(key)
+    if arr is None:
+        rgb = load_rgb(bytes_data, file_key=file_key)
+        if rgb is None:
+            return None, None
+        arr = cache.put(key, run_restoration_model(rgb, model_name))
+    return key, arr
+
+# --------------------------
+# 下游任务阶段图
+# --------------------------
+@dataclass(frozen=True)
+class TaskHead:
+    """
+    下游任务节点：推理输出（未经阈值/显示参数处理的原始结果）按 复原结果键+cache_stage 缓存；
+    render(restored, raw, out, **options) 将显示参数应用到原始结果并直接绘制到 out 上；
+    pack/unpack 给出时结果缓存中保存 pack(原始输出)，读取时经 unpack 还原（如类别图的游程编码）
+    """
+    metric_stage: str
+    cache_stage: str
+    render: Callable
+    pack: Callable = None
+    unpack: Callable = None
+
+def _render_detection(restored, raw, out, conf_threshold: float = 0.40, iou_threshold: float = 0.40,
+                      class_filter: str = None, **_):
+    dets = detection.filter_detections(raw, conf_threshold, iou_threshold)
+    return detection.draw_detections(restored, dets, class_filter, out=out)
+
+def _render_segmentation(restored, raw, out, opacity: float = segmentation.DEFAULT_OPACITY,
+                         class_filter: str = None, **_):
+    classes = None
+    if class_filter:
+        classes = [segmentation.CITYSCAPES_CLASSES.index(class_filter)] \
+            if class_filter in segmentation.CITYSCAPES_CLASSES else []
+    return segmentation.overlay_mask(restored, raw, opacity, classes, out=out)
+
+TASK_HEADS = {
+    DETECTION_MODEL: TaskHead("detect", "detect_raw", _render_detection),
+    SEGMENTATION_MODEL: TaskHead("segment", "segment_raw", _render_segmentation,
+                                 segmentation.rle_encode, segmentation.rle_decode),
+}
+
+def run_task_model(task: str, rgb: np.ndarray) -> np.ndarray:
+    """
+    下游任务推理（模型取自常驻模型池，输入直接为复原结果数组）
+    目标检测返回未经阈值过滤的原始检测 (N, 6)：x1, y1, x2, y2, score, class_id；场景分割返回 uint8 类别图
+    """
+    model = models.get_pool().get(task)
+    with metrics.timed(TASK_HEADS[task].metric_stage, nbytes=rgb.nbytes, model=task):
+        return model(rgb)
+
+def run_task_model_batch(task: str, rgbs: list) -> list:
+    """批量推理：模型提供 batch() 时一次前向处理多张（耗时按张数均摊计入指标），否则逐张推理"""
+    model = models.get_pool().get(task)
+    batch = getattr(model, "batch", None)
+    if batch is None:
+        return [run_task_model(task, rgb) for rgb in rgbs]
+    start = time.perf_counter()
+    raws = batch(rgbs)
+    share = (time.perf_counter() - start) / max(len(rgbs), 1)
+    for rgb in rgbs:
+        metrics.record(TASK_HEADS[task].metric_stage, share, rgb.nbytes, task)
+    return raws
+
+def task_raw_key(task: str, restored_key: str) -> str:
+    return make_result_key(restored_key, TASK_HEADS[task].cache_stage, task)
+
+def _store_task_raw(task: str, key: str, raw: np.ndarray) -> np.ndarray:
+    """写入结果缓存（需要时先压缩），返回可直接使用的原始输出"""
+    head = TASK_HEADS[task]
+    if head.pack is None:
+        return get_result_cache().put(key, raw)
+    get_result_cache().put(key, head.pack(raw))
+    raw.flags.writeable = False
+    get_task_memo().put(key, raw)
+    return raw
+
+def task_raw_lookup(task: str, key: str, record: bool = True):
+    """读取缓存的任务原始输出（压缩保存的先查解码后的备忘，再查结果缓存并解码），未命中返回None"""
+    head = TASK_HEADS[task]
+    if head.unpack is None:
+        return get_result_cache().get(key, record=record)
+    memo = get_task_memo()
+    raw = memo.get(key)
+    if raw is None:
+        packed = get_result_cache().get(key, record=record)
+        if packed is None:
+            return None
+        raw = head.unpack(packed)
+        raw.flags.writeable = False
+        memo.put(key, raw)
+    return raw
+
+def task_raw_cached(task: str, restored_key: str, restored_arr: np.ndarray):
+    """
+    对复原结果运行下游任务，缓存原始输出，返回 (缓存键, 原始输出)
+    键不含置信度/IOU阈值、透明度、类别过滤等显示参数：只调整这些参数时无需重新推理
+    """
+    key = task_raw_key(task, restored_key)
+    raw = task_raw_lookup(task, key)
+    if raw is None:
+        raw = _store_task_raw(task, key, run_task_model(task, restored_arr))
+    return key, raw
+
+def render_task(task: str, restored: np.ndarray, raw: np.ndarray, out: np.ndarray = None, **options) -> np.ndarray:
+    """
+    按显示参数绘制任务结果；out 为空时复制一次复原结果（缓存中的数组只读）后就地绘制，
+    给出可写的 out（如逐帧复原刚产生的数组本身）时不再复制
+    """
+    if out is None:
+        out = restored.copy()
+    return TASK_HEADS[task].render(restored, raw, out, **options)
+
+@dataclass
+class PipelineResult:
+    """阶段图一次运行的结果：实际复原模型与路由置信度、复原结果、任务原始输出及绘制结果"""
+    model: str
+    confidence: object
+    restored_key: str
+    restored: np.ndarray
+    raw_key: str = None
+    raw: np.ndarray = None
+    image: np.ndarray = None
+
+def run_pipeline(bytes_data: bytes, model_name: str, task: str = None, file_key: str = None,
+                 render: bool = True, **options):
+    """
+    解码（仅一次）-> 复原 -> 下游任务预处理/推理 -> 绘制，各阶段结果均走结果缓存
+    task 为空时只复原；render=False 时只推理不绘制；解码失败返回 None
+    """
+    start = time.perf_counter()
+    file_key = file_key or content_key(bytes_data)
+    model_name, confidence = resolve_model(bytes_data, model_name, file_key)
+    if model_name is None:
+        return None
+    restored_key, restored = restore_cached(bytes_data, model_name, file_key)
+    if restored is None:
+        return None
+    result = PipelineResult(model_name, confidence, restored_key, restored)
+    if task is not None:
+        result.raw_key, result.raw = task_raw_cached(task, restored_key, restored)
+        if render:
+            result.image = render_task(task, restored, result.raw, **options)
+    metrics.mark_startup("first_result", time.perf_counter() - start)
+    return result
+
+# --------------------------
+# 显示金字塔
+# --------------------------
+def _pyramid_key(result_key: str, max_side: int) -> str:
+    return make_result_key(result_key, "pyramid", "", side=max_side)
+
+def fit_side(arr: np.ndarray, max_side: int) -> np.ndarray:
+    """缩小到最长边不超过 max_side（INTER_AREA，不缓存）；原图不超过 max_side 时直接返回原图"""
+    h, w = arr.shape[:2]
+    if max(h, w) <= max_side:
+        return arr
+    scale = max_side / max(h, w)
+    return cv2.resize(arr, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+
+def display_level(result_key: str, arr: np.ndarray, max_side: int) -> np.ndarray:
+    """
+    取结果的显示级别（最长边不超过 max_side，INTER_AREA 缩小），按 结果键+尺寸 缓存
+    优先从已缓存的更大一级缩小，逐级生成的计算量远小于每级都从原图缩小；原图不超过 max_side 时直接返回原图
+    """
+    h, w = arr.shape[:2]
+    if max(h, w) <= max_side:
+        return arr
+    cache = get_result_cache()
+    key = _pyramid_key(result_key, max_side)
+    level = cache.get(key, record=False)
+    if level is not None:
+        return level
+    source = arr
+    for larger in sorted(PYRAMID_LEVELS):
+        if max_side < larger < max(h, w):
+            cached = cache.get(_pyramid_key(result_key, larger), record=False)
+            if cached is not None:
+                source = cached
+                break
+    if source is not arr:
+        # 从更大一级缩小时目标尺寸仍按原图计算，与直接从原图缩小的尺寸一致
+        scale = max_side / max(h, w)
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        return cache.put(key, cv2.resize(source, size, interpolation=cv2.INTER_AREA))
+    return cache.put(key, fit_side(arr, max_side))
+
+def build_pyramid(result_key: str, arr: np.ndarray):
+    """从大到小逐级生成并缓存全部显示级别"""
+    for max_side in PYRAMID_LEVELS:
+        display_level(result_key, arr, max_side)
+
+# --------------------------
+# 批量复原
+# --------------------------
+def make_batch_entries(items):
+    """
+    为每个输入（具有 name 属性）创建批量结果条目：
+    {"name", "key", "index", "done", "ok", "seconds", "model", "confidence", "state"}
+    seconds 为本次复原耗时（命中缓存时为 None）；model 为实际使用的复原模型，
+    “自动”模式下 confidence 为路由置信度（指定模型时为 None）；state 见 mark_unfinished
+    """
+    return [
+        {"name": item.name, "key": None, "index": idx + 1, "done": False, "ok": False, "seconds": None,
+         "model": None, "confidence": None, "state": None}
+        for idx, item in enumerate(items)
+    ]
+
+def mark_unfinished(entries, state: str):
+    """批量任务取消或失败后，把尚未处理到的条目标记为已结束，state 记录结束原因（如 "cancelled"/"failed"）"""
+    for entry in entries:
+        if not entry["done"]:
+            entry["done"] = True
+            entry["state"] = state
+
+def restore_batch(items, model_name: str, entries=None, on_result=None, pool="shared", max_in_flight=None,
+                  cancel_event=None, pyramid=False):
+    """
+    批量复原：items 为具有 name 属性与 getvalue() 方法的输入（上传文件或磁盘文件）
+    缓存命中直接复用，未命中的提交到进程池并行处理：pool 为 "shared"（默认）时使用共享进程池，
+    为 None 时在当前进程串行处理，也可传入自建的进程池；
+    同时在途的任务不超过 max_in_flight（默认为进程数的2倍），字节流在提交时才读取，内存占用与输入数量无关
+    on_result(entry, arr) 在每张图片完成时按完成顺序回调（解码失败时 arr 为 None）
+    cancel_event（threading.Event）置位后不再提交新图片，并撤回尚未开始的任务，未完成的条目保持 done=False
+    pyramid=True 时为每个结果生成显示金字塔（供界面显示缩略图）
+    从调用到第一张成功结果的耗时记为 "first_result" 阶段（进程内的第一次同时记入冷启动指标）
+    model_name 为“自动”时逐张路由到对应模型（见 route_cached），条目中记录实际模型与置信度
+    返回按输入顺序排列的结果条目列表（见 make_batch_entries）
+    """
+    cache = get_result_cache()
+    shared_pool = pool == "shared"
+    if shared_pool:
+        pool = get_restore_pool()
+    if entries is None:
+        entries = make_batch_entries(items)
+    batch_start = time.perf_counter()
+    first_pending = True
+
+    def finish(idx, key, arr, seconds=None):
+        nonlocal first_pending
+        entry = entries[idx]
+        entry["done"] = True
+        entry["seconds"] = seconds
+        if arr is not None:
+            if first_pending:
+                first_pending = False
+                elapsed = time.perf_counter() - batch_start
+                metrics.record("first_result", elapsed, model=model_name)
+                metrics.mark_startup("first_result", elapsed)
+            arr = cache.put(key, arr)
+            if pyramid:
+                build_pyramid(key, arr)
+            entry["key"] = key
+            entry["ok"] = True
+        if on_result is not None:
+            on_result(entry, arr)
+
+    def drain(pending, return_when):
+        done, _ = wait(pending, return_when=return_when)
+        for future in done:
+            idx, key, item_model, nbytes, submitted = pending.pop(future)
+            arr, seconds = future.result()
+            # 子进程返回纯复原耗时；“提交到完成”的耗时（含排队与传输）单独记录
+            if arr is not None:
+                metrics.record("restore", seconds, arr.nbytes, item_model)
+            metrics.record("restore_pool", time.perf_counter() - submitted, nbytes, item_model)
+            finish(idx, key, arr, seconds if arr is not None else None)
+
+    pending = {}
+    max_in_flight = max_in_flight or 2 * max(RESTORE_POOL_WORKERS, 1)
+    try:
+        for idx, item in enumerate(items):
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            bytes_data = item.getvalue()
+            file_key = content_key(bytes_data)
+            # “自动”模式：每张图片只路由到一个模型（路由在降采样副本上进行，开销远小于复原）
+            item_model, entries[idx]["confidence"] = resolve_model(bytes_data, model_name, file_key)
+            if item_model is None:
+                finish(idx, None, None)
+                continue
+            entries[idx]["model"] = item_model
+            key = make_result_key(file_key, "restore", item_model)
+            arr = cache.get(key)
+            if arr is not None:
+                finish(idx, key, arr)
+            elif pool is None:
+                rgb = load_rgb(bytes_data, file_key=file_key)
+                if rgb is None:
+                    finish(idx, key, None)
+                else:
+                    start = time.perf_counter()
+                    arr = run_restoration_model(rgb, item_model)
+                    finish(idx, key, arr, time.perf_counter() - start)
+            else:
+                if len(pending) >= max_in_flight:
+                    drain(pending, FIRST_COMPLETED)
+                future = pool.submit(models.restore_bytes, bytes_data, item_model, TILE_MEMORY_BUDGET)
+                pending[future] = (idx, key, item_model, len(bytes_data), time.perf_counter())
+        if cancel_event is not None and cancel_event.is_set():
+            for future in list(pending):
+                if future.cancel():
+                    del pending[future]
+        while pending:
+            drain(pending, FIRST_COMPLETED)
+    except BrokenProcessPool:
+        if shared_pool:
+            reset_restore_pool()
+        raise
+    return entries
+
+def task_batch(items, model_name: str, task: str, entries=None, on_restored=None, on_result=None,
+               pool="shared", max_in_flight=None, cancel_event=None, batch_size: int = None):
+    """
+    批量下游任务：经 restore_batch 复原（命中缓存直接复用，参数含义同 restore_batch），
+    复原结果按完成顺序凑满 batch_size 张后一次送入任务模型批量推理，推理与后续图片的复原在进程池中重叠进行
+    on_restored(entry, arr) 在每张图片复原完成时回调；on_result(entry, restored, raw) 在任务结果可用时回调
+    （复原失败时 restored 与 raw 均为 None）；条目中 raw_key 为任务原始输出的缓存键
+    返回按输入顺序排列的结果条目列表
+    """
+    batch_size = batch_size or TASK_BATCH_SIZE
+    pending = []
+
+    def flush():
+        raws = run_task_model_batch(task, [arr for _, _, arr in pending])
+        for (entry, key, arr), raw in zip(pending, raws):
+            entry["raw_key"] = key
+            if on_result is not None:
+                on_result(entry, arr, _store_task_raw(task, key, raw))
+        pending.clear()
+
+    def restored(entry, arr):
+        if on_restored is not None:
+            on_restored(entry, arr)
+        if arr is None:
+            if on_result is not None:
+                on_result(entry, None, None)
+            return
+        key = task_raw_key(task, entry["key"])
+        raw = task_raw_lookup(task, key)
+        if raw is not None:
+            entry["raw_key"] = key
+            if on_result is not None:
+                on_result(entry, arr, raw)
+            return
+        pending.append((entry, key, arr))
+        if len(pending) >= batch_size:
+            flush()
+
+    entries = restore_batch(items, model_name, entries=entries, on_result=restored, pool=pool,
+                            max_in_flight=max_in_flight, cancel_event=cancel_event)
+    if pending and not (cancel_event is not None and cancel_event.is_set()):
+        flush()
+    return entries
+
+# --------------------------
+# 质量评估
+# --------------------------
+def quality_cached(restored_key: str, restored: np.ndarray, reference_bytes: bytes = None) -> np.ndarray:
+    """单张复原结果的质量指标向量（见 quality.METRIC_NAMES），按 复原结果键+参考图哈希 缓存"""
+    ref_key = content_key(reference_bytes) if reference_bytes else ""
+    key = make_result_key(restored_key, "quality", "", ref=ref_key)
+    cache = get_result_cache()
+    scores = cache.get(key, record=False)
+    if scores is None:
+        reference = load_rgb(reference_bytes, file_key=ref_key) if reference_bytes else None
+        with metrics.timed("quality", nbytes=restored.nbytes):
+            scores = cache.put(key, quality.evaluate(restored, reference))
+    return scores
+
+def evaluate_batch(entries, references: dict = None, max_workers: int = None) -> list:
+    """
+    对批量复原结果并行计算质量指标（OpenCV/NumPy 运算释放GIL，线程池即可并行）
+    references 为 {条目名称: 参考图字节}；返回与 entries 对齐的指标向量列表，未成功复原或已被淘汰的为 None
+    """
+    cache = get_result_cache()
+    references = references or {}
+
+    def score(entry):
+        restored = cache.get(entry["key"]) if entry["ok"] else None
+        if restored is None:
+            return None
+        return quality_cached(entry["key"], restored, references.get(entry["name"]))
+
+    with ThreadPoolExecutor(max_workers=max_workers or max(RESTORE_POOL_WORKERS, 1)) as executor:
+        return list(executor.map(score, entries))
+
+# --------------------------
+# 冷启动预热
+# --------------------------
+def parse_sizes(text: str) -> list:
+    """解析“宽x高,宽x高”形式的尺寸列表（WARMUP_SIZES、benchmark.py --sizes），按书写顺序返回 [(w, h), ...]"""
+    sizes = []
+    for item in text.split(","):
+        if item.strip():
+            w, h = item.strip().lower().split("x")
+            sizes.append((int(w), int(h)))
+    return sizes
+
+def warm_up(sizes: list = None, tasks: bool = True) -> dict:
+    """
+    在第一位用户到来前预热：加载复原模型并在小图上各运行一次、生成（或映射）常见尺寸的频域掩膜，
+    sizes 为 [(h, w), ...]（默认取 WARMUP_SIZES）；tasks=True 时加载已提供权重的下游任务模型；
+    共享进程池的每个子进程各执行一次同样的预热
+    返回各步骤耗时（秒）与完成预热的子进程数，总耗时同时记入 "warm_up" 阶段与冷启动指标
+    """
+    sizes = [(h, w) for w, h in parse_sizes(WARMUP_SIZES)] if sizes is None else sizes
+    names = models.model_names(models.RESTORATION)
+    timings = {}
+    start = time.perf_counter()
+    models.warm_up(names, sizes)
+    timings["restoration"] = time.perf_counter() - start
+    if tasks:
+        step = time.perf_counter()
+        for task in TASK_HEADS:
+            try:
+                models.get_pool().get(task)
+            except FileNotFoundError:
+                continue
+        timings["tasks"] = time.perf_counter() - step
+    pool = get_restore_pool()
+    if pool is not None:
+        step = time.perf_counter()
+        # 子进程在提交任务时才启动：一次提交与进程数相同的预热任务，全部子进程随之启动并完成导入与模型加载
+        futures = [pool.submit(models.warm_up, names, sizes) for _ in range(RESTORE_POOL_WORKERS)]
+        try:
+            timings["pool_workers"] = len({future.result() for future in futures})
+        except BrokenProcessPool:
+            reset_restore_pool()
+            raise
+        timings["pool"] = time.perf_counter() - step
+    elapsed = time.perf_counter() - start
+    metrics.record("warm_up", elapsed)
+    metrics.mark_startup("warm_up", elapsed)
+    return timings
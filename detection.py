@@ -0,0 +1,221 @@
+"""
+目标检测核心（不依赖Streamlit）
+- LetterboxBlob：预分配的网络输入（letterbox 画布 + NCHW blob），检测与分割模型复用
+- OnnxDetector：OpenCV DNN 加载的 YOLO 系列 ONNX 检测器，输出未经阈值过滤的原始检测
+- filter_detections：置信度过滤 + 向量化 NMS，阈值变化时只需对缓存的原始检测重新过滤
+- draw_detections：在图像副本上绘制检测框与类别标签
+
+原始检测统一打包为 (N, 6) float32 数组：x1, y1, x2, y2, score, class_id（原图坐标）
+"""
+import threading
+
+import cv2
+import numpy as np
+
+# COCO 80 类名称（YOLO 系列预训练权重的默认类别顺序）
+COCO_CLASSES = (
+    "person", "bicycle", "car", "motorcycle", "airplane", "bus", "train", "truck", "boat",
+    "traffic light", "fire hydrant", "stop sign", "parking meter", "bench", "bird", "cat", "dog",
+    "horse", "sheep", "cow", "elephant", "bear", "zebra", "giraffe", "backpack", "umbrella",
+    "handbag", "tie", "suitcase", "frisbee", "skis", "snowboard", "sports ball", "kite",
+    "baseball bat", "baseball glove", "skateboard", "surfboard", "tennis racket", "bottle",
+    "wine glass", "cup", "fork", "knife", "spoon", "bowl", "banana", "apple", "sandwich", "orange",
+    "broccoli", "carrot", "hot dog", "pizza", "donut", "cake", "chair", "couch", "potted plant",
+    "bed", "dining table", "toilet", "tv", "laptop", "mouse", "remote", "keyboard", "cell phone",
+    "microwave", "oven", "toaster", "sink", "refrigerator", "book", "clock", "vase", "scissors",
+    "teddy bear", "hair drier", "toothbrush",
+)
+
+# 网络输入边长、原始检测保留的最低分数（低于该值的候选不会进入缓存）
+INPUT_SIZE = 640
+RAW_SCORE_FLOOR = 0.01
+# NMS 前按分数保留的最大候选数（IoU矩阵为 N×N，需限制规模）
+MAX_CANDIDATES = 3000
+# letterbox 填充颜色
+PAD_VALUE = 114
+
+def empty_detections() -> np.ndarray:
+    return np.zeros((0, 6), np.float32)
+
+def letterbox(rgb: np.ndarray, size: int = INPUT_SIZE, out: np.ndarray = None):
+    """
+    保持长宽比缩放并填充到 size×size，返回 (填充后图像, 缩放比例, (左侧填充, 上方填充))
+    out 为预分配的 (size, size, 3) uint8 画布时直接缩放写入其中，不另行分配
+    """
+    h, w = rgb.shape[:2]
+    scale = min(size / h, size / w)
+    nh, nw = max(1, round(h * scale)), max(1, round(w * scale))
+    canvas = np.empty((size, size, 3), np.uint8) if out is None else out
+    canvas.fill(PAD_VALUE)
+    top, left = (size - nh) // 2, (size - nw) // 2
+    cv2.resize(rgb, (nw, nh), dst=canvas[top:top + nh, left:left + nw], interpolation=cv2.INTER_LINEAR)
+    return canvas, scale, (left, top)
+
+class LetterboxBlob:
+    """
+    预分配的网络输入：letterbox 画布 (size, size, 3) uint8 与 NCHW float32 blob（最多 batch 张）只分配一次
+    load() 把RGB数组直接缩放写入画布，再按 (x/255 - mean) / std 归一化写入 blob 的指定位置，不经过 PIL、不逐张新建数组
+    非线程安全：由持有它的模型在推理锁内使用
+    """
+
+    def __init__(self, size: int, mean=(0.0, 0.0, 0.0), std=(1.0, 1.0, 1.0), batch: int = 1):
+        self.size = size
+        self.canvas = np.empty((size, size, 3), np.uint8)
+        self.blob = np.empty((batch, 3, size, size), np.float32)
+        std = np.asarray(std, np.float32).reshape(3, 1, 1)
+        self._scale = 1.0 / (255.0 * std)
+        self._offset = -np.asarray(mean, np.float32).reshape(3, 1, 1) / std
+        self._has_offset = bool(np.any(self._offset))
+
+    @property
+    def nbytes(self) -> int:
+        """预分配的画布与 blob 字节数"""
+        return self.canvas.nbytes + self.blob.nbytes
+
+    @property
+    def batch(self) -> int:
+        return self.blob.shape[0]
+
+    def load(self, rgb: np.ndarray, index: int = 0):
+        """写入画布与 blob[index]，返回 (缩放比例, (左侧填充, 上方填充))"""
+        _, scale, pad = letterbox(rgb, self.size, out=self.canvas)
+        # 画布转置为CHW视图后一次乘法写入blob
+        np.multiply(self.canvas.transpose(2, 0, 1), self._scale, out=self.blob[index])
+        if self._has_offset:
+            self.blob[index] += self._offset
+        return scale, pad
+
+def decode_yolo_output(output: np.ndarray, score_floor: float = RAW_SCORE_FLOOR) -> np.ndarray:
+    """
+    解析 YOLO 输出为 (N, 6) 原始检测（网络输入坐标）
+    兼容 YOLOv8 的 (1, 4+C, A) 与 YOLOv5 的 (1, A, 5+C)（含目标置信度）两种布局
+    """
+    pred = np.squeeze(output, axis=0)
+    if pred.shape[0] < pred.shape[1]:
+        # YOLOv8：(4+C, A) -> (A, 4+C)，无目标置信度
+        pred = pred.T
+        class_scores = pred[:, 4:]
+    else:
+        class_scores = pred[:, 5:] * pred[:, 4:5]
+    class_ids = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(class_scores)), class_ids]
+    keep = scores >= score_floor
+    cx, cy, bw, bh = pred[keep, 0], pred[keep, 1], pred[keep, 2], pred[keep, 3]
+    return np.stack(
+        [cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2, scores[keep], class_ids[keep]],
+        axis=1,
+    ).astype(np.float32)
+
+class OnnxDetector:
+    """
+    OpenCV DNN 封装的 YOLO ONNX 检测器，调用时返回原图坐标下的原始检测
+    输入 blob 预分配并复用；cv2.dnn 网络不支持并发推理，预处理+推理在锁内串行
+    """
+
+    def __init__(self, net, input_size: int = INPUT_SIZE, class_names=COCO_CLASSES):
+        self.net = net
+        self.input_size = input_size
+        self.class_names = class_names
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        # 输入已是RGB，无需交换通道
+        self._input = LetterboxBlob(input_size)
+        self._lock = threading.Lock()
+        # 常驻大小：预分配的输入缓冲；权重大小由加载函数在读取后加上（见 models.register_onnx_model）
+        self.nbytes = self._input.nbytes
+
+    def __call__(self, rgb: np.ndarray) -> np.ndarray:
+        with self._lock:
+            scale, (left, top) = self._input.load(rgb)
+            self.net.setInput(self._input.blob)
+            # forward 返回的数组可能引用网络内部缓冲区，在锁内解析为独立数组
+            raw = decode_yolo_output(self.net.forward())
+        # 还原到原图坐标
+        raw[:, [0, 2]] -= left
+        raw[:, [1, 3]] -= top
+        raw[:, :4] /= scale
+        h, w = rgb.shape[:2]
+        raw[:, [0, 2]] = np.clip(raw[:, [0, 2]], 0, w)
+        raw[:, [1, 3]] = np.clip(raw[:, [1, 3]], 0, h)
+        return raw
+
+def box_iou_matrix(boxes: np.ndarray) -> np.ndarray:
+    """两两IoU矩阵 (N, N)，全部由广播计算"""
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    inter_w = np.clip(np.minimum(x2[:, None], x2[None, :]) - np.maximum(x1[:, None], x1[None, :]), 0, None)
+    inter_h = np.clip(np.minimum(y2[:, None], y2[None, :]) - np.maximum(y1[:, None], y1[None, :]), 0, None)
+    inter = inter_w * inter_h
+    union = areas[:, None] + areas[None, :] - inter
+    return inter / np.maximum(union, 1e-9)
+
+def nms(boxes: np.ndarray, scores: np.ndarray, class_ids: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """
+    按类别的向量化NMS（Fast NMS）：按分数降序排列后，若某框与任一更高分的同类框IoU超过阈值则抑制
+    不同类别的框通过坐标偏移互不重叠，一次矩阵运算完成全部类别；返回保留框的下标（按分数降序）
+    """
+    if len(scores) == 0:
+        return np.zeros(0, np.int64)
+    order = np.argsort(-scores, kind="stable")[:MAX_CANDIDATES]
+    offset = (boxes.max() + 1.0) * class_ids[order].astype(np.float32)
+    shifted = boxes[order] + offset[:, None]
+    iou = np.triu(box_iou_matrix(shifted), k=1)
+    keep = iou.max(axis=0) <= iou_threshold
+    return order[keep]
+
+def filter_detections(raw: np.ndarray, conf_threshold: float, iou_threshold: float) -> np.ndarray:
+    """对原始检测应用置信度阈值与NMS，返回 (M, 6) 检测结果"""
+    if len(raw) == 0:
+        return empty_detections()
+    raw = raw[raw[:, 4] >= conf_threshold]
+    keep = nms(raw[:, :4], raw[:, 4], raw[:, 5].astype(np.int64), iou_threshold)
+    return raw[keep]
+
+def class_name(class_id: int, class_names=COCO_CLASSES) -> str:
+    return class_names[class_id] if 0 <= class_id < len(class_names) else f"class_{class_id}"
+
+def detected_classes(dets: np.ndarray, class_names=COCO_CLASSES) -> list:
+    """检测结果中出现的类别名称（按名称排序）"""
+    return sorted({class_name(int(c), class_names) for c in dets[:, 5]})
+
+def detections_to_json(dets: np.ndarray, class_names=COCO_CLASSES) -> list:
+    """将 (M, 6) 检测结果转换为可序列化的字典列表"""
+    return [
+        {
+            "box": [round(float(v), 1) for v in det[:4]],
+            "score": round(float(det[4]), 4),
+            "class": class_name(int(det[5]), class_names),
+        }
+        for det in dets
+    ]
+
+def _class_color(class_id: int):
+    """按类别生成稳定的绘制颜色（RGB）"""
+    hue = (class_id * 37) % 180
+    hsv = np.uint8([[[hue, 220, 255]]])
+    return tuple(int(c) for c in cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB)[0, 0])
+
+def draw_detections(rgb: np.ndarray, dets: np.ndarray, class_filter: str = None,
+                    class_names=COCO_CLASSES, out: np.ndarray = None) -> np.ndarray:
+    """
+    绘制检测框与"类别 分数"标签；class_filter 给定时只绘制该类别
+    out 为空时在输入副本上绘制（输入可为只读缓存数组）
+    """
+    if out is None:
+        out = rgb.copy()
+    thickness = max(1, round(max(out.shape[:2]) / 600))
+    font_scale = 0.4 * thickness
+    for x1, y1, x2, y2, score, cls in dets:
+        name = class_name(int(cls), class_names)
+        if class_filter and name != class_filter:
+            continue
+        color = _class_color(int(cls))
+        p1, p2 = (int(x1), int(y1)), (int(x2), int(y2))
+        cv2.rectangle(out, p1, p2, color, thickness, cv2.LINE_AA)
+        label = f"{name} {score:.2f}"
+        (tw, th), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+        label_top = max(p1[1] - th - baseline, 0)
+        cv2.rectangle(out, (p1[0], label_top), (p1[0] + tw, label_top + th + baseline), color, -1)
+        cv2.putText(out, label, (p1[0], label_top + th), cv2.FONT_HERSHEY_SIMPLEX, font_scale,
+                    (255, 255, 255), thickness, cv2.LINE_AA)
+    return out
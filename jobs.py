@@ -0,0 +1,163 @@
+"""
+后台任务队列（不依赖Streamlit）
+复原/检测以任务形式提交到进程内线程池执行，界面只在 session_state 中保存任务ID：
+- 脚本重跑（任意控件交互）不会打断或重复执行正在运行的任务，之后的重跑直接取回结果
+- 任务可取消：排队中的任务直接移除，运行中的任务在下一个检查点停止
+- 每个用户同时进行中的任务数有上限，避免单个用户占满全部计算资源
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import metrics
+
+# 同时运行的任务数（复原本身在进程池中并行，这里只是调度线程）
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 4))
+# 每个用户同时进行中（排队+运行）的任务数上限
+JOB_MAX_PER_USER = int(os.environ.get("JOB_MAX_PER_USER", 2))
+# 已结束任务的保留时长（秒），超时后清理
+JOB_RESULT_TTL = float(os.environ.get("JOB_RESULT_TTL", 600))
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+class JobLimitExceeded(Exception):
+    """用户进行中的任务数已达上限"""
+
+@dataclass
+class Job:
+    """
+    后台任务：fn(job) 在工作线程中执行，返回值保存在 result 中
+    fn 可通过 job.cancelled 检查取消标记，通过 job.advance() 报告进度；
+    payload 用于在任务运行期间向界面暴露部分结果
+    """
+    id: str
+    owner: str
+    kind: str
+    label: str
+    total: int = 0
+    done: int = 0
+    status: str = QUEUED
+    payload: dict = field(default_factory=dict)
+    result: object = None
+    error: str = ""
+    created_at: float = field(default_factory=time.time)
+    started_at: float = 0.0
+    finished_at: float = 0.0
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+    future: object = field(default=None, repr=False)
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE_STATES
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    @property
+    def progress(self) -> float:
+        # total 可能只是估计值（如视频容器记录的帧数），进度不超过1
+        return min(self.done / self.total, 1.0) if self.total else 0.0
+
+    @property
+    def elapsed(self) -> float:
+        if not self.started_at:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def advance(self, n: int = 1):
+        self.done += n
+
+class JobManager:
+    """进程级任务管理器：提交、查询、取消任务，并限制每个用户的并发任务数"""
+
+    def __init__(self, max_workers: int = JOB_WORKERS, max_per_user: int = JOB_MAX_PER_USER,
+                 result_ttl: float = JOB_RESULT_TTL):
+        self.max_per_user = max_per_user
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, owner: str, kind: str, fn, label: str = "", total: int = 0, payload: dict = None) -> Job:
+        """提交任务；用户进行中的任务数达到上限时抛出 JobLimitExceeded"""
+        with self._lock:
+            self._prune()
+            active = sum(job.active for job in self._jobs.values() if job.owner == owner)
+            if active >= self.max_per_user:
+                raise JobLimitExceeded(f"同时进行中的任务最多 {self.max_per_user} 个，请等待或取消已有任务")
+            job = Job(id=uuid.uuid4().hex[:12], owner=owner, kind=kind, label=label, total=total,
+                      payload=payload or {})
+            self._jobs[job.id] = job
+            job.future = self._executor.submit(self._run, job, fn)
+        return job
+
+    def _run(self, job: Job, fn):
+        if job.cancelled:
+            # 已出队但尚未开始时被取消（future.cancel() 已来不及）：同样标记为结束，不再占用用户的任务名额
+            job.status = CANCELLED
+            job.finished_at = time.time()
+            return
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            result = fn(job)
+        except Exception as e:
+            job.error = str(e) or type(e).__name__
+            job.status = FAILED
+        else:
+            job.result = result
+            job.status = CANCELLED if job.cancelled else DONE
+        finally:
+            job.finished_at = time.time()
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """取消任务：排队中的立即标记为已取消，运行中的由任务在下一个检查点自行停止"""
+        job = self.get(job_id)
+        if job is None or not job.active:
+            return False
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            job.status = CANCELLED
+            job.finished_at = time.time()
+        return True
+
+    def _prune(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if not job.active and job.finished_at and now - job.finished_at > self.result_ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        """各状态的任务数"""
+        with self._lock:
+            counts = dict.fromkeys((QUEUED, RUNNING, DONE, FAILED, CANCELLED), 0)
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+_MANAGER = None
+_MANAGER_LOCK = threading.Lock()
+
+def get_job_manager() -> JobManager:
+    global _MANAGER
+    with _MANAGER_LOCK:
+        if _MANAGER is None:
+            _MANAGER = JobManager()
+        return _MANAGER
+
+metrics.register_gauges("jobs", lambda: get_job_manager().stats())
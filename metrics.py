@@ -0,0 +1,238 @@
+"""
+运行指标（不依赖Streamlit）
+- 各阶段（解码、复原、检测、编码、脚本运行等）的调用次数、耗时、处理字节数，以及最近若干次耗时的分位数
+- 其他模块通过 register_gauges 注册的即时指标（结果缓存命中率、常驻模型、任务队列等）与进程内存高水位
+- prometheus_text() 输出 Prometheus 文本格式，供 HTTP 服务的 /metrics 接口使用
+- 按需记录 cProfile（.prof 可用 snakeviz / pstats 查看）
+- 冷启动指标：进程内首个登录页、首个结果、预热等事件的耗时，每个事件只记录第一次
+指标为进程级：进程池子进程中的耗时不计入，批量复原在主进程中按“提交到完成”计时
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows 无 resource 模块，不统计峰值内存
+    resource = None
+
+# 每个阶段保留最近多少次耗时用于计算分位数
+METRICS_WINDOW = int(os.environ.get("METRICS_WINDOW", 512))
+# cProfile 结果输出目录
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "restore_profiles"))
+# cProfile 结果最多保留的文件数，超出后删除最早的文件
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", 50))
+# Prometheus 指标名前缀
+METRIC_PREFIX = "weather_restore"
+# 输出的分位数及其在阶段统计快照中的键
+QUANTILES = ((0.5, "p50_seconds"), (0.95, "p95_seconds"))
+
+class StageStats:
+    """单个阶段（阶段名+模型名）的累计统计"""
+
+    def __init__(self, window: int):
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.nbytes = 0
+        self.recent = deque(maxlen=window)
+
+    def add(self, seconds: float, nbytes: int):
+        self.count += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.nbytes += nbytes
+        self.recent.append(seconds)
+
+    def quantile(self, q: float) -> float:
+        if not self.recent:
+            return 0.0
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class MetricsRegistry:
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.window = window
+        self._stages = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float, nbytes: int = 0, model: str = ""):
+        with self._lock:
+            stats = self._stages.get((stage, model))
+            if stats is None:
+                stats = self._stages[(stage, model)] = StageStats(self.window)
+            stats.add(seconds, nbytes)
+
+    @contextmanager
+    def timed(self, stage: str, nbytes: int = 0, model: str = ""):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start, nbytes, model)
+
+    def register_gauges(self, group: str, fn):
+        """注册即时指标：fn() 返回 {指标名: 数值}，在读取指标时调用"""
+        with self._lock:
+            self._gauges[group] = fn
+
+    def stages(self) -> list:
+        """各阶段统计快照（按阶段名、模型名排序）"""
+        with self._lock:
+            items = sorted(self._stages.items())
+            return [
+                {
+                    "stage": stage,
+                    "model": model,
+                    "count": stats.count,
+                    "seconds": stats.seconds,
+                    "mean_seconds": stats.seconds / stats.count if stats.count else 0.0,
+                    "p50_seconds": stats.quantile(0.5),
+                    "p95_seconds": stats.quantile(0.95),
+                    "max_seconds": stats.max_seconds,
+                    "nbytes": stats.nbytes,
+                }
+                for (stage, model), stats in items
+            ]
+
+    def gauges(self) -> dict:
+        """全部即时指标：{分组: {指标名: 数值}}，单个分组读取失败时跳过"""
+        with self._lock:
+            collectors = dict(self._gauges)
+        result = {"process": process_memory()}
+        for group, fn in sorted(collectors.items()):
+            try:
+                result[group] = fn()
+            except Exception:
+                continue
+        return result
+
+    def prometheus_text(self) -> str:
+        lines = []
+        stages = self.stages()
+        name = f"{METRIC_PREFIX}_stage_seconds"
+        lines += [f"# HELP {name} 各阶段耗时（秒），分位数基于最近 {self.window} 次", f"# TYPE {name} summary"]
+        for item in stages:
+            labels = _labels(stage=item["stage"], model=item["model"])
+            for q, key in QUANTILES:
+                quantile_labels = _labels(stage=item["stage"], model=item["model"], quantile=str(q))
+                lines.append(f"{name}{quantile_labels} {item[key]:.6f}")
+            lines.append(f"{name}_sum{labels} {item['seconds']:.6f}")
+            lines.append(f"{name}_count{labels} {item['count']}")
+        for suffix, key, kind in (("stage_max_seconds", "max_seconds", "gauge"),
+                                  ("stage_bytes_total", "nbytes", "counter")):
+            name = f"{METRIC_PREFIX}_{suffix}"
+            lines.append(f"# TYPE {name} {kind}")
+            for item in stages:
+                lines.append(f"{name}{_labels(stage=item['stage'], model=item['model'])} {item[key]}")
+        for group, values in self.gauges().items():
+            for key, value in sorted(values.items()):
+                if value is None:
+                    continue
+                name = f"{METRIC_PREFIX}_{group}_{key}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+def process_memory() -> dict:
+    """当前进程的常驻内存与高水位（字节）；平台不支持时对应项为 None"""
+    peak = None
+    if resource is not None:
+        # Linux 上 ru_maxrss 单位为 KB，macOS 上为字节
+        scale = 1 if sys.platform == "darwin" else 1024
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    rss = None
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    return {"rss_bytes": rss, "peak_rss_bytes": peak}
+
+# --------------------------
+# cProfile
+# --------------------------
+def start_profile():
+    """开始记录；已有其他分析器在运行时（Python 3.12 起同一进程只能启用一个）返回 None"""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return None
+    return profiler
+
+def stop_profile(profiler: cProfile.Profile, label: str = "run", top: int = 30) -> dict:
+    """停止记录并写出 .prof 文件，返回 {"path": 文件路径, "summary": 按累计耗时排序的前 top 项}"""
+    profiler.disable()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{label}_{time.strftime('%Y%m%d_%H%M%S')}_{os.getpid()}.prof")
+    profiler.dump_stats(path)
+    _trim_profiles()
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+    return {"path": path, "summary": out.getvalue()}
+
+def _trim_profiles():
+    """PROFILE_DIR 中的 .prof 文件超出 PROFILE_MAX_FILES 时删除修改时间最早的文件"""
+    files = []
+    for entry in os.scandir(PROFILE_DIR):
+        if entry.name.endswith(".prof"):
+            try:
+                files.append((entry.stat().st_mtime, entry.path))
+            except OSError:
+                continue
+    for _, path in sorted(files)[:max(len(files) - PROFILE_MAX_FILES, 0)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+# 进程级单例
+_REGISTRY = MetricsRegistry()
+
+def get_registry() -> MetricsRegistry:
+    return _REGISTRY
+
+def record(stage: str, seconds: float, nbytes: int = 0, model: str = ""):
+    _REGISTRY.record(stage, seconds, nbytes, model)
+
+def timed(stage: str, nbytes: int = 0, model: str = ""):
+    return _REGISTRY.timed(stage, nbytes, model)
+
+def register_gauges(group: str, fn):
+    _REGISTRY.register_gauges(group, fn)
+
+# --------------------------
+# 冷启动指标
+# --------------------------
+_STARTUP = {}
+_STARTUP_LOCK = threading.Lock()
+
+def mark_startup(event: str, seconds: float) -> bool:
+    """记录进程内首次发生的启动事件（如首个登录页、首个结果）的耗时（秒），已记录过时忽略并返回False"""
+    with _STARTUP_LOCK:
+        if event in _STARTUP:
+            return False
+        _STARTUP[event] = seconds
+        return True
+
+def startup_events() -> dict:
+    """{事件名_seconds: 耗时}，同时作为 "startup" 分组的即时指标输出"""
+    with _STARTUP_LOCK:
+        return {f"{event}_seconds": seconds for event, seconds in _STARTUP.items()}
+
+register_gauges("startup", startup_events)
@@ -0,0 +1,260 @@
+"""
+模型注册表与常驻模型池（不依赖Streamlit）
+- 注册表：模型名称 -> 加载函数，侧边栏的复原模型与下游任务选项均由此生成
+- 模型池：首次使用时懒加载，进程内常驻复用；常驻大小在加载后与每次取用时测量，超出内存上限时按LRU淘汰
+Streamlit 每次 rerun 只会重新执行 app.py，本模块的进程级单例在多次 rerun 与多个会话之间共享
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable
+
+import cv2
+import numpy as np
+
+import detection
+import metrics
+import restoration
+import segmentation
+
+# 模型种类
+RESTORATION = "restoration"
+DETECTION = "detection"
+SEGMENTATION = "segmentation"
+
+# 模型池内存上限（字节）
+MODEL_POOL_MAX_BYTES = int(os.environ.get("MODEL_POOL_MAX_BYTES", 2 * 1024 * 1024 * 1024))
+# 目标检测 ONNX 权重路径（YOLOv5/YOLOv8 导出的 COCO 检测模型）
+DETECTION_ONNX = os.environ.get("DETECTION_ONNX", os.path.join("weights", "yolov8n.onnx"))
+# 场景分割 ONNX 权重路径（Cityscapes 19 类语义分割模型，如 DeepLabV3 导出）
+SEGMENTATION_ONNX = os.environ.get("SEGMENTATION_ONNX", os.path.join("weights", "deeplabv3_cityscapes.onnx"))
+
+@dataclass
+class ModelSpec:
+    """注册表条目：名称、种类、加载函数，以及模型不提供 nbytes 时使用的常驻大小估计（字节）"""
+    name: str
+    kind: str
+    loader: Callable[[], object]
+    size_hint: int = 0
+
+@dataclass
+class LoadedModel:
+    """模型池中的常驻模型及其加载耗时、常驻大小与使用次数"""
+    spec: ModelSpec
+    model: object
+    nbytes: int
+    load_seconds: float
+    uses: int = 0
+
+_REGISTRY = OrderedDict()
+
+def register_model(name: str, kind: str, loader: Callable[[], object], size_hint: int = 0):
+    """注册（或覆盖）一个模型加载函数，加载函数只会在首次使用时调用"""
+    _REGISTRY[name] = ModelSpec(name, kind, loader, size_hint)
+
+def register_onnx_model(name: str, kind: str, path: str, wrap: Callable[[object], object] = None):
+    """
+    注册ONNX模型：首次使用时由 cv2.dnn 读取权重，wrap(net) 可将网络封装为可调用模型
+    常驻大小在读取后测量（权重文件大小 + 封装对象自身的缓冲），权重可在进程启动之后再放入
+    """
+    def loader():
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"未找到模型权重：{path}")
+        net = cv2.dnn.readNetFromONNX(path)
+        if wrap is None:
+            return net
+        model = wrap(net)
+        model.nbytes = estimate_nbytes(model) + os.path.getsize(path)
+        return model
+    register_model(name, kind, loader)
+
+def model_names(kind: str) -> list:
+    """按注册顺序返回某一种类的全部模型名称"""
+    return [spec.name for spec in _REGISTRY.values() if spec.kind == kind]
+
+def get_spec(name: str) -> ModelSpec:
+    if name not in _REGISTRY:
+        raise KeyError(f"未注册的模型：{name}（已注册 {list(_REGISTRY)}）")
+    return _REGISTRY[name]
+
+def estimate_nbytes(model, size_hint: int = 0) -> int:
+    """估计模型常驻内存：优先使用模型自身的 nbytes（可随使用增长，如频域掩膜缓存），其次为注册时给出的估计值"""
+    nbytes = getattr(model, "nbytes", None)
+    if isinstance(nbytes, (int, np.integer)) and nbytes > 0:
+        return int(nbytes)
+    return size_hint
+
+def release(model):
+    """模型被淘汰或卸载时释放其自身持有的缓存（模型提供 release() 时）"""
+    release_fn = getattr(model, "release", None)
+    if release_fn is not None:
+        release_fn()
+
+class ModelPool:
+    """
+    进程级常驻模型池：懒加载、同名模型只加载一次、按常驻字节数做LRU淘汰
+    常驻大小在加载后测量，并在每次取用时重新测量（模型的缓存会随处理的图像尺寸增长）
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._models = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def _load_lock(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._load_locks.setdefault(name, threading.Lock())
+
+    def _lookup(self, name: str):
+        with self._lock:
+            loaded = self._models.get(name)
+            if loaded is not None:
+                self._models.move_to_end(name)
+                loaded.uses += 1
+                evicted = self._enforce_limit()
+            else:
+                evicted = []
+        for old in evicted:
+            release(old.model)
+        return loaded
+
+    def _measure(self):
+        """重新测量各模型的常驻大小与总字节数；需持有 _lock"""
+        for loaded in self._models.values():
+            loaded.nbytes = estimate_nbytes(loaded.model, loaded.spec.size_hint)
+        self._bytes = sum(loaded.nbytes for loaded in self._models.values())
+
+    def _enforce_limit(self) -> list:
+        """重新测量后超出上限时淘汰最久未使用的模型（最近使用的始终保留），返回被淘汰的模型；需持有 _lock"""
+        self._measure()
+        evicted = []
+        while self._bytes > self.max_bytes and len(self._models) > 1:
+            _, old = self._models.popitem(last=False)
+            self._bytes -= old.nbytes
+            evicted.append(old)
+        return evicted
+
+    def get(self, name: str):
+        """返回常驻模型，未加载时调用注册的加载函数（并发请求同一模型时只加载一次）"""
+        loaded = self._lookup(name)
+        if loaded is not None:
+            return loaded.model
+        with self._load_lock(name):
+            loaded = self._lookup(name)
+            if loaded is not None:
+                return loaded.model
+            spec = get_spec(name)
+            start = time.perf_counter()
+            model = spec.loader()
+            loaded = LoadedModel(
+                spec=spec,
+                model=model,
+                nbytes=estimate_nbytes(model, spec.size_hint),
+                load_seconds=time.perf_counter() - start,
+                uses=1,
+            )
+            with self._lock:
+                self._models[name] = loaded
+                # 淘汰最久未使用的模型，刚加载的模型始终保留
+                evicted = self._enforce_limit()
+            for old in evicted:
+                release(old.model)
+            return model
+
+    def evict(self, name: str):
+        """卸载常驻模型（管理员操作）：释放内存，下次使用时按注册的加载函数重新加载"""
+        with self._lock:
+            loaded = self._models.pop(name, None)
+            if loaded is not None:
+                self._bytes -= loaded.nbytes
+        if loaded is not None:
+            release(loaded.model)
+
+    def stats(self) -> list:
+        """每个常驻模型的名称、种类、加载耗时（秒）、常驻大小（字节，当前测量值）与使用次数"""
+        with self._lock:
+            self._measure()
+            return [
+                {
+                    "name": loaded.spec.name,
+                    "kind": loaded.spec.kind,
+                    "load_seconds": loaded.load_seconds,
+                    "nbytes": loaded.nbytes,
+                    "uses": loaded.uses,
+                }
+                for loaded in self._models.values()
+            ]
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+def get_pool() -> ModelPool:
+    """进程级模型池单例（Streamlit进程与进程池子进程各自持有一个）"""
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = ModelPool(MODEL_POOL_MAX_BYTES)
+        return _POOL
+
+def _pool_gauges() -> dict:
+    stats = get_pool().stats()
+    return {"loaded": len(stats), "bytes": sum(item["nbytes"] for item in stats)}
+
+metrics.register_gauges("model_pool", _pool_gauges)
+
+# --------------------------
+# 内置模型
+# --------------------------
+class FrequencyRestorer:
+    """
+    频域复原引擎的模型封装；频域掩膜在首次处理某尺寸时生成并缓存，
+    常驻大小即当前缓存的掩膜字节数，被模型池淘汰时释放这些掩膜
+    """
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    @property
+    def nbytes(self) -> int:
+        return restoration.mask_cache_nbytes(self.model_name)
+
+    def release(self):
+        restoration.clear_mask_cache(self.model_name)
+
+    def __call__(self, rgb: np.ndarray, memory_budget: int = None) -> np.ndarray:
+        return restoration.restore_array(rgb, self.model_name, memory_budget)
+
+for _name in restoration.MODEL_NAMES:
+    register_model(_name, RESTORATION, lambda name=_name: FrequencyRestorer(name))
+register_onnx_model("目标检测", DETECTION, DETECTION_ONNX, wrap=detection.OnnxDetector)
+register_onnx_model("场景分割", SEGMENTATION, SEGMENTATION_ONNX, wrap=segmentation.OnnxSegmenter)
+
+def restore_bytes(bytes_data: bytes, model_name: str, memory_budget: int = None):
+    """
+    进程池工作函数：解码+复原（模型取自本进程的常驻模型池）
+    返回 (复原结果, 复原耗时秒)，耗时不含解码，供主进程记录指标；解码失败返回 (None, 0.0)
+    """
+    rgb = restoration.decode_rgb(bytes_data)
+    if rgb is None:
+        return None, 0.0
+    model = get_pool().get(model_name)
+    start = time.perf_counter()
+    arr = model(rgb, memory_budget)
+    return arr, time.perf_counter() - start
+
+def warm_up(model_names, sizes=()) -> int:
+    """
+    预热函数（也作为进程池任务在子进程中执行）：加载常驻模型并在小图上各运行一次，
+    按给定的 (h, w) 尺寸预先生成或映射频域掩膜；返回执行预热的进程号
+    """
+    pool = get_pool()
+    probe = np.zeros((64, 64, 3), np.uint8)
+    for name in model_names:
+        pool.get(name)(probe)
+    for h, w in sizes:
+        restoration.warm_masks(h, w)
+    return os.getpid()
@@ -0,0 +1,66 @@
+"""
+复原质量评估（不依赖Streamlit）
+- 有参考指标：PSNR、SSIM（上传与退化图同名的清晰参考图时计算）
+- 无参考指标：清晰度（拉普拉斯方差，越大越清晰）、雾浓度（暗通道均值，越小雾越少）
+全部为整图向量化运算，SSIM 用盒式滤波计算局部均值/方差/协方差，不做逐像素循环
+"""
+import cv2
+import numpy as np
+
+import restoration
+
+# SSIM 局部窗口边长与稳定常数（按 8 位动态范围）
+SSIM_WINDOW = 7
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
+
+# 评估结果向量中各指标的顺序（缺少参考图时 PSNR/SSIM 为 NaN）
+METRIC_NAMES = ("psnr", "ssim", "sharpness", "haze")
+
+def luminance(rgb: np.ndarray) -> np.ndarray:
+    """RGB uint8 -> float32 亮度（BT.601）"""
+    return cv2.cvtColor(np.asarray(rgb), cv2.COLOR_RGB2GRAY).astype(np.float32)
+
+def psnr(restored: np.ndarray, reference: np.ndarray) -> float:
+    """峰值信噪比（dB），两图完全一致时返回 inf"""
+    diff = restored.astype(np.float32) - reference.astype(np.float32)
+    mse = float(np.mean(diff * diff))
+    return float("inf") if mse == 0 else 10.0 * np.log10(255.0 ** 2 / mse)
+
+def ssim(restored: np.ndarray, reference: np.ndarray, window: int = SSIM_WINDOW) -> float:
+    """亮度通道上的平均结构相似度，局部统计量由盒式滤波一次性求出"""
+    x = luminance(restored)
+    y = luminance(reference)
+    size = (window, window)
+    mu_x = cv2.boxFilter(x, -1, size)
+    mu_y = cv2.boxFilter(y, -1, size)
+    var_x = cv2.boxFilter(x * x, -1, size) - mu_x * mu_x
+    var_y = cv2.boxFilter(y * y, -1, size) - mu_y * mu_y
+    cov = cv2.boxFilter(x * y, -1, size) - mu_x * mu_y
+    numerator = (2.0 * mu_x * mu_y + SSIM_C1) * (2.0 * cov + SSIM_C2)
+    denominator = (mu_x * mu_x + mu_y * mu_y + SSIM_C1) * (var_x + var_y + SSIM_C2)
+    return float(np.mean(numerator / denominator))
+
+def sharpness(rgb: np.ndarray) -> float:
+    """拉普拉斯响应的方差"""
+    return float(cv2.Laplacian(luminance(rgb), cv2.CV_32F).var())
+
+def haze_density(rgb: np.ndarray) -> float:
+    """暗通道均值（0-1）：无雾图像的暗通道接近0，雾越浓越接近1"""
+    dark = cv2.erode(np.asarray(rgb).min(axis=2), restoration.min_filter_kernel(restoration.HAZE_PATCH))
+    return float(dark.mean()) / 255.0
+
+def evaluate(restored: np.ndarray, reference: np.ndarray = None) -> np.ndarray:
+    """
+    计算全部指标，返回 float64 向量（顺序见 METRIC_NAMES），便于写入结果缓存
+    参考图尺寸与复原结果不同时先缩放到复原结果尺寸
+    """
+    scores = np.full(len(METRIC_NAMES), np.nan)
+    if reference is not None:
+        if reference.shape[:2] != restored.shape[:2]:
+            reference = cv2.resize(reference, (restored.shape[1], restored.shape[0]), interpolation=cv2.INTER_AREA)
+        scores[0] = psnr(restored, reference)
+        scores[1] = ssim(restored, reference)
+    scores[2] = sharpness(restored)
+    scores[3] = haze_density(restored)
+    return scores
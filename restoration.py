@@ -0,0 +1,400 @@
+"""
+图像复原核心（不依赖Streamlit）
+该模块可被进程池子进程直接导入，供批量复原并行调用
+
+复原引擎均为向量化的 NumPy/OpenCV 实现：
+- 去雨：亮度通道频域楔形带通提取雨线分量（雨线近似竖直，能量集中在水平频率轴附近），软阈值后扣除
+- 去雾：暗通道先验估计大气光与透射率，低分辨率导向滤波细化后上采样恢复
+- 去雪：亮度通道频域环形带通提取雪花斑点分量（各向同性），仅扣除高于阈值的亮斑
+频域掩膜与形态学核按图像尺寸缓存，同尺寸的图片只生成一次；频域掩膜同时写入磁盘产物缓存（见 artifacts 模块），
+之后的进程与进程池子进程直接内存映射读取，不再重复生成
+
+超大图像按内存预算切分为重叠分块逐块（或多线程）处理，接缝处线性羽化融合：
+内存预算约束的是复原过程中的浮点工作内存；各块直接融合写入一份 uint8 输出数组，不再额外分配整幅浮点缓冲，
+但输出数组本身仍为整幅大小、驻留内存（进程池中复原时随结果返回主进程）
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+import artifacts
+
+# 解码倍率 -> OpenCV 读取标志（IMREAD_REDUCED_* 在解码阶段直接降采样，仅用于预览）
+DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# 复原模型名称（与侧边栏选项一致）
+DERAIN_MODEL = "去雨模型"
+DEHAZE_MODEL = "去雾模型"
+DESNOW_MODEL = "去雪模型"
+MODEL_NAMES = (DERAIN_MODEL, DEHAZE_MODEL, DESNOW_MODEL)
+
+# 去雨参数：楔形半角（度）、高通截止半径（周期/像素）、软阈值与扣除强度
+RAIN_WEDGE_DEG = 12.0
+RAIN_MIN_RADIUS = 0.04
+RAIN_THRESHOLD = 0.02
+RAIN_STRENGTH = 1.0
+# 去雪参数：环形带通上下截止半径（周期/像素）、软阈值与扣除强度
+SNOW_LOW_RADIUS = 0.03
+SNOW_HIGH_RADIUS = 0.30
+SNOW_THRESHOLD = 0.04
+SNOW_STRENGTH = 1.0
+# 去雾参数：暗通道窗口、去雾程度、最小透射率、估计分辨率、导向滤波半径与正则
+HAZE_PATCH = 15
+HAZE_OMEGA = 0.95
+HAZE_T0 = 0.1
+HAZE_WORK_SIDE = 768
+HAZE_GUIDE_RADIUS = 24
+HAZE_GUIDE_EPS = 1e-3
+# 大气光估计取暗通道最亮像素的比例
+HAZE_TOP_RATIO = 0.001
+# 分块处理：复原算法每像素的峰值工作内存估计（字节）、相邻块重叠宽度与最小块边长（像素）
+WORKING_BYTES_PER_PIXEL = 48
+TILE_OVERLAP = 64
+MIN_TILE_SIDE = 256
+
+def decode_rgb(bytes_data: bytes, reduce: int = 1):
+    """将字节流解码为连续的RGB ndarray，解码失败返回None"""
+    if reduce not in DECODE_FLAGS:
+        raise ValueError(f"不支持的解码倍率：{reduce}（可选 {sorted(DECODE_FLAGS)}）")
+    rgb = cv2.imdecode(np.frombuffer(bytes_data, np.uint8), DECODE_FLAGS[reduce])
+    if rgb is None:
+        return None
+    # 原地 BGR->RGB，不再额外分配整幅缓冲
+    cv2.cvtColor(rgb, cv2.COLOR_BGR2RGB, dst=rgb)
+    return np.ascontiguousarray(rgb)
+
+# --------------------------
+# 频域掩膜（按尺寸缓存）
+# --------------------------
+def _freq_grid(h: int, w: int):
+    """返回未移频布局下的 (|fy|, |fx|, 半径) 网格，单位为周期/像素"""
+    fy = np.abs(np.fft.fftfreq(h).astype(np.float32))[:, None]
+    fx = np.abs(np.fft.fftfreq(w).astype(np.float32))[None, :]
+    radius = np.sqrt(fy * fy + fx * fx)
+    return fy, fx, radius
+
+def _freeze(mask: np.ndarray) -> np.ndarray:
+    mask = np.ascontiguousarray(mask[:, :, None], dtype=np.float32)
+    mask.flags.writeable = False
+    return mask
+
+class MaskCache:
+    """按尺寸缓存频域掩膜的小型LRU（线程安全），可统计与释放所占内存（供模型池计算常驻大小）"""
+
+    def __init__(self, max_entries: int = 8):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        mask = build()
+        with self._lock:
+            self._items[key] = mask
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+        return mask
+
+    @property
+    def nbytes(self) -> int:
+        with self._lock:
+            return sum(mask.nbytes for mask in self._items.values())
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+_RAIN_MASKS = MaskCache()
+_SNOW_MASKS = MaskCache()
+
+def rain_mask(h: int, w: int) -> np.ndarray:
+    """去雨楔形带通掩膜 (h, w, 1)：保留水平频率轴附近、半径大于截止频率的能量"""
+    def build():
+        fy, fx, radius = _freq_grid(h, w)
+        theta = np.arctan2(fy, fx)
+        wedge = np.exp(-(theta / np.deg2rad(RAIN_WEDGE_DEG)) ** 2)
+        highpass = 1.0 - np.exp(-(radius / RAIN_MIN_RADIUS) ** 2)
+        return _freeze(wedge * highpass)
+    return _RAIN_MASKS.get((h, w), lambda: artifacts.load_or_build(
+        "rain_mask", (h, w, RAIN_WEDGE_DEG, RAIN_MIN_RADIUS), build))
+
+def snow_mask(h: int, w: int) -> np.ndarray:
+    """去雪环形带通掩膜 (h, w, 1)：各向同性地保留雪花尺度的中高频能量"""
+    def build():
+        _, _, radius = _freq_grid(h, w)
+        highpass = 1.0 - np.exp(-(radius / SNOW_LOW_RADIUS) ** 2)
+        lowpass = np.exp(-(radius / SNOW_HIGH_RADIUS) ** 2)
+        return _freeze(highpass * lowpass)
+    return _SNOW_MASKS.get((h, w), lambda: artifacts.load_or_build(
+        "snow_mask", (h, w, SNOW_LOW_RADIUS, SNOW_HIGH_RADIUS), build))
+
+@lru_cache(maxsize=4)
+def min_filter_kernel(size: int) -> np.ndarray:
+    """暗通道最小值滤波所用的矩形结构元素"""
+    return cv2.getStructuringElement(cv2.MORPH_RECT, (size, size))
+
+def warm_masks(h: int, w: int):
+    """按复原时使用的 DFT 尺寸预先生成（或从产物缓存映射）h×w 图像的去雨/去雪掩膜"""
+    ph, pw = cv2.getOptimalDFTSize(h), cv2.getOptimalDFTSize(w)
+    rain_mask(ph, pw)
+    snow_mask(ph, pw)
+
+def spectral_component(gray: np.ndarray, mask_fn) -> np.ndarray:
+    """对单通道float32图像做频域滤波，返回与输入同尺寸的带通分量"""
+    h, w = gray.shape
+    ph, pw = cv2.getOptimalDFTSize(h), cv2.getOptimalDFTSize(w)
+    padded = cv2.copyMakeBorder(gray, 0, ph - h, 0, pw - w, cv2.BORDER_REFLECT)
+    spectrum = cv2.dft(padded, flags=cv2.DFT_COMPLEX_OUTPUT)
+    spectrum *= mask_fn(ph, pw)
+    component = cv2.idft(spectrum, flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT)
+    return component[:h, :w]
+
+def _suppress_bright_component(rgb: np.ndarray, mask_fn, threshold: float, strength: float) -> np.ndarray:
+    """提取亮度通道的带通分量，只扣除高于阈值的正向（偏亮）部分，雨线/雪花均为近白色故对三通道等量扣除"""
+    gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY).astype(np.float32) * (1.0 / 255.0)
+    component = spectral_component(gray, mask_fn)
+    np.subtract(component, threshold, out=component)
+    np.maximum(component, 0.0, out=component)
+    component *= 255.0 * strength
+    out = rgb.astype(np.float32)
+    out -= component[:, :, None]
+    return np.clip(out, 0, 255).astype(np.uint8)
+
+# --------------------------
+# 复原算法
+# --------------------------
+def derain(rgb: np.ndarray) -> np.ndarray:
+    """频域楔形陷波去雨"""
+    return _suppress_bright_component(rgb, rain_mask, RAIN_THRESHOLD, RAIN_STRENGTH)
+
+def desnow(rgb: np.ndarray) -> np.ndarray:
+    """频域环形带通去雪"""
+    return _suppress_bright_component(rgb, snow_mask, SNOW_THRESHOLD, SNOW_STRENGTH)
+
+def _box(img: np.ndarray, radius: int) -> np.ndarray:
+    return cv2.boxFilter(img, -1, (2 * radius + 1, 2 * radius + 1), borderType=cv2.BORDER_REFLECT)
+
+def guided_filter_coeffs(guide: np.ndarray, src: np.ndarray, radius: int, eps: float):
+    """导向滤波线性系数 (a, b)，输出为 a*guide + b；全部由盒式滤波实现"""
+    mean_i = _box(guide, radius)
+    mean_p = _box(src, radius)
+    cov_ip = _box(guide * src, radius) - mean_i * mean_p
+    var_i = _box(guide * guide, radius) - mean_i * mean_i
+    a = cov_ip / (var_i + eps)
+    b = mean_p - a * mean_i
+    return _box(a, radius), _box(b, radius)
+
+def _downscale_for_haze(rgb: np.ndarray):
+    """缩放到去雾估计分辨率并归一化为float32，返回 (small, scale)"""
+    h, w = rgb.shape[:2]
+    scale = min(1.0, HAZE_WORK_SIDE / max(h, w))
+    small = rgb if scale == 1.0 else cv2.resize(
+        rgb, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA
+    )
+    return small.astype(np.float32) * (1.0 / 255.0), scale
+
+def _atmosphere_from_small(small: np.ndarray) -> np.ndarray:
+    """大气光：暗通道最亮的前0.1%像素的平均颜色"""
+    dark = cv2.erode(small.min(axis=2), min_filter_kernel(HAZE_PATCH))
+    n_top = max(1, int(dark.size * HAZE_TOP_RATIO))
+    top_idx = np.argpartition(dark.ravel(), -n_top)[-n_top:]
+    return np.maximum(small.reshape(-1, 3)[top_idx].mean(axis=0), 1e-3)
+
+@dataclass(frozen=True)
+class HazeEstimate:
+    """
+    整幅图像的去雾估计：大气光与低分辨率导向滤波系数 (a, b)，透射率 = a·灰度引导图 + b
+    分块复原时各块共用、视频增量复原时在帧间复用，各块的透射率与整幅处理一致，不产生接缝
+    """
+    atmosphere: np.ndarray
+    a: np.ndarray
+    b: np.ndarray
+    shape: tuple
+
+def estimate_haze(rgb: np.ndarray, atmosphere: np.ndarray = None) -> HazeEstimate:
+    """在降采样图上估计大气光与透射率：粗透射率 + 以灰度图为引导的导向滤波细化（只求系数）"""
+    small, scale = _downscale_for_haze(rgb)
+    if atmosphere is None:
+        atmosphere = _atmosphere_from_small(small)
+    t_coarse = 1.0 - HAZE_OMEGA * cv2.erode((small / atmosphere).min(axis=2), min_filter_kernel(HAZE_PATCH))
+    guide_small = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+    radius = max(1, round(HAZE_GUIDE_RADIUS * scale))
+    a, b = guided_filter_coeffs(guide_small, t_coarse.astype(np.float32), radius, HAZE_GUIDE_EPS)
+    return HazeEstimate(atmosphere.astype(np.float32), a, b, rgb.shape[:2])
+
+def _region_coeffs(estimate: HazeEstimate, y0: int, x0: int, h: int, w: int):
+    """
+    导向滤波系数在整幅图像 [y0, y0+h)×[x0, x0+w) 区域上的全分辨率值
+    整幅区域直接双线性放大；局部区域按相同的像素中心对应关系重映射（超出图像的部分取边缘值）
+    """
+    sh, sw = estimate.a.shape
+    full_h, full_w = estimate.shape
+    if (y0, x0, h, w) == (0, 0, full_h, full_w):
+        if (sh, sw) == (h, w):
+            return estimate.a, estimate.b
+        return (cv2.resize(estimate.a, (w, h), interpolation=cv2.INTER_LINEAR),
+                cv2.resize(estimate.b, (w, h), interpolation=cv2.INTER_LINEAR))
+    map_x = (np.arange(x0, x0 + w, dtype=np.float32) + 0.5) * (sw / full_w) - 0.5
+    map_y = (np.arange(y0, y0 + h, dtype=np.float32) + 0.5) * (sh / full_h) - 0.5
+    map_x, map_y = np.meshgrid(map_x, map_y)
+    return tuple(cv2.remap(coeff, map_x, map_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+                 for coeff in (estimate.a, estimate.b))
+
+def dehaze(rgb: np.ndarray, atmosphere: np.ndarray = None, estimate: HazeEstimate = None,
+           origin: tuple = (0, 0)) -> np.ndarray:
+    """
+    暗通道先验去雾：低分辨率估计大气光与透射率，快速导向滤波上采样到原分辨率
+    estimate 为整幅图像的估计（见 estimate_haze）时，rgb 为其中左上角位于 origin (y, x) 的一块
+    """
+    h, w = rgb.shape[:2]
+    if estimate is None:
+        estimate = estimate_haze(rgb, atmosphere)
+        origin = (0, 0)
+    a, b = _region_coeffs(estimate, origin[0], origin[1], h, w)
+
+    # 系数作用于全分辨率引导图
+    img = rgb.astype(np.float32) * (1.0 / 255.0)
+    guide = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+    transmission = np.clip(a * guide + b, HAZE_T0, 1.0)
+
+    atmosphere = estimate.atmosphere
+    img -= atmosphere
+    img /= transmission[:, :, None]
+    img += atmosphere
+    return np.clip(img * 255.0, 0, 255).astype(np.uint8)
+
+_RESTORERS = {
+    DERAIN_MODEL: derain,
+    DEHAZE_MODEL: dehaze,
+    DESNOW_MODEL: desnow,
+}
+
+# 各复原模型使用的频域掩膜缓存（去雾不使用频域掩膜）
+_MODEL_MASKS = {
+    DERAIN_MODEL: _RAIN_MASKS,
+    DESNOW_MODEL: _SNOW_MASKS,
+}
+
+def mask_cache_nbytes(model_name: str) -> int:
+    """某复原模型当前缓存的频域掩膜字节数"""
+    cache = _MODEL_MASKS.get(model_name)
+    return cache.nbytes if cache is not None else 0
+
+def clear_mask_cache(model_name: str):
+    """释放某复原模型缓存的频域掩膜（磁盘产物保留，再次使用时重新映射）"""
+    cache = _MODEL_MASKS.get(model_name)
+    if cache is not None:
+        cache.clear()
+
+def get_restorer(model_name: str):
+    """按模型名称返回复原函数 fn(rgb) -> rgb"""
+    if model_name not in _RESTORERS:
+        raise ValueError(f"未知的复原模型：{model_name}（可选 {list(MODEL_NAMES)}）")
+    return _RESTORERS[model_name]
+
+# --------------------------
+# 分块处理（内存受限）
+# --------------------------
+def tile_side_for_budget(memory_budget: int, workers: int = 1) -> int:
+    """根据内存预算与并行块数估算分块边长（含重叠）"""
+    per_worker = memory_budget / max(1, workers)
+    return max(MIN_TILE_SIDE, int(np.sqrt(per_worker / WORKING_BYTES_PER_PIXEL)))
+
+def _tile_spans(n: int, tile: int, overlap: int):
+    """
+    单一维度上均匀分布的分块区间 [(start, end), ...]：块数取边长不超过 tile 的最小值，
+    各块等长（最后一块截止于末端），相邻块恰好重叠 overlap
+    """
+    if n <= tile:
+        return [(0, n)]
+    count = -(-(n - overlap) // (tile - overlap))
+    stride = -(-(n - overlap) // count)
+    return [(i * stride, min(n, (i + 1) * stride + overlap)) for i in range(count)]
+
+def iter_tiles(h: int, w: int, tile: int, overlap: int = TILE_OVERLAP):
+    """
+    按行优先顺序生成重叠分块
+    每项为 (y0, y1, x0, x1, top, left)，top/left 为与上方/左侧已处理块的重叠宽度
+    """
+    xs = _tile_spans(w, tile, overlap)
+    prev_y1 = 0
+    for y0, y1 in _tile_spans(h, tile, overlap):
+        prev_x1 = 0
+        for x0, x1 in xs:
+            yield y0, y1, x0, x1, max(0, prev_y1 - y0), max(0, prev_x1 - x0)
+            prev_x1 = x1
+        prev_y1 = y1
+
+def _ramp(n: int, width: int) -> np.ndarray:
+    """羽化权重：前 width 个像素从0线性升至1，其余为1"""
+    weights = np.ones(n, np.float32)
+    if width > 0:
+        weights[:width] = (np.arange(width, dtype=np.float32) + 0.5) / width
+    return weights
+
+def _blend_tile(out: np.ndarray, tile_out: np.ndarray, y0, y1, x0, x1, top, left):
+    """将复原块写入输出；与已写入的上方/左侧块重叠处做线性羽化，无需整幅累加缓冲"""
+    if top == 0 and left == 0:
+        out[y0:y1, x0:x1] = tile_out
+        return
+    weight = _ramp(y1 - y0, top)[:, None] * _ramp(x1 - x0, left)[None, :]
+    region = out[y0:y1, x0:x1].astype(np.float32)
+    region += (tile_out.astype(np.float32) - region) * weight[:, :, None]
+    out[y0:y1, x0:x1] = np.clip(region + 0.5, 0, 255).astype(np.uint8)
+
+def restore_tiled(rgb: np.ndarray, model_name: str, memory_budget: int, workers: int = 1) -> np.ndarray:
+    """
+    分块复原：峰值工作内存受 memory_budget 约束，与输入尺寸无关；整幅即在预算内时不分块
+    workers>1 时用线程并行处理相邻块（OpenCV 计算释放GIL），按行优先顺序依次融合写入唯一的输出缓冲
+    去雾先在降采样的整幅图像上估计大气光与透射率系数，各块共用，结果与整幅处理一致
+    """
+    restorer = get_restorer(model_name)
+    h, w = rgb.shape[:2]
+    tiles = list(iter_tiles(h, w, tile_side_for_budget(memory_budget, workers)))
+    if len(tiles) == 1:
+        return restorer(rgb)
+    estimate = estimate_haze(rgb) if model_name == DEHAZE_MODEL else None
+    out = np.empty_like(rgb)
+
+    def run(spec):
+        y0, y1, x0, x1 = spec[:4]
+        if estimate is not None:
+            return dehaze(rgb[y0:y1, x0:x1], estimate=estimate, origin=(y0, x0))
+        return restorer(rgb[y0:y1, x0:x1])
+
+    if workers <= 1:
+        for spec in tiles:
+            _blend_tile(out, run(spec), *spec)
+        return out
+    # 每次仅提交 workers 个块，限制同时驻留的块结果数量
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(tiles), workers):
+            window = tiles[start:start + workers]
+            for spec, tile_out in zip(window, executor.map(run, window)):
+                _blend_tile(out, tile_out, *spec)
+    return out
+
+def restore_array(rgb: np.ndarray, model_name: str, memory_budget: int = None,
+                  workers: int = 1) -> np.ndarray:
+    """
+    按模型名称对RGB uint8图像进行复原，返回新的RGB uint8数组
+    memory_budget（字节）给定且整幅处理的估计工作内存超出预算时，自动切换为分块处理
+    """
+    restorer = get_restorer(model_name)
+    h, w = rgb.shape[:2]
+    if memory_budget and h * w * WORKING_BYTES_PER_PIXEL > memory_budget:
+        return restore_tiled(rgb, model_name, memory_budget, workers)
+    return restorer(rgb)
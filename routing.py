@@ -0,0 +1,106 @@
+"""
+天气类型自动路由（不依赖Streamlit）
+在降采样副本上计算廉价的频域/统计特征，判断图像属于雨、雾还是雪，只路由到对应的复原模型：
+- 雨：顶帽残差（小尺度亮结构）比例高，且其高频能量方向一致（雨线近似平行）
+- 雾：暗通道均值高、对比度低
+- 雪：顶帽残差比例高，但高频能量各向同性（雪花为圆斑）
+只对小尺度残差分析方向性，避免场景中建筑、车辆等大结构的边缘干扰
+各类得分经 softmax 归一化后作为置信度
+"""
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+import restoration
+
+# 选项名称（与侧边栏复原模型选项并列）
+AUTO_MODEL = "自动"
+# 特征计算所用的降采样尺寸（最长边，像素）
+ROUTE_SIDE = 256
+# 路由时的解码倍率（JPEG 在解码阶段直接降采样；倍率为4时雨线细节丢失，准确率明显下降）
+ROUTE_DECODE_REDUCE = 2
+# 雨线/雪花检测：顶帽结构元素边长与亮度阈值（0-1）
+SPECKLE_KERNEL = 7
+SPECKLE_THRESHOLD = 0.12
+# 打分分界：亮斑比例下限与饱和值、雨/雪方向一致性分界、雾的暗通道与对比度分界
+SPECKLE_MIN = 0.015
+SPECKLE_CAP = 0.05
+COHERENCE_SPLIT = 0.25
+HAZE_DARK_SPLIT = 0.45
+HAZE_CONTRAST_SPLIT = 0.14
+# 分类打分的温度（越小置信度越极端）
+ROUTE_TEMPERATURE = 1.0
+
+def _small_gray(rgb: np.ndarray):
+    """降采样到 ROUTE_SIDE 内，返回 (RGB float32 0-1, 灰度 float32 0-1)"""
+    h, w = rgb.shape[:2]
+    scale = min(1.0, ROUTE_SIDE / max(h, w))
+    small = rgb if scale == 1.0 else cv2.resize(
+        rgb, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA
+    )
+    small = small.astype(np.float32) * (1.0 / 255.0)
+    return small, cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+
+def weather_features(rgb: np.ndarray) -> dict:
+    """
+    路由特征：
+    speckle 顶帽残差（尺度小于结构元素的亮斑/亮线，即雨线与雪花）的像素比例
+    coherence 顶帽残差高频功率谱的方向一致性（0-1）：雨线方向一致故较高，雪花各向同性故接近0
+    dark_channel 暗通道均值；contrast 灰度标准差
+    """
+    small, gray = _small_gray(rgb)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (SPECKLE_KERNEL, SPECKLE_KERNEL))
+    residual = cv2.morphologyEx(gray, cv2.MORPH_TOPHAT, kernel)
+
+    # 残差的功率谱，按频率坐标求二阶矩矩阵，其特征值之差/之和即方向一致性
+    h, w = residual.shape
+    ph, pw = cv2.getOptimalDFTSize(h), cv2.getOptimalDFTSize(w)
+    padded = cv2.copyMakeBorder(residual - residual.mean(), 0, ph - h, 0, pw - w, cv2.BORDER_CONSTANT, value=0)
+    spectrum = cv2.dft(padded, flags=cv2.DFT_COMPLEX_OUTPUT)
+    power = spectrum[..., 0] ** 2 + spectrum[..., 1] ** 2
+    fy, fx = _signed_freq(ph, pw)
+    power *= np.sqrt(fy * fy + fx * fx) > restoration.RAIN_MIN_RADIUS
+    jxx = float((power * fx * fx).sum())
+    jyy = float((power * fy * fy).sum())
+    jxy = float((power * fx * fy).sum())
+    coherence = np.sqrt((jxx - jyy) ** 2 + 4.0 * jxy * jxy) / (jxx + jyy + 1e-12)
+
+    dark = cv2.erode(small.min(axis=2), restoration.min_filter_kernel(restoration.HAZE_PATCH))
+    return {
+        "speckle": float((residual > SPECKLE_THRESHOLD).mean()),
+        "coherence": float(coherence),
+        "dark_channel": float(dark.mean()),
+        "contrast": float(gray.std()),
+    }
+
+@lru_cache(maxsize=4)
+def _signed_freq(h: int, w: int):
+    """未移频布局下的有符号频率坐标 (fy, fx)，单位为周期/像素"""
+    fy = np.fft.fftfreq(h).astype(np.float32)[:, None]
+    fx = np.fft.fftfreq(w).astype(np.float32)[None, :]
+    return fy, fx
+
+def route_scores(features: dict) -> dict:
+    """
+    各复原模型的未归一化得分（线性打分，阈值按合成的雨/雾/雪退化图像标定）
+    亮斑比例决定“是否有降水”，方向一致性区分雨与雪；暗通道与对比度判断雾
+    """
+    precipitation = 150.0 * (min(features["speckle"], SPECKLE_CAP) - SPECKLE_MIN)
+    direction = 8.0 * (features["coherence"] - COHERENCE_SPLIT)
+    return {
+        restoration.DERAIN_MODEL: precipitation + direction,
+        restoration.DEHAZE_MODEL: 12.0 * (features["dark_channel"] - HAZE_DARK_SPLIT)
+                                  + 10.0 * (HAZE_CONTRAST_SPLIT - features["contrast"]),
+        restoration.DESNOW_MODEL: precipitation - direction,
+    }
+
+def classify(rgb: np.ndarray):
+    """返回 (模型名称, 置信度 0-1, 各模型置信度)"""
+    scores = route_scores(weather_features(rgb))
+    names = list(scores)
+    logits = np.array([scores[name] for name in names]) / ROUTE_TEMPERATURE
+    probs = np.exp(logits - logits.max())
+    probs /= probs.sum()
+    best = int(probs.argmax())
+    return names[best], float(probs[best]), dict(zip(names, probs.tolist()))
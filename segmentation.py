@@ -0,0 +1,165 @@
+"""
+场景分割核心（不依赖Streamlit）
+- OnnxSegmenter：OpenCV DNN 加载的语义分割 ONNX 模型（DeepLabV3/SegFormer 等 Cityscapes 导出模型），
+  多张图像拼成一个 NCHW blob 批量推理，输出与原图同尺寸的 uint8 类别图
+- overlay_mask：调色板查表上色（向量化查表，无逐像素循环）+ alpha 混合，可只叠加指定类别
+- rle_encode / rle_decode：类别图的游程编码，结果缓存（含磁盘层）中保存的是编码后的紧凑字节
+
+类别图（H, W）uint8 即分割的原始输出，透明度、类别过滤等显示参数变化时只需重新查表混合，无需重新推理
+"""
+import threading
+
+import cv2
+import numpy as np
+
+import detection
+
+# Cityscapes 19 类（训练ID顺序），行车场景分割模型的常用类别
+CITYSCAPES_CLASSES = (
+    "road", "sidewalk", "building", "wall", "fence", "pole", "traffic light", "traffic sign",
+    "vegetation", "terrain", "sky", "person", "rider", "car", "truck", "bus", "train",
+    "motorcycle", "bicycle",
+)
+# Cityscapes 官方调色板（RGB），与 CITYSCAPES_CLASSES 一一对应
+CITYSCAPES_PALETTE = np.array([
+    (128, 64, 128), (244, 35, 232), (70, 70, 70), (102, 102, 156), (190, 153, 153),
+    (153, 153, 153), (250, 170, 30), (220, 220, 0), (107, 142, 35), (152, 251, 152),
+    (70, 130, 180), (220, 20, 60), (255, 0, 0), (0, 0, 142), (0, 0, 70),
+    (0, 60, 100), (0, 80, 100), (0, 0, 230), (119, 11, 32),
+], np.uint8)
+
+# 网络输入边长、输入归一化参数（ImageNet 均值/标准差，0-1 范围）
+INPUT_SIZE = 512
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+# 单次前向的最大批量（预分配 blob 的大小）；模型导出为固定批量1时自动退回逐张推理
+MAX_BATCH = 4
+# 叠加显示的默认不透明度
+DEFAULT_OPACITY = 0.5
+
+def labels_from_output(output: np.ndarray, n: int) -> np.ndarray:
+    """
+    解析分割输出为网络输出分辨率下的 (n, h, w) uint8 类别图
+    兼容 (n, C, h, w) 的逐类得分与 (n, h, w) / (n, 1, h, w) 的已取 argmax 类别图
+    """
+    pred = np.asarray(output)
+    if pred.ndim == 4 and pred.shape[1] > 1:
+        pred = pred.argmax(axis=1)
+    return pred.reshape(n, pred.shape[-2], pred.shape[-1]).astype(np.uint8)
+
+class OnnxSegmenter:
+    """
+    OpenCV DNN 封装的语义分割模型，调用时返回原图尺寸的 uint8 类别图，batch() 一次处理多张
+    输入 blob 预分配并复用（与检测器相同的 letterbox 预处理），预处理+推理在锁内串行
+    """
+
+    def __init__(self, net, input_size: int = INPUT_SIZE, class_names=CITYSCAPES_CLASSES,
+                 max_batch: int = MAX_BATCH):
+        self.net = net
+        self.input_size = input_size
+        self.class_names = class_names
+        self.max_batch = max(1, max_batch)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self._input = detection.LetterboxBlob(input_size, MEAN, STD, batch=self.max_batch)
+        self._lock = threading.Lock()
+        # 常驻大小：预分配的输入缓冲；权重大小由加载函数在读取后加上（见 models.register_onnx_model）
+        self.nbytes = self._input.nbytes
+
+    def __call__(self, rgb: np.ndarray) -> np.ndarray:
+        return self.batch([rgb])[0]
+
+    def batch(self, rgbs: list) -> list:
+        """批量分割，返回与输入一一对应的类别图列表"""
+        labels = []
+        for start in range(0, len(rgbs), self.max_batch):
+            labels += self._forward(rgbs[start:start + self.max_batch])
+        return labels
+
+    def _forward(self, rgbs: list) -> list:
+        with self._lock:
+            geometry = [self._input.load(rgb, i) for i, rgb in enumerate(rgbs)]
+            try:
+                self.net.setInput(self._input.blob[:len(rgbs)])
+                maps = labels_from_output(self.net.forward(), len(rgbs))
+            except cv2.error:
+                if len(rgbs) == 1:
+                    raise
+                # 固定批量的模型：此后逐张推理（blob 中已写入的图像直接复用）
+                self.max_batch = 1
+                maps = []
+                for i in range(len(rgbs)):
+                    self.net.setInput(self._input.blob[i:i + 1])
+                    maps.append(labels_from_output(self.net.forward(), 1)[0])
+        return [self._restore_size(m, rgb, scale, pad) for m, rgb, (scale, pad) in zip(maps, rgbs, geometry)]
+
+    def _restore_size(self, labels: np.ndarray, rgb: np.ndarray, scale: float, pad) -> np.ndarray:
+        """输出分辨率可能低于输入（如 1/4），按比例裁掉 letterbox 填充区域后最近邻放大回原图尺寸"""
+        left, top = pad
+        h, w = rgb.shape[:2]
+        ratio = labels.shape[0] / self.input_size
+        x0, y0 = int(left * ratio), int(top * ratio)
+        x1 = max(x0 + 1, round((left + w * scale) * ratio))
+        y1 = max(y0 + 1, round((top + h * scale) * ratio))
+        return cv2.resize(labels[y0:y1, x0:x1], (w, h), interpolation=cv2.INTER_NEAREST)
+
+def class_name(class_id: int, class_names=CITYSCAPES_CLASSES) -> str:
+    return class_names[class_id] if 0 <= class_id < len(class_names) else f"class_{class_id}"
+
+def class_histogram(labels: np.ndarray, class_names=CITYSCAPES_CLASSES) -> dict:
+    """类别图中出现的各类别及其像素占比（按占比降序）"""
+    counts = np.bincount(labels.ravel(), minlength=len(class_names))
+    order = np.argsort(-counts, kind="stable")
+    return {class_name(int(i), class_names): round(float(counts[i]) / labels.size, 4) for i in order if counts[i]}
+
+# --------------------------
+# 上色与混合
+# --------------------------
+def color_lut(palette: np.ndarray = CITYSCAPES_PALETTE) -> np.ndarray:
+    """覆盖全部 uint8 取值的 (256, 3) 颜色表，超出调色板的类别按取模循环着色"""
+    return palette[np.arange(256) % len(palette)]
+
+def hidden_lut(classes) -> np.ndarray:
+    """(256,) uint8 掩膜表：不在 classes 中的类别为1（不叠加）"""
+    hidden = np.ones(256, np.uint8)
+    hidden[list(classes)] = 0
+    return hidden
+
+_COLOR_LUT = color_lut()
+
+def overlay_mask(rgb: np.ndarray, labels: np.ndarray, opacity: float = DEFAULT_OPACITY, classes=None,
+                 palette: np.ndarray = None, out: np.ndarray = None) -> np.ndarray:
+    """
+    类别图经颜色表一次查表上色，与图像按不透明度 alpha 混合：out = rgb·(1-opacity) + color·opacity
+    classes 为要叠加的类别ID（为空时全部叠加）：其余类别的像素先以原图作为“颜色”，混合后保持原样
+    out 为空时写入新数组（输入可为只读缓存数组），out 可以就是 rgb 本身
+    """
+    colors = _COLOR_LUT if palette is None else color_lut(palette)
+    color = np.take(colors, labels, axis=0)
+    if classes is not None:
+        cv2.copyTo(rgb, np.take(hidden_lut(classes), labels), color)
+    if out is None:
+        out = np.empty_like(rgb)
+    return cv2.addWeighted(rgb, 1.0 - opacity, color, opacity, 0.0, dst=out)
+
+# --------------------------
+# 游程编码（缓存存储格式）
+# --------------------------
+# 编码布局：头部 (h, w, 游程数) uint32 + 各游程长度 uint32 + 各游程类别 uint8，整体为一维 uint8 数组
+_RLE_HEADER = 3
+
+def rle_encode(labels: np.ndarray) -> np.ndarray:
+    """按行优先顺序对 uint8 类别图做游程编码，返回一维 uint8 数组"""
+    flat = np.ascontiguousarray(labels, np.uint8).ravel()
+    starts = np.concatenate(([0], np.flatnonzero(flat[1:] != flat[:-1]) + 1))
+    lengths = np.diff(np.append(starts, flat.size)).astype(np.uint32)
+    header = np.array([labels.shape[0], labels.shape[1], len(starts)], np.uint32)
+    return np.concatenate([header.view(np.uint8), lengths.view(np.uint8), flat[starts]])
+
+def rle_decode(packed: np.ndarray) -> np.ndarray:
+    """rle_encode 的逆变换，返回 (h, w) uint8 类别图"""
+    h, w, n = (int(v) for v in np.frombuffer(packed, np.uint32, count=_RLE_HEADER))
+    offset = _RLE_HEADER * 4
+    lengths = np.frombuffer(packed, np.uint32, count=n, offset=offset)
+    values = np.frombuffer(packed, np.uint8, count=n, offset=offset + 4 * n)
+    return np.repeat(values, lengths).reshape(h, w)
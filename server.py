@@ -0,0 +1,194 @@
+"""
+轻量异步 HTTP 推理服务（仅依赖标准库 asyncio）
+接口：
+    GET  /healthz                       健康检查
+    GET  /models                        可选的复原模型名称（含“自动”）
+    GET  /metrics                       Prometheus 文本格式的运行指标
+    POST /restore?model=去雨模型         请求体为图片字节，返回复原后的图像（model=自动 时按天气类型路由）
+         可选参数：detect=1&conf=0.4&iou=0.4&target=car 叠加目标检测；segment=1&opacity=0.5 叠加场景分割；
+                   format=PNG|JPEG|WebP&quality=95 输出格式；response=json 返回检测结果JSON
+运行方式：
+    python server.py --host 0.0.0.0 --port 8600        独立进程（加 --warmup 在监听前预热模型与进程池）
+    INFERENCE_HTTP_PORT=8600 streamlit run app.py       与界面同进程启动，共享常驻模型与结果缓存
+推理在线程池中执行，不阻塞事件循环；同时推理的请求数受 INFERENCE_MAX_CONCURRENCY 限制
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+from functools import partial
+from urllib.parse import parse_qs, urlsplit
+
+import core
+import detection
+import export
+import metrics
+import models
+import segmentation
+
+# 请求体上限（与界面单文件上传上限一致）
+MAX_BODY_BYTES = 200 * 1024 * 1024
+# 同时进行推理的请求数上限
+INFERENCE_MAX_CONCURRENCY = int(os.environ.get("INFERENCE_MAX_CONCURRENCY", os.cpu_count() or 1))
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def _param(params: dict, name: str, default=None, cast=str):
+    values = params.get(name)
+    if not values:
+        return default
+    try:
+        return cast(values[0])
+    except ValueError:
+        raise HTTPError(400, f"参数 {name} 无效：{values[0]}")
+
+def _json_response(status: int, payload) -> tuple:
+    return status, "application/json; charset=utf-8", json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+def run_inference(body: bytes, params: dict) -> tuple:
+    """在工作线程中执行：复原（可选检测/分割）并编码输出，返回 (状态码, Content-Type, 响应体)"""
+    model_name = _param(params, "model", models.model_names(models.RESTORATION)[0])
+    if model_name not in core.restoration_choices():
+        raise HTTPError(400, f"未知的复原模型：{model_name}")
+    fmt = _param(params, "format", export.PNG)
+    if fmt not in export.FORMATS:
+        raise HTTPError(400, f"不支持的输出格式：{fmt}")
+    quality = _param(params, "quality", export.DEFAULT_QUALITY, int)
+    task = None
+    options = {}
+    if _param(params, "detect", "0") in ("1", "true", "yes"):
+        task = core.DETECTION_MODEL
+        options = {"conf_threshold": _param(params, "conf", 0.40, float),
+                   "iou_threshold": _param(params, "iou", 0.40, float),
+                   "class_filter": _param(params, "target")}
+    elif _param(params, "segment", "0") in ("1", "true", "yes"):
+        task = core.SEGMENTATION_MODEL
+        options = {"opacity": _param(params, "opacity", segmentation.DEFAULT_OPACITY, float)}
+    as_json = _param(params, "response") == "json"
+    try:
+        # 返回JSON时只需原始输出，不绘制
+        result = core.run_pipeline(body, model_name, task, render=not as_json, **options)
+    except FileNotFoundError as e:
+        raise HTTPError(503, f"{task}模型加载失败：{e}")
+    if result is None:
+        raise HTTPError(400, "图片解码失败")
+
+    if as_json:
+        h, w = result.restored.shape[:2]
+        payload = {"model": model_name, "width": int(w), "height": int(h)}
+        if result.confidence is not None:
+            payload["route"] = {"model": result.model, "confidence": round(result.confidence, 4)}
+        if task == core.DETECTION_MODEL:
+            dets = detection.filter_detections(result.raw, options["conf_threshold"], options["iou_threshold"])
+            payload["detections"] = detection.detections_to_json(dets)
+        elif task == core.SEGMENTATION_MODEL:
+            payload["segmentation"] = segmentation.class_histogram(result.raw)
+        return _json_response(200, payload)
+    out = result.restored if task is None else result.image
+    return 200, export.MIME_TYPES[fmt], export.encode_image(out, fmt, quality)
+
+class InferenceServer:
+    """单请求单连接的极简 HTTP/1.1 服务"""
+
+    def __init__(self, max_concurrency: int = INFERENCE_MAX_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+
+    async def route(self, method: str, target: str, body: bytes) -> tuple:
+        url = urlsplit(target)
+        params = parse_qs(url.query)
+        if url.path == "/healthz":
+            return _json_response(200, {"status": "ok"})
+        if url.path == "/models":
+            return _json_response(200, {"restoration": core.restoration_choices()})
+        if url.path == "/metrics":
+            return 200, "text/plain; version=0.0.4; charset=utf-8", metrics.get_registry().prometheus_text().encode("utf-8")
+        if url.path != "/restore":
+            raise HTTPError(404, f"未知路径：{url.path}")
+        if method != "POST":
+            raise HTTPError(405, "请使用 POST 上传图片")
+        if not body:
+            raise HTTPError(400, "请求体为空")
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            with metrics.timed("http_restore", nbytes=len(body)):
+                return await loop.run_in_executor(None, partial(run_inference, body, params))
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            try:
+                request_line = (await reader.readline()).decode("latin-1").split()
+                if len(request_line) != 3:
+                    raise HTTPError(400, "请求行格式错误")
+                method, target, _ = request_line
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", "0") or 0)
+                if length > MAX_BODY_BYTES:
+                    raise HTTPError(413, f"请求体超过 {MAX_BODY_BYTES // 1024 // 1024} MB 上限")
+                body = await reader.readexactly(length) if length else b""
+                status, content_type, payload = await self.route(method.upper(), target, body)
+            except HTTPError as e:
+                status, content_type, payload = _json_response(e.status, {"error": e.message})
+            except (ValueError, asyncio.IncompleteReadError):
+                status, content_type, payload = _json_response(400, {"error": "请求格式错误"})
+            except Exception as e:
+                status, content_type, payload = _json_response(500, {"error": str(e)})
+            head = (
+                f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                "Connection: close\r\n\r\n"
+            )
+            writer.write(head.encode("latin-1") + payload)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+def start_background(host: str, port: int) -> threading.Thread:
+    """在后台守护线程中启动服务（供 Streamlit 进程内复用常驻模型与结果缓存）"""
+    thread = threading.Thread(
+        target=lambda: asyncio.run(InferenceServer().serve(host, port)),
+        name="inference-http",
+        daemon=True,
+    )
+    thread.start()
+    return thread
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="基于频域感知的恶劣天气图像复原系统 - HTTP 推理服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--warmup", action="store_true",
+                        help="监听前预热：加载模型、生成常见尺寸的频域掩膜并启动复原进程池（见 core.warm_up）")
+    args = parser.parse_args(argv)
+    if args.warmup:
+        timings = core.warm_up()
+        print("预热完成：" + "，".join(f"{k} {v:.2f}s" if isinstance(v, float) else f"{k} {v}"
+                                    for k, v in timings.items()), flush=True)
+    print(f"推理服务已启动：http://{args.host}:{args.port}", flush=True)
+    asyncio.run(InferenceServer().serve(args.host, args.port))
+
+if __name__ == "__main__":
+    main()
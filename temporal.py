@@ -0,0 +1,116 @@
+"""
+视频帧时域复用：增量复原（不依赖Streamlit）
+固定机位下相邻帧大部分为静止背景。本模块将画面划分为固定大小的块，
+用向量化的帧差检测变化块，只对变化块重新复原，其余块直接复用上一帧的输出；
+所有块均以相同尺寸的窗口（块+重叠边）处理，频域掩膜只生成一次，
+去雾的大气光与透射率（导向滤波系数，见 restoration.estimate_haze）在全量刷新时估计并在帧间复用，
+变化块只做逐像素的去雾计算；每隔固定帧数做一次全量刷新防止误差累积
+"""
+import cv2
+import numpy as np
+
+import restoration
+
+# 块边长、窗口重叠边宽度（像素）
+TILE_SIZE = 128
+TILE_MARGIN = 32
+# 帧差统计粒度（像素），须整除 TILE_SIZE
+DIFF_BLOCK = 16
+# 块内任一统计单元的平均灰度差超过该值即视为变化
+DIFF_THRESHOLD = 6.0
+# 全量刷新间隔（帧）
+REFRESH_INTERVAL = 60
+
+class IncrementalRestorer:
+    """
+    有状态的逐帧复原器：每个视频流各自持有一个实例，按帧顺序调用
+    """
+
+    def __init__(self, model_name: str, tile: int = TILE_SIZE, margin: int = TILE_MARGIN,
+                 threshold: float = DIFF_THRESHOLD, refresh_interval: int = REFRESH_INTERVAL):
+        if tile % DIFF_BLOCK:
+            raise ValueError(f"块边长 {tile} 必须是帧差统计粒度 {DIFF_BLOCK} 的整数倍")
+        self.model_name = model_name
+        self.tile = tile
+        self.margin = margin
+        self.threshold = threshold
+        self.refresh_interval = refresh_interval
+        self.frames = 0
+        self.full_refreshes = 0
+        self.tiles_restored = 0
+        self.tiles_total = 0
+        self.reset()
+
+    def reset(self):
+        """丢弃缓存的输出与参考帧，下一帧将做全量刷新"""
+        self._out = None
+        self._ref_gray = None
+        self._restorer = None
+        self._haze = None
+
+    def _grid(self, h: int, w: int):
+        return -(-h // self.tile), -(-w // self.tile)
+
+    def _dirty_tiles(self, gray: np.ndarray) -> np.ndarray:
+        """与各块上次复原时的输入比较，返回 (块行数, 块列数) 的变化掩码"""
+        h, w = gray.shape
+        rows, cols = self._grid(h, w)
+        diff = cv2.absdiff(gray, self._ref_gray)
+        diff = cv2.copyMakeBorder(diff, 0, rows * self.tile - h, 0, cols * self.tile - w,
+                                  cv2.BORDER_CONSTANT, value=0)
+        # 整数倍缩小的 INTER_AREA 即为各统计单元的平均差值
+        per_block = self.tile // DIFF_BLOCK
+        block_means = cv2.resize(diff, (cols * per_block, rows * per_block), interpolation=cv2.INTER_AREA)
+        block_means = block_means.reshape(rows, per_block, cols, per_block)
+        return block_means.max(axis=(1, 3)) > self.threshold
+
+    def _full_refresh(self, rgb: np.ndarray):
+        """重新估计帧间复用的全局量（去雾的大气光与透射率），并将所有块标记为变化"""
+        self._restorer = restoration.get_restorer(self.model_name)
+        if self.model_name == restoration.DEHAZE_MODEL:
+            self._haze = restoration.estimate_haze(rgb)
+        self._out = np.empty_like(rgb)
+        self._ref_gray = np.empty(rgb.shape[:2], np.uint8)
+        self.full_refreshes += 1
+        return np.ones(self._grid(*rgb.shape[:2]), bool)
+
+    def __call__(self, rgb: np.ndarray) -> np.ndarray:
+        h, w = rgb.shape[:2]
+        gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+        if (self._out is None or self._out.shape != rgb.shape
+                or self.frames % self.refresh_interval == 0):
+            dirty = self._full_refresh(rgb)
+        else:
+            dirty = self._dirty_tiles(gray)
+
+        dirty_idx = np.argwhere(dirty)
+        if len(dirty_idx):
+            rows, cols = dirty.shape
+            m, t = self.margin, self.tile
+            # 反射填充后每个窗口尺寸都是 (t+2m)²，频域掩膜按该尺寸缓存复用
+            padded = cv2.copyMakeBorder(rgb, m, m + rows * t - h, m, m + cols * t - w, cv2.BORDER_REFLECT)
+            for ty, tx in dirty_idx:
+                y0, x0 = ty * t, tx * t
+                window = padded[y0:y0 + t + 2 * m, x0:x0 + t + 2 * m]
+                if self._haze is not None:
+                    # 窗口左上角在原画面中的坐标为 (y0-m, x0-m)，按该位置取用缓存的透射率系数
+                    restored = restoration.dehaze(window, estimate=self._haze, origin=(y0 - m, x0 - m))
+                else:
+                    restored = self._restorer(window)
+                y1, x1 = min(y0 + t, h), min(x0 + t, w)
+                self._out[y0:y1, x0:x1] = restored[m:m + y1 - y0, m:m + x1 - x0]
+                self._ref_gray[y0:y1, x0:x1] = gray[y0:y1, x0:x1]
+
+        self.frames += 1
+        self.tiles_restored += len(dirty_idx)
+        self.tiles_total += dirty.size
+        # 输出缓冲会被后续帧原地更新，返回副本供下游（编码队列）持有
+        return self._out.copy()
+
+    def stats(self) -> dict:
+        """帧数、全量刷新次数与重新复原的块比例"""
+        return {
+            "frames": self.frames,
+            "full_refreshes": self.full_refreshes,
+            "restored_ratio": self.tiles_restored / self.tiles_total if self.tiles_total else 0.0,
+        }
@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+# 模块位于仓库根目录（无包结构），测试从根目录导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def isolated_caches(tmp_path, monkeypatch):
+    """产物目录指向临时目录，结果缓存与解码缓存在测试中重新创建，不读写进程级共享的缓存与真实产物目录"""
+    import artifacts
+    import core
+    monkeypatch.setattr(artifacts, "ARTIFACT_DIR", str(tmp_path / "artifacts"))
+    monkeypatch.setattr(core, "RESULT_CACHE_DIR", "")
+    monkeypatch.setattr(core, "RESULT_CACHE_SPILL", False)
+    for name in ("_RESULT_CACHE", "_DECODE_MEMO", "_TASK_MEMO"):
+        monkeypatch.setattr(core, name, None)
@@ -0,0 +1,30 @@
+import os
+
+import numpy as np
+
+import artifacts
+
+def test_version_bump_invalidates(tmp_path, monkeypatch):
+    """生成代码版本变化后不再读取旧产物"""
+    monkeypatch.setattr(artifacts, "ARTIFACT_DIR", str(tmp_path))
+    old = artifacts.load_or_build("mask", (4, 4), lambda: np.zeros((4, 4), np.float32))
+    assert isinstance(artifacts.load_or_build("mask", (4, 4), lambda: None), np.memmap)
+    monkeypatch.setattr(artifacts, "ARTIFACT_VERSION", artifacts.ARTIFACT_VERSION + 1)
+    new = artifacts.load_or_build("mask", (4, 4), lambda: np.ones((4, 4), np.float32))
+    assert not old.any() and new.all()
+
+def test_trim_keeps_recently_used(tmp_path, monkeypatch):
+    """命中会刷新修改时间，超出容量时先清理最久未使用的产物"""
+    monkeypatch.setattr(artifacts, "ARTIFACT_DIR", str(tmp_path))
+    build = lambda: np.zeros(1024, np.uint8)
+    artifacts.load_or_build("a", (), build)
+    artifacts.load_or_build("b", (), build)
+    for i, name in enumerate(("a", "b")):
+        os.utime(artifacts.artifact_path(name, ()), (1000 + i, 1000 + i))
+    artifacts.load_or_build("a", (), build)  # 命中：a 成为最近使用
+    size = os.path.getsize(artifacts.artifact_path("a", ()))
+    monkeypatch.setattr(artifacts, "ARTIFACT_MAX_BYTES", 2 * size)
+    artifacts.load_or_build("c", (), build)
+    assert os.path.exists(artifacts.artifact_path("a", ()))
+    assert not os.path.exists(artifacts.artifact_path("b", ()))
+    assert os.path.exists(artifacts.artifact_path("c", ()))
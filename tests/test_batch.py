@@ -0,0 +1,39 @@
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+import core
+import jobs
+import restoration
+
+pytestmark = pytest.mark.usefixtures("isolated_caches")
+
+class PngItem:
+    def __init__(self, index: int):
+        self.name = f"{index}.png"
+        rgb = np.random.default_rng(index).integers(0, 255, (24, 32, 3), dtype=np.uint8)
+        self._data = cv2.imencode(".png", rgb)[1].tobytes()
+
+    def getvalue(self) -> bytes:
+        return self._data
+
+def test_cancelled_batch_marks_unfinished_entries():
+    """取消后未处理到的条目保持 done=False，mark_unfinished 将其标记为已取消，已完成的不受影响"""
+    items = [PngItem(1000 + i) for i in range(12)]
+    cancel = threading.Event()
+    finished = []
+
+    def on_result(entry, arr):
+        finished.append(entry["index"])
+        if len(finished) == 2:
+            cancel.set()
+
+    entries = core.restore_batch(items, restoration.DERAIN_MODEL, on_result=on_result, pool=None,
+                                 cancel_event=cancel)
+    assert [entry["done"] for entry in entries].count(False) == 10
+    core.mark_unfinished(entries, jobs.CANCELLED)
+    assert all(entry["done"] for entry in entries)
+    assert [entry["state"] for entry in entries if entry["ok"]] == [None, None]
+    assert sum(entry["state"] == jobs.CANCELLED for entry in entries) == 10
@@ -0,0 +1,35 @@
+import numpy as np
+
+import detection
+
+def _raw(rows):
+    return np.array(rows, np.float32).reshape(-1, 6)
+
+# 两个高度重叠（IoU≈0.68）的框、一个与之部分重叠（IoU≈0.11）的框，均为类别0
+OVERLAPPING = [
+    (0, 0, 100, 100, 0.9, 0),
+    (10, 10, 110, 110, 0.8, 0),
+    (60, 60, 160, 160, 0.7, 0),
+]
+
+def test_nms_suppresses_within_class_only():
+    """同类重叠框只保留高分框；不同类别的重叠框互不抑制"""
+    dets = detection.filter_detections(_raw(OVERLAPPING[:2]), 0.0, 0.5)
+    assert dets[:, 4].tolist() == [np.float32(0.9)]
+    other_class = _raw([OVERLAPPING[0], OVERLAPPING[1][:5] + (1,)])
+    dets = detection.filter_detections(other_class, 0.0, 0.5)
+    assert sorted(dets[:, 5].tolist()) == [0, 1]
+
+def test_nms_threshold_zero_and_one():
+    """阈值为0时任何重叠都被抑制，为1时全部保留（包括完全重合的框）"""
+    raw = _raw(OVERLAPPING + [(300, 300, 340, 340, 0.6, 0)])
+    assert detection.filter_detections(raw, 0.0, 0.0)[:, 4].tolist() == [np.float32(0.9), np.float32(0.6)]
+    assert len(detection.filter_detections(raw, 0.0, 1.0)) == len(raw)
+    same = _raw([OVERLAPPING[0], OVERLAPPING[0][:4] + (0.5, 0)])
+    assert len(detection.filter_detections(same, 0.0, 1.0)) == 2
+
+def test_nms_keeps_partially_overlapping_and_orders_by_score():
+    """IoU 低于阈值的框保留，结果按分数降序；置信度过滤后为空时返回空结果"""
+    dets = detection.filter_detections(_raw(OVERLAPPING[::-1]), 0.0, 0.5)
+    assert dets[:, 4].tolist() == [np.float32(0.9), np.float32(0.7)]
+    assert detection.filter_detections(_raw(OVERLAPPING), 0.95, 0.5).shape == (0, 6)
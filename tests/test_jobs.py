@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+
+import jobs
+
+def _blocking(release: threading.Event):
+    def run(job):
+        release.wait(5)
+        return "ok"
+    return run
+
+def test_cancel_after_dequeue_frees_user_slot():
+    """出队后、开始前被取消的任务应标记为已取消并结束，不再计入用户的进行中任务数"""
+    manager = jobs.JobManager(max_workers=1, max_per_user=2)
+    release = threading.Event()
+    blocker = manager.submit("alice", "restore", _blocking(release))
+    queued = manager.submit("alice", "detect", lambda job: "never")
+    with pytest.raises(jobs.JobLimitExceeded):
+        manager.submit("alice", "evaluate", lambda job: None)
+
+    # 模拟取消与出队的竞争：取消标记已置位，但 future 已无法撤回
+    queued.cancel_event.set()
+    release.set()
+    blocker.future.result(5)
+    queued.future.result(5)
+
+    assert queued.status == jobs.CANCELLED
+    assert queued.finished_at
+    assert queued.result is None
+    assert not queued.active
+    release.clear()
+    first = manager.submit("alice", "restore", _blocking(release))
+    manager.submit("alice", "detect", _blocking(release))
+    release.set()
+    first.future.result(5)
+
+def test_cancel_queued_job():
+    """排队中的任务取消后立即结束，其他用户与本用户均可继续提交"""
+    manager = jobs.JobManager(max_workers=1, max_per_user=2)
+    release = threading.Event()
+    blocker = manager.submit("bob", "restore", _blocking(release))
+    queued = manager.submit("bob", "detect", lambda job: "never")
+    assert manager.cancel(queued.id)
+    assert queued.status == jobs.CANCELLED and queued.finished_at
+    manager.submit("bob", "evaluate", lambda job: None)
+    release.set()
+    assert blocker.future.result(5) is None
+    assert blocker.status == jobs.DONE and blocker.result == "ok"
@@ -0,0 +1,34 @@
+import numpy as np
+
+import models
+import restoration
+
+def test_restorer_size_tracks_mask_cache_and_evicts(monkeypatch):
+    """复原模型的常驻大小为其频域掩膜缓存，随使用增长；超出上限时被淘汰并释放掩膜"""
+    monkeypatch.setattr(restoration.artifacts, "ARTIFACT_DIR", "")
+    restoration.clear_mask_cache(restoration.DERAIN_MODEL)
+    pool = models.ModelPool(max_bytes=1)
+    derain = pool.get(restoration.DERAIN_MODEL)
+    assert pool.stats()[0]["nbytes"] == 0
+    derain(np.zeros((32, 48, 3), np.uint8))
+    assert pool.stats()[0]["nbytes"] == restoration.mask_cache_nbytes(restoration.DERAIN_MODEL) > 0
+
+    pool.get(restoration.DEHAZE_MODEL)
+    assert [item["name"] for item in pool.stats()] == [restoration.DEHAZE_MODEL]
+    assert restoration.mask_cache_nbytes(restoration.DERAIN_MODEL) == 0
+
+def test_onnx_size_measured_at_load(tmp_path, monkeypatch):
+    """ONNX 模型的常驻大小在加载时测量：权重在注册之后才放入也能计入"""
+    path = tmp_path / "late.onnx"
+
+    class Wrapped:
+        def __init__(self, net):
+            self.nbytes = 100
+
+    monkeypatch.setattr(models.cv2.dnn, "readNetFromONNX", lambda p: object())
+    monkeypatch.setitem(models._REGISTRY, "late", None)
+    models.register_onnx_model("late", models.DETECTION, str(path), wrap=Wrapped)
+    path.write_bytes(b"\0" * 1000)
+    pool = models.ModelPool(max_bytes=1 << 30)
+    pool.get("late")
+    assert pool.stats()[0]["nbytes"] == 1100
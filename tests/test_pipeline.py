@@ -0,0 +1,53 @@
+import cv2
+import numpy as np
+import pytest
+
+import core
+import models
+import restoration
+import segmentation
+
+pytestmark = pytest.mark.usefixtures("isolated_caches")
+
+ROAD = segmentation.CITYSCAPES_CLASSES.index("road")
+CAR = segmentation.CITYSCAPES_CLASSES.index("car")
+
+class HalfSegmenter:
+    """左半幅为 road、右半幅为 car 的分割模型替身"""
+
+    def __call__(self, rgb):
+        labels = np.full(rgb.shape[:2], ROAD, np.uint8)
+        labels[:, rgb.shape[1] // 2:] = CAR
+        return labels
+
+@pytest.fixture
+def half_segmenter(monkeypatch):
+    name = core.SEGMENTATION_MODEL
+    monkeypatch.setitem(models._REGISTRY, name,
+                        models.ModelSpec(name, models.SEGMENTATION, HalfSegmenter))
+    models.get_pool().evict(name)
+    yield
+    models.get_pool().evict(name)
+
+def _png(seed: int) -> bytes:
+    rgb = np.random.default_rng(seed).integers(0, 255, (48, 64, 3), dtype=np.uint8)
+    return cv2.imencode(".png", rgb)[1].tobytes()
+
+def test_segmentation_class_filter_through_pipeline(half_segmenter):
+    """界面传给 TASK_HEADS 的 class_filter 只叠加所选类别，其余像素保持复原结果"""
+    result = core.run_pipeline(_png(0), restoration.DERAIN_MODEL, core.SEGMENTATION_MODEL,
+                               opacity=1.0, class_filter="car")
+    restored, image = result.restored, result.image
+    half = restored.shape[1] // 2
+    assert np.array_equal(image[:, :half], restored[:, :half])
+    assert (image[:, half:] == segmentation.CITYSCAPES_PALETTE[CAR]).all()
+
+    everything = core.run_pipeline(_png(0), restoration.DERAIN_MODEL, core.SEGMENTATION_MODEL,
+                                   opacity=1.0, class_filter=None).image
+    assert (everything[:, :half] == segmentation.CITYSCAPES_PALETTE[ROAD]).all()
+
+def test_segmentation_unknown_class_overlays_nothing(half_segmenter):
+    """结果中不存在的类别：不叠加任何像素"""
+    result = core.run_pipeline(_png(1), restoration.DERAIN_MODEL, core.SEGMENTATION_MODEL,
+                               opacity=0.7, class_filter="train")
+    assert np.array_equal(result.image, result.restored)
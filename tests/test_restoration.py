@@ -0,0 +1,39 @@
+import cv2
+import numpy as np
+import pytest
+
+import restoration
+
+@pytest.mark.parametrize("n", [257, 300, 511, 512, 1000, 1081, 1920, 4000])
+@pytest.mark.parametrize("tile", [256, 400, 777])
+def test_tile_spans_cover_with_exact_overlap(n, tile):
+    """分块覆盖整条边、每块不超过 tile，相邻块恰好重叠 TILE_OVERLAP"""
+    overlap = restoration.TILE_OVERLAP
+    spans = restoration._tile_spans(n, tile, overlap)
+    assert spans[0][0] == 0 and spans[-1][1] == n
+    assert all(0 < end - start <= tile for start, end in spans)
+    assert all(prev_end - start == overlap for (_, prev_end), (start, _) in zip(spans, spans[1:]))
+
+def test_tile_spans_single_tile():
+    assert restoration._tile_spans(200, 256, restoration.TILE_OVERLAP) == [(0, 200)]
+
+def _hazy(h: int, w: int) -> np.ndarray:
+    """带纹理的场景叠加随高度变化的雾（I = J·t + A·(1 - t)）"""
+    rng = np.random.default_rng(0)
+    scene = cv2.GaussianBlur(rng.integers(0, 255, (h, w, 3), dtype=np.uint8), (0, 0), 3.0).astype(np.float32)
+    for _ in range(20):
+        x0, y0 = int(rng.integers(0, w - 40)), int(rng.integers(0, h - 40))
+        cv2.rectangle(scene, (x0, y0), (x0 + 40, y0 + 30), [float(c) for c in rng.integers(0, 255, 3)], -1)
+    t = np.linspace(0.3, 0.9, h, dtype=np.float32)[:, None, None]
+    return np.clip(scene * t + 220.0 * (1.0 - t), 0, 255).astype(np.uint8)
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_tiled_dehaze_matches_whole(workers):
+    """分块去雾与整幅去雾的差异不超过 1 个灰度级（各块共用整幅估计的大气光与透射率系数）"""
+    rgb = _hazy(700, 900)
+    budget = restoration.MIN_TILE_SIDE ** 2 * restoration.WORKING_BYTES_PER_PIXEL * workers
+    assert len(list(restoration.iter_tiles(700, 900, restoration.tile_side_for_budget(budget, workers)))) > 1
+    whole = restoration.dehaze(rgb)
+    tiled = restoration.restore_tiled(rgb, restoration.DEHAZE_MODEL, budget, workers=workers)
+    assert tiled.shape == whole.shape and tiled.dtype == np.uint8
+    assert np.abs(tiled.astype(np.int16) - whole).max() <= 1
@@ -0,0 +1,22 @@
+import os
+
+import numpy as np
+
+import core
+
+def test_disk_tier_scans_only_when_over_budget(tmp_path, monkeypatch):
+    """磁盘层累计写入字节数，只有超出上限时才扫描目录；超出后按写入顺序删除最早的文件"""
+    arr_bytes = 4096
+    cache = core.ResultCache(0, str(tmp_path), disk_max_bytes=3 * (arr_bytes + 128))
+    scans = []
+    listdir = os.listdir
+    monkeypatch.setattr(core.os, "listdir", lambda path: scans.append(path) or listdir(path))
+    for i in range(3):
+        cache.put(f"k{i}", np.full(arr_bytes, i, np.uint8))
+        os.utime(cache._disk_path(f"k{i}"), (1000 + i, 1000 + i))
+    assert scans == []
+    cache.put("k3", np.full(arr_bytes, 3, np.uint8))
+    assert len(scans) == 1
+    assert not os.path.exists(cache._disk_path("k0"))
+    assert all(os.path.exists(cache._disk_path(f"k{i}")) for i in (1, 2, 3))
+    assert cache.get("k2")[0] == 2
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+import segmentation
+
+@pytest.mark.parametrize("labels", [
+    np.array([[7]], np.uint8),
+    np.zeros((3, 5), np.uint8),
+    np.arange(12, dtype=np.uint8).reshape(3, 4),
+    np.random.default_rng(0).integers(0, len(segmentation.CITYSCAPES_CLASSES), (37, 53), dtype=np.uint8),
+], ids=["1x1", "uniform", "all_runs_of_one", "random"])
+def test_rle_round_trip(labels):
+    packed = segmentation.rle_encode(labels)
+    assert packed.dtype == np.uint8 and packed.ndim == 1
+    decoded = segmentation.rle_decode(packed)
+    assert decoded.dtype == np.uint8
+    assert np.array_equal(decoded, labels)
+
+def test_rle_round_trip_non_contiguous():
+    """切片视图（非连续内存）按行优先顺序编码"""
+    labels = np.random.default_rng(1).integers(0, 3, (20, 30), dtype=np.uint8)[::2, 5:25]
+    assert np.array_equal(segmentation.rle_decode(segmentation.rle_encode(labels)), labels)
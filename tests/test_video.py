@@ -0,0 +1,36 @@
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+import video
+
+@pytest.fixture
+def clip(tmp_path):
+    path = str(tmp_path / "clip.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 25.0, (32, 24))
+    if not writer.isOpened():
+        pytest.skip("MJPG 编码不可用")
+    for i in range(20):
+        writer.write(np.full((24, 32, 3), i * 10, dtype=np.uint8))
+    writer.release()
+    return path
+
+def test_stop_event_untouched_on_completion(clip, tmp_path):
+    """正常处理完毕时不置位调用方的停止标记（后台任务直接传入取消标记，否则完成的任务会被判为已取消）"""
+    stop_event = threading.Event()
+    stats = video.process_stream(clip, str(tmp_path / "out.avi"), lambda rgb: rgb, stop_event=stop_event)
+    assert stats.frames == video.frame_count(clip) == 20
+    assert not stop_event.is_set()
+
+def test_stop_event_stops_stream(clip, tmp_path):
+    stop_event = threading.Event()
+
+    def on_progress(stats):
+        if stats.frames == 3:
+            stop_event.set()
+
+    stats = video.process_stream(clip, str(tmp_path / "out.avi"), lambda rgb: rgb, queue_size=1,
+                                 on_progress=on_progress, stop_event=stop_event)
+    assert 3 <= stats.frames < 20
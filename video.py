@@ -0,0 +1,192 @@
+"""
+视频/摄像头流式复原（不依赖Streamlit）
+解码、处理、编码三个阶段分别运行在独立线程上，阶段之间用有界队列连接：
+任一阶段变慢时上游自动阻塞，内存占用只与队列长度有关，与视频时长无关
+"""
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+
+import cv2
+import numpy as np
+
+# 阶段间队列长度（帧）
+DEFAULT_QUEUE_SIZE = 8
+# 无法读取源帧率时使用的默认帧率
+DEFAULT_FPS = 25.0
+# 依次尝试的输出编码（avc1 可在浏览器中直接播放，不可用时回退到 mp4v）
+FOURCC_CANDIDATES = ("avc1", "mp4v")
+
+# 队列结束标记
+_END = object()
+
+@dataclass
+class StreamStats:
+    """流式处理统计：帧数、各阶段累计耗时（秒）与整体持续帧率"""
+    frames: int = 0
+    decode_seconds: float = 0.0
+    process_seconds: float = 0.0
+    encode_seconds: float = 0.0
+    wall_seconds: float = 0.0
+    source_fps: float = DEFAULT_FPS
+    frame_size: tuple = field(default=(0, 0))
+
+    @property
+    def fps(self) -> float:
+        return self.frames / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "frames": self.frames,
+            "fps": self.fps,
+            "wall_seconds": self.wall_seconds,
+            "decode_seconds": self.decode_seconds,
+            "process_seconds": self.process_seconds,
+            "encode_seconds": self.encode_seconds,
+            "source_fps": self.source_fps,
+            "frame_size": self.frame_size,
+        }
+
+def open_capture(source):
+    """打开视频文件路径或摄像头编号，失败时抛出 IOError"""
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise IOError(f"无法打开视频源：{source}")
+    return capture
+
+def frame_count(source) -> int:
+    """视频总帧数（摄像头等无法获取时为0）"""
+    capture = open_capture(source)
+    try:
+        return max(int(capture.get(cv2.CAP_PROP_FRAME_COUNT)), 0)
+    finally:
+        capture.release()
+
+def iter_frames(capture, max_frames: int = None, stop_event: threading.Event = None):
+    """逐帧读取RGB图像的生成器（每次只持有一帧）"""
+    count = 0
+    while max_frames is None or count < max_frames:
+        if stop_event is not None and stop_event.is_set():
+            return
+        ok, bgr = capture.read()
+        if not ok:
+            return
+        cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=bgr)
+        yield bgr
+        count += 1
+
+def open_writer(output_path: str, fps: float, frame_size: tuple):
+    """按候选编码依次尝试创建 VideoWriter，返回 (writer, 实际使用的fourcc)"""
+    for fourcc in FOURCC_CANDIDATES:
+        writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*fourcc), fps, frame_size)
+        if writer.isOpened():
+            return writer, fourcc
+        writer.release()
+    raise IOError(f"无法创建视频输出：{output_path}")
+
+def _put(q: queue.Queue, item, stop_event: threading.Event) -> bool:
+    """向有界队列放入元素；停止标记置位时放弃并返回False"""
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(q: queue.Queue, stop_event: threading.Event):
+    while True:
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            if stop_event.is_set():
+                return _END
+
+def process_stream(source, output_path: str, frame_fn, queue_size: int = DEFAULT_QUEUE_SIZE,
+                   max_frames: int = None, on_progress=None, stop_event: threading.Event = None) -> StreamStats:
+    """
+    流式处理视频：解码线程 -> 有界队列 -> 处理线程 -> 有界队列 -> 编码（调用线程）
+    frame_fn(rgb) 返回处理后的同尺寸RGB帧；on_progress(stats) 在每写出一帧后回调
+    stop_event 由调用方置位以提前停止（如后台任务的取消标记），正常处理完毕时不会被置位
+    任一阶段出错时停止全部阶段并在调用线程重新抛出异常
+    """
+    stop_event = stop_event or threading.Event()
+    capture = open_capture(source)
+    stats = StreamStats()
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    stats.source_fps = fps if fps and fps > 0 else DEFAULT_FPS
+    decoded = queue.Queue(maxsize=queue_size)
+    processed = queue.Queue(maxsize=queue_size)
+    errors = []
+
+    def decode_stage():
+        try:
+            frames = iter_frames(capture, max_frames, stop_event)
+            while True:
+                start = time.perf_counter()
+                frame = next(frames, None)
+                stats.decode_seconds += time.perf_counter() - start
+                if frame is None or not _put(decoded, frame, stop_event):
+                    break
+        except Exception as e:
+            errors.append(e)
+            stop_event.set()
+        finally:
+            _put(decoded, _END, stop_event)
+
+    def process_stage():
+        try:
+            while True:
+                frame = _get(decoded, stop_event)
+                if frame is _END:
+                    break
+                start = time.perf_counter()
+                out = np.ascontiguousarray(frame_fn(frame))
+                stats.process_seconds += time.perf_counter() - start
+                if not _put(processed, out, stop_event):
+                    break
+        except Exception as e:
+            errors.append(e)
+            stop_event.set()
+        finally:
+            _put(processed, _END, stop_event)
+
+    threads = [
+        threading.Thread(target=decode_stage, name="video-decode", daemon=True),
+        threading.Thread(target=process_stage, name="video-process", daemon=True),
+    ]
+    wall_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    writer = None
+    try:
+        while True:
+            frame = _get(processed, stop_event)
+            if frame is _END:
+                break
+            start = time.perf_counter()
+            if writer is None:
+                stats.frame_size = (frame.shape[1], frame.shape[0])
+                writer, _ = open_writer(output_path, stats.source_fps, stats.frame_size)
+            writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+            stats.encode_seconds += time.perf_counter() - start
+            stats.frames += 1
+            stats.wall_seconds = time.perf_counter() - wall_start
+            if on_progress is not None:
+                on_progress(stats)
+    except BaseException:
+        # 含 Streamlit 重跑中断等非 Exception 异常：通知解码/处理线程停止；
+        # 正常结束时两个线程都已在队列结束标记后退出，无需置位
+        stop_event.set()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+        capture.release()
+        if writer is not None:
+            writer.release()
+        stats.wall_seconds = time.perf_counter() - wall_start
+    if errors:
+        raise errors[0]
+    return stats